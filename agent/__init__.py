@@ -1,6 +1,7 @@
 from .intent import build_skills_schema, detect_skill_intent, detect_tool_intent, build_tools_schema
 from .nodes import (
     node_classify_intent,
+    node_embed_query,
     node_retrieve_docs,
     node_retrieve_history,
     node_generate_response,
@@ -21,6 +22,7 @@ __all__ = [
     'detect_tool_intent',
     'build_tools_schema',
     'node_classify_intent',
+    'node_embed_query',
     'node_retrieve_docs',
     'node_retrieve_history',
     'node_generate_response',
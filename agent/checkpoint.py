@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from typing import Set
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from config.manager import load_config
+
+
+def thread_id_for(conversation_id: str, mode: str) -> str:
+    """图的检查点线程按对话和模式区分，问答图与 Agent 图的状态互不影响。"""
+    return f"{conversation_id or 'default'}:{mode}"
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """有上限的内存检查点。
+
+    每个线程（对话 + 模式）只保留最近 keep_last 个检查点，旧检查点及其写入和不再被引用的通道数据一并删除；
+    线程数超过 max_threads 时按最近使用淘汰整个线程。长时间运行时内存占用只与上限有关，与请求次数无关。
+    """
+
+    def __init__(self, keep_last: int = 10, max_threads: int = 64):
+        super().__init__()
+        self.keep_last = keep_last
+        self.max_threads = max_threads
+        self._threads: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_tuple(self, config):
+        with self._lock:
+            return super().get_tuple(config)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            self._prune(thread_id, config["configurable"]["checkpoint_ns"])
+            self._touch(thread_id)
+            return result
+
+    def _touch(self, thread_id: str):
+        self._threads[thread_id] = None
+        self._threads.move_to_end(thread_id)
+        while len(self._threads) > self.max_threads:
+            oldest, _ = self._threads.popitem(last=False)
+            super().delete_thread(oldest)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_last:
+            return
+        # 检查点 id 按时间有序
+        for checkpoint_id in sorted(checkpoints)[:-self.keep_last]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        referenced: Set[tuple] = set()
+        for saved, _, _ in checkpoints.values():
+            for channel, version in self.serde.loads_typed(saved)["channel_versions"].items():
+                referenced.add((thread_id, checkpoint_ns, channel, version))
+        for key in [key for key in self.blobs if key[:2] == (thread_id, checkpoint_ns) and key not in referenced]:
+            del self.blobs[key]
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+            super().delete_thread(thread_id)
+
+    def delete_conversation(self, conversation_id: str):
+        for mode in ("qa", "agent"):
+            self.delete_thread(thread_id_for(conversation_id, mode))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": len(self.storage),
+                "checkpoints": sum(len(ns) for thread in self.storage.values() for ns in thread.values()),
+                "writes": len(self.writes),
+                "blobs": len(self.blobs),
+                "keep_last": self.keep_last,
+                "max_threads": self.max_threads,
+            }
+
+
+_config = load_config()
+checkpointer = BoundedMemorySaver(
+    keep_last=_config.get("checkpoint_keep_last", 10),
+    max_threads=_config.get("checkpoint_max_threads", 64)
+)
@@ -1,8 +1,15 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable
+
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
 from core.graph import GraphState
+from agent.checkpoint import checkpointer
+from config.context import get_branch_timeout
+from core.cancel import CancelToken, cancel_scope, current_token
 from agent.nodes import (
     node_classify_intent,
+    node_embed_query,
     node_retrieve_docs,
     node_retrieve_history,
     node_generate_response,
@@ -11,6 +18,51 @@ from agent.nodes import (
 )
 
 
+_branch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="graph-branch")
+
+
+def with_timeout(name: str, node: Callable[[GraphState], dict], fallback: Callable[[GraphState], dict]):
+    """给并行分支加超时：超过 branch_timeouts 中的时限后返回 fallback 的结果。
+
+    分支在自己的子取消令牌下执行，超时后取消该令牌，进行中的模型请求被中断，
+    分支在下一个取消检查点退出，不会长期占用共享的分支线程。"""
+    def run(state: GraphState) -> dict:
+        timeout = get_branch_timeout(name)
+        if timeout is None:
+            return node(state)
+        token = CancelToken(parent=current_token())
+
+        def run_branch() -> dict:
+            with cancel_scope(token):
+                return node(state)
+
+        future = _branch_executor.submit(contextvars.copy_context().run, run_branch)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            token.cancel()
+            print(f"{name} 超过 {timeout} 秒未完成，按空结果继续")
+            return fallback(state)
+    return run
+
+
+def _docs_fallback(state: GraphState) -> dict:
+    return {"has_document": False, "context_segments": [], "disclosure_level": state.get("disclosure_level", "relevant")}
+
+
+def _history_fallback(state: GraphState) -> dict:
+    return {"history_context": ""}
+
+
+def add_retrieval_branches(graph: StateGraph):
+    """问题向量化后文档检索和历史检索并行执行，两者都完成（或超时）后再生成回答。"""
+    graph.add_node("retrieve_docs", with_timeout("retrieve_docs", node_retrieve_docs, _docs_fallback))
+    graph.add_node("retrieve_history", with_timeout("retrieve_history", node_retrieve_history, _history_fallback))
+    graph.add_edge("embed_query", "retrieve_docs")
+    graph.add_edge("embed_query", "retrieve_history")
+    graph.add_edge(["retrieve_docs", "retrieve_history"], "generate_response")
+
+
 def route_by_mode(state: GraphState) -> str:
     mode = state.get("mode", "qa")
     
@@ -80,9 +132,9 @@ def build_qa_graph():
         graph = StateGraph(GraphState)
 
         graph.add_node("classify_intent", node_classify_intent)
-        graph.add_node("retrieve_docs", node_retrieve_docs)
-        graph.add_node("retrieve_history", node_retrieve_history)
+        graph.add_node("embed_query", node_embed_query)
         graph.add_node("generate_response", node_generate_response)
+        add_retrieval_branches(graph)
 
         graph.set_entry_point("classify_intent")
 
@@ -91,15 +143,13 @@ def build_qa_graph():
             should_use_tool_qa,
             {
                 "generate_response": "generate_response",
-                "retrieve_docs": "retrieve_docs"
+                "retrieve_docs": "embed_query"
             }
         )
 
-        graph.add_edge("retrieve_docs", "retrieve_history")
-        graph.add_edge("retrieve_history", "generate_response")
         graph.add_edge("generate_response", END)
 
-        _qa_graph = graph.compile(checkpointer=MemorySaver())
+        _qa_graph = graph.compile(checkpointer=checkpointer)
     return _qa_graph
 
 
@@ -126,7 +176,7 @@ def build_agent_graph():
         graph.add_edge("activate_skill", "generate_response")
         graph.add_edge("generate_response", END)
 
-        _agent_graph = graph.compile(checkpointer=MemorySaver())
+        _agent_graph = graph.compile(checkpointer=checkpointer)
     return _agent_graph
 
 
@@ -137,9 +187,9 @@ def build_graph():
     graph.add_node("classify_intent", node_classify_intent)
     graph.add_node("match_skill", node_match_skill)
     graph.add_node("activate_skill", node_activate_skill)
-    graph.add_node("retrieve_docs", node_retrieve_docs)
-    graph.add_node("retrieve_history", node_retrieve_history)
+    graph.add_node("embed_query", node_embed_query)
     graph.add_node("generate_response", node_generate_response)
+    add_retrieval_branches(graph)
 
     graph.set_entry_point("route_by_mode")
 
@@ -172,11 +222,9 @@ def build_graph():
     )
 
     graph.add_edge("activate_skill", "generate_response")
-    graph.add_edge("retrieve_docs", "retrieve_history")
-    graph.add_edge("retrieve_history", "generate_response")
     graph.add_edge("generate_response", END)
     
-    return graph.compile(checkpointer=MemorySaver())
+    return graph.compile(checkpointer=checkpointer)
 
 
 graph_executor = None
@@ -1,11 +1,110 @@
+import re
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_ollama import ChatOllama
+from langchain_openai import ChatOpenAI
+from langchain_anthropic import ChatAnthropic
 from tools.news import get_all_tools
 from tools.document import document_tools
 from resources.skills import skill_registry
 
 
+# 意图判断只输出一个很小的 JSON，限制输出 token 数避免模型多写
+INTENT_MAX_TOKENS = 256
+NONE_CHOICE = "none"
+
+# 各 provider 原生的结构化输出方式：Ollama 的 format JSON Schema、OpenAI 的强制函数调用、Anthropic 的 tool use
+_STRUCTURED_METHODS = (
+    (ChatOllama, "json_schema"),
+    (ChatOpenAI, "function_calling"),
+    (ChatAnthropic, "function_calling"),
+)
+
+
+def intent_llm_kwargs(provider: str) -> Dict[str, int]:
+    """意图判断客户端的输出长度上限参数。"""
+    if provider == "ollama":
+        return {"num_predict": INTENT_MAX_TOKENS}
+    return {"max_tokens": INTENT_MAX_TOKENS}
+
+
+def _structured_llm(llm, schema: dict):
+    for cls, method in _STRUCTURED_METHODS:
+        if isinstance(llm, cls):
+            return llm.with_structured_output(schema, method=method)
+    return None
+
+
+_ARG_DOC_RE = re.compile(r"^[ \t]+(\w+):[ \t]*(.+)$", re.MULTILINE)
+
+
+def _first_line(text: str) -> str:
+    return (text or "").strip().splitlines()[0] if (text or "").strip() else ""
+
+
+def build_tool_intent_schema(tools: List) -> dict:
+    """工具意图的紧凑 JSON Schema：tool_name 为工具名或 none，各工具参数展开为可选字段。"""
+    properties: Dict[str, Any] = {}
+    for tool in tools:
+        if not tool.args_schema:
+            continue
+        arg_docs = dict(_ARG_DOC_RE.findall(tool.description or ""))
+        for name, info in tool.args_schema.model_json_schema().get("properties", {}).items():
+            prop = properties.setdefault(name, {"type": info.get("type", "string")})
+            if "enum" in info:
+                prop.setdefault("enum", info["enum"])
+            if name in arg_docs:
+                prop.setdefault("description", arg_docs[name])
+    return {
+        "title": "tool_intent",
+        "description": "判断是否需要调用工具",
+        "type": "object",
+        "properties": {
+            "tool_name": {
+                "type": "string",
+                "enum": [NONE_CHOICE] + [tool.name for tool in tools],
+                "description": "；".join(f"{tool.name}: {_first_line(tool.description)}" for tool in tools) + f"；不需要工具时为 {NONE_CHOICE}",
+            },
+            **properties,
+        },
+        "required": ["tool_name"],
+    }
+
+
+def build_skill_intent_schema(skills: List) -> dict:
+    return {
+        "title": "skill_intent",
+        "description": "判断是否需要使用 Skill",
+        "type": "object",
+        "properties": {
+            "action": {
+                "type": "string",
+                "enum": ["use_skill", "list_skills", NONE_CHOICE],
+                "description": "use_skill: 要求执行某个 Skill；list_skills: 询问有哪些 Skill；none: 正常聊天",
+            },
+            "skill_name": {
+                "type": "string",
+                "enum": [skill.name for skill in skills],
+                "description": "；".join(f"{skill.name}: {_first_line(skill.description)}" for skill in skills),
+            },
+        },
+        "required": ["action"],
+    }
+
+
+def _invoke_structured(llm, schema: dict, system_prompt: str, query: str):
+    """用原生结构化输出调用模型；模型不支持时返回 NotImplemented，由调用方改用提示词方式。"""
+    try:
+        structured = _structured_llm(llm, schema)
+    except NotImplementedError:
+        structured = None
+    if structured is None:
+        return NotImplemented
+    result = structured.invoke([SystemMessage(content=system_prompt), HumanMessage(content=query)])
+    return result if isinstance(result, dict) else None
+
+
 def build_skills_schema() -> str:
     skills = skill_registry.get_all_skills()
     if not skills:
@@ -17,7 +116,7 @@ def build_skills_schema() -> str:
     return schema
 
 
-def detect_skill_intent(llm, query: str, skills_schema: str) -> Optional[Dict[str, Any]]:
+def _detect_skill_intent_with_prompt(llm, query: str, skills_schema: str) -> Optional[Dict[str, Any]]:
     system_prompt = f"""你是一个智能助手，负责判断用户是否需要使用某个 Skill 来完成任务。
 
 {skills_schema}
@@ -72,7 +171,7 @@ def detect_skill_intent(llm, query: str, skills_schema: str) -> Optional[Dict[st
         return None
 
 
-def detect_tool_intent(llm, query: str, tools_schema: str) -> Optional[Dict[str, Any]]:
+def _detect_tool_intent_with_prompt(llm, query: str, tools_schema: str) -> Optional[Dict[str, Any]]:
     system_prompt = f"""你是一个智能助手，负责判断用户是否需要使用工具来完成任务。
 
 {tools_schema}
@@ -126,6 +225,49 @@ def detect_tool_intent(llm, query: str, tools_schema: str) -> Optional[Dict[str,
         return None
 
 
+def detect_skill_intent(llm, query: str, skills_schema: str) -> Optional[Dict[str, Any]]:
+    skills = skill_registry.get_all_skills()
+    try:
+        result = _invoke_structured(
+            llm, build_skill_intent_schema(skills), "判断用户是否要求执行或列出 Skill，按 schema 返回。", query
+        )
+    except Exception as e:
+        print(f"检测 Skill 意图失败: {str(e)}")
+        return None
+    if result is NotImplemented:
+        return _detect_skill_intent_with_prompt(llm, query, skills_schema)
+    if not result:
+        return None
+
+    action = result.get("action")
+    if action == "use_skill" and result.get("skill_name"):
+        return {"need_skill": True, "skill_name": result["skill_name"]}
+    if action == "list_skills":
+        return {"list_skills": True}
+    return {"need_skill": False}
+
+
+def detect_tool_intent(llm, query: str, tools_schema: str) -> Optional[Dict[str, Any]]:
+    tools = get_all_tools() + document_tools
+    try:
+        result = _invoke_structured(
+            llm, build_tool_intent_schema(tools), "判断用户输入是否需要调用工具，按 schema 返回。", query
+        )
+    except Exception as e:
+        print(f"检测工具意图失败: {str(e)}")
+        return None
+    if result is NotImplemented:
+        return _detect_tool_intent_with_prompt(llm, query, tools_schema)
+    if not result:
+        return None
+
+    tool_name = result.get("tool_name")
+    if not tool_name or tool_name == NONE_CHOICE:
+        return {"need_tool": False}
+    parameters = {key: value for key, value in result.items() if key != "tool_name" and value is not None}
+    return {"need_tool": True, "tool_name": tool_name, "parameters": parameters}
+
+
 def build_tools_schema() -> str:
     tools = get_all_tools() + document_tools
     schema = "可用工具列表：\n\n"
@@ -1,97 +1,204 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_ollama import ChatOllama
+from langgraph.config import get_stream_writer
 from core.graph import GraphState, decide_disclosure_level, DISCLOSURE_LEVELS
 from tools.news import news_toolkit
 from tools.document import get_document_summary, get_document_outline
 from tools import get_builtin_tools
 from core import state as app_state
-from llm.factory import create_llm
-from storage.retriever import create_retriever
+from core.cancel import is_cancelled
+from llm.factory import get_llm
+from llm.helpers import get_active_model_name
+from llm.embeddings import has_vector_search, query_embeddings
+from config.context import get_search_k, get_context_budget, get_retrieval_policy
+from document.artifacts import get_outline
+from document.headings import get_headings, match_sections
+from document.summary_tree import get_summary_tree
+from agent.packer import (
+    chunk_segments,
+    summary_segments,
+    tree_segments,
+    outline_segments,
+    heading_segments,
+    text_segment,
+    pack_context
+)
+from document.indexer import ensure_document_index
+from storage.retriever import create_retriever, get_parent_index, retrieve_adaptive
+from storage.ranking import RetrievalPolicy
 from storage.history_rag import history_rag
-from agent.intent import build_tools_schema, detect_tool_intent
+from agent.intent import build_tools_schema, detect_tool_intent, intent_llm_kwargs
+from agent.router import intent_router
+from agent.speculation import is_speculative, pending_intents
 from utils.messages import prepare_messages
 from resources.skills import skill_registry
 
 
-def node_classify_intent(state: GraphState) -> dict:
-    if state.get("should_stop"):
-        return {}
-
-    query = state.get("query", "")
-    if not query:
-        return {"mcp_result": None}
-
-    disclosure_level = decide_disclosure_level(query)
-    level_config = DISCLOSURE_LEVELS.get(disclosure_level, DISCLOSURE_LEVELS["relevant"])
-
+def _detect_tool_intent_with_llm(state: GraphState, query: str):
     model_name = state.get("model_name", "qwen3.5:9b")
     provider = app_state.llm_provider if hasattr(app_state, 'llm_provider') else 'ollama'
 
     if provider == "ollama":
-        llm = ChatOllama(
+        llm = get_llm(
+            provider="ollama",
             model=model_name,
             base_url=app_state.ollama_base_url if hasattr(app_state, 'ollama_base_url') else "http://localhost:11434",
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs(provider)
         )
     elif provider == "openai":
-        llm = create_llm(
+        llm = get_llm(
             provider="openai",
             model=app_state.openai_current_model if hasattr(app_state, 'openai_current_model') and app_state.openai_current_model else model_name,
             base_url=app_state.get_openai_base_url() if hasattr(app_state, 'get_openai_base_url') else None,
             api_key=app_state.get_openai_api_key() if hasattr(app_state, 'get_openai_api_key') else None,
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs(provider)
         )
     elif provider == "anthropic":
-        llm = create_llm(
+        llm = get_llm(
             provider="anthropic",
             model=app_state.anthropic_current_model if hasattr(app_state, 'anthropic_current_model') and app_state.anthropic_current_model else model_name,
             base_url=app_state.get_anthropic_base_url() if hasattr(app_state, 'get_anthropic_base_url') else None,
             api_key=app_state.get_anthropic_api_key() if hasattr(app_state, 'get_anthropic_api_key') else None,
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs(provider)
         )
     else:
-        llm = ChatOllama(
+        llm = get_llm(
+            provider="ollama",
             model=model_name,
             base_url="http://localhost:11434",
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs("ollama")
         )
     
-    tools_schema = build_tools_schema()
-    intent = detect_tool_intent(llm, query, tools_schema)
+    return detect_tool_intent(llm, query, build_tools_schema())
+
+
+def _token_writer():
+    """返回把生成的文本片段推送到图的 custom 流的函数；不在图中运行时（如直接调用节点）不推送。"""
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return lambda text: None
+
+    def write(text: str):
+        if text:
+            writer({"token": text})
+
+    return write
+
+
+TOOL_DISPLAY_NAMES = {
+    "get_headlines": "头条新闻",
+    "get_news_by_type": "分类新闻",
+    "search_news": "新闻搜索",
+    "get_document_summary": "文档摘要",
+    "get_document_outline": "文档大纲"
+}
+
+
+def tool_progress(tool_name: str) -> str:
+    """调用工具前推送给用户的提示。"""
+    return f"📰 正在从{TOOL_DISPLAY_NAMES.get(tool_name, tool_name)}获取信息...\n\n"
+
+
+def _needs_tool(intent: Optional[dict]) -> bool:
+    return bool(intent and intent.get("need_tool"))
+
+
+def _run_intent_tool(intent: Optional[dict], disclosure_level: str) -> Optional[dict]:
+    if not _needs_tool(intent):
+        return None
+    level_config = DISCLOSURE_LEVELS.get(disclosure_level, DISCLOSURE_LEVELS["relevant"])
+
+    tool_name = intent.get("tool_name")
+    parameters = intent.get("parameters", {})
+    
+    result = None
+    if tool_name == "get_headlines":
+        result = news_toolkit.get_headlines(parameters.get("page_size", 10))
+    elif tool_name == "get_news_by_type":
+        result = news_toolkit.get_news_by_type(
+            parameters.get("news_type", "头条"),
+            parameters.get("page_size", 10)
+        )
+    elif tool_name == "search_news":
+        result = news_toolkit.search_news(
+            parameters.get("keyword", ""),
+            parameters.get("page_size", 10)
+        )
+    elif tool_name == "get_document_summary":
+        n_chunks = level_config.get("n_chunks", 30)
+        result = {"success": True, "tool_name": tool_name, "formatted_text": get_document_summary.invoke({"n_chunks": n_chunks})}
+    elif tool_name == "get_document_outline":
+        result = {"success": True, "tool_name": tool_name, "formatted_text": get_document_outline.invoke({})}
     
-    if intent and intent.get("need_tool"):
-        tool_name = intent.get("tool_name")
-        parameters = intent.get("parameters", {})
-        
-        result = None
-        if tool_name == "get_headlines":
-            result = news_toolkit.get_headlines(parameters.get("page_size", 10))
-        elif tool_name == "get_news_by_type":
-            result = news_toolkit.get_news_by_type(
-                parameters.get("news_type", "头条"),
-                parameters.get("page_size", 10)
-            )
-        elif tool_name == "search_news":
-            result = news_toolkit.search_news(
-                parameters.get("keyword", ""),
-                parameters.get("page_size", 10)
-            )
-        elif tool_name == "get_document_summary":
-            n_chunks = level_config.get("n_chunks", 30)
-            result = {"success": True, "tool_name": tool_name, "formatted_text": get_document_summary.invoke({"n_chunks": n_chunks})}
-        elif tool_name == "get_document_outline":
-            result = {"success": True, "tool_name": tool_name, "formatted_text": get_document_outline.invoke({})}
-        
-        if result and result.get("success"):
-            result["disclosure_level"] = disclosure_level
-            return {"mcp_result": result, "disclosure_level": disclosure_level}
+    if result and result.get("success"):
+        result["disclosure_level"] = disclosure_level
+        return result
+    return None
+
+
+def _pending_intent(pending) -> Optional[dict]:
+    """后台意图判断的结果；判断本身失败时按不需要工具处理，不影响已生成的回答。"""
+    try:
+        return pending.result()
+    except Exception as e:
+        print(f"后台意图判断失败: {str(e)}")
+        return None
+
+
+def node_classify_intent(state: GraphState) -> dict:
+    if is_cancelled():
+        return {}
+
+    query = state.get("query", "")
+    if not query:
+        return {"mcp_result": None}
+
+    disclosure_level = decide_disclosure_level(query)
+
+    conversation = app_state.get_current_conversation()
+    intent = intent_router.route(query, bool(conversation and conversation.document_chunks))
+    if intent is None:
+        provider = app_state.llm_provider if hasattr(app_state, 'llm_provider') else 'ollama'
+        if is_speculative(provider):
+            def detect():
+                result = _detect_tool_intent_with_llm(state, query)
+                intent_router.record_llm(result)
+                return result
+
+            pending_intents.submit(state.get("turn_id", ""), detect)
+            return {"mcp_result": None, "disclosure_level": disclosure_level, "intent_pending": True}
+
+        intent = _detect_tool_intent_with_llm(state, query)
+        intent_router.record_llm(intent)
     
-    return {"mcp_result": None, "disclosure_level": disclosure_level}
+    result = _run_intent_tool(intent, disclosure_level)
+    return {"mcp_result": result, "disclosure_level": disclosure_level}
+
+
+def node_embed_query(state: GraphState) -> dict:
+    """每轮只向量化一次问题，结果放入状态供文档检索和历史检索共用。"""
+    if is_cancelled():
+        return {}
+
+    query = state.get("query", "")
+    provider = app_state.llm_provider if hasattr(app_state, 'llm_provider') else 'ollama'
+    if not query or not has_vector_search(provider, app_state.embedding_backend):
+        return {"query_embedding": None}
+
+    try:
+        return {"query_embedding": query_embeddings.get(query, app_state.ollama_base_url, app_state.embedding_backend)}
+    except Exception as e:
+        print(f"问题向量化失败: {str(e)}")
+        return {"query_embedding": None}
 
 
 def node_retrieve_docs(state: GraphState) -> dict:
-    if state.get("should_stop"):
+    if is_cancelled():
         return {}
     
     query = state.get("query", "")
@@ -107,35 +214,54 @@ def node_retrieve_docs(state: GraphState) -> dict:
         return {"has_document": False, "document_context": "", "disclosure_level": disclosure_level}
     
     provider = app_state.llm_provider if hasattr(app_state, 'llm_provider') else 'ollama'
+    model_name = get_active_model_name(state.get("model_name"))
+    ensure_document_index(
+        conversation,
+        model_name,
+        provider,
+        base_url=app_state.ollama_base_url,
+        backend=app_state.embedding_backend
+    )
     retriever = create_retriever(conversation, provider)
     if not retriever:
         return {"has_document": False, "document_context": "", "disclosure_level": disclosure_level}
     
-    k = level_config.get("k", 8)
-    relevant_docs = retriever.retrieve(query, k=k)
-    main_context = "\n\n".join([doc.page_content for doc in relevant_docs]) if relevant_docs else "无相关内容"
+    k = get_search_k(model_name) if disclosure_level == "relevant" else None
+    policy = RetrievalPolicy.from_dict(get_retrieval_policy(disclosure_level, k))
+    headings = get_headings(conversation)
+    relevant_docs, retrieval_stats = retrieve_adaptive(
+        retriever, query, policy, match_sections(headings, query), state.get("query_embedding")
+    )
+    print(f"自适应检索: 候选 {retrieval_stats['candidates']}，过阈值 {retrieval_stats['above_threshold']}，"
+          f"选中 {retrieval_stats['selected']}/{policy.k}，最高分 {retrieval_stats['top_score']}")
+    sections = get_parent_index(conversation).expand(doc.metadata.get("chunk_index", -1) for doc in relevant_docs)
     
-    outline = get_document_outline.invoke({})
-    summary = get_document_summary.invoke({"n_chunks": 10})
+    chunks = conversation.document_chunks
+    n_chunks = level_config.get("n_chunks", 10)
+    segments = chunk_segments(sections)
     
-    full_context = f"""【相关片段】
-{main_context}
-
-【文档大纲】
-{outline}
-
-【文档摘要】
-{summary}
-"""
+    tree = get_summary_tree(conversation)
+    if tree and disclosure_level in ("summary", "full"):
+        # 摘要树覆盖全文：摘要类问题可用整份预算，详细类问题留一半给检索片段
+        share = 1.0 if disclosure_level == "summary" else 0.5
+        nodes = tree.level_within(int(get_context_budget(model_name) * share))
+        segments += tree_segments(nodes) + summary_segments(chunks, 0, conversation.document_summary)
+    else:
+        segments += summary_segments(chunks, n_chunks, conversation.document_summary)
+    segments += heading_segments(headings) if headings else outline_segments(get_outline(conversation))
     
     return {
         "has_document": True,
-        "document_context": full_context,
+        "context_segments": segments,
         "disclosure_level": disclosure_level
     }
 
 
 def node_retrieve_history(state: GraphState) -> dict:
+    # 已停止的生成不再做历史向量化和检索，不必等到分支超时
+    if is_cancelled():
+        return {}
+
     provider = app_state.llm_provider if hasattr(app_state, 'llm_provider') else 'ollama'
     query = state.get("query", "")
     
@@ -154,7 +280,7 @@ def node_retrieve_history(state: GraphState) -> dict:
     llm = None
     if provider != "ollama":
         if provider == "openai":
-            llm = create_llm(
+            llm = get_llm(
                 provider="openai",
                 model=app_state.openai_current_model if hasattr(app_state, 'openai_current_model') and app_state.openai_current_model else "gpt-4",
                 base_url=app_state.get_openai_base_url() if hasattr(app_state, 'get_openai_base_url') else None,
@@ -162,7 +288,7 @@ def node_retrieve_history(state: GraphState) -> dict:
                 temperature=0.3
             )
         elif provider == "anthropic":
-            llm = create_llm(
+            llm = get_llm(
                 provider="anthropic",
                 model=app_state.anthropic_current_model if hasattr(app_state, 'anthropic_current_model') and app_state.anthropic_current_model else "claude-3-sonnet-20240229",
                 base_url=app_state.get_anthropic_base_url() if hasattr(app_state, 'get_anthropic_base_url') else None,
@@ -170,13 +296,15 @@ def node_retrieve_history(state: GraphState) -> dict:
                 temperature=0.3
             )
     
-    history_context = history_rag.get_context(query, provider=provider, llm=llm, k=3)
+    history_context = history_rag.get_context(
+        query, provider=provider, llm=llm, k=3, embedding=state.get("query_embedding")
+    )
     
     return {"history_context": history_context or ""}
 
 
 def node_generate_response(state: GraphState) -> dict:
-    if state.get("should_stop"):
+    if is_cancelled():
         return {"output_content": "操作已中断"}
     
     mcp_result = state.get("mcp_result")
@@ -196,14 +324,9 @@ def node_generate_response(state: GraphState) -> dict:
         formatted_text = mcp_result.get("formatted_text", "")
         
         if tool_name in news_tools:
-            tool_display_names = {
-                "get_headlines": "头条新闻",
-                "get_news_by_type": "分类新闻",
-                "search_news": "新闻搜索"
-            }
-            tool_display_name = tool_display_names.get(tool_name, tool_name)
-            full_text = f"📰 正在从{tool_display_name}获取信息...\n\n{formatted_text}"
-            return {"output_content": full_text}
+            # 工具提示已在调用工具前推送，这里只推送工具结果；记录的完整回答仍带提示
+            _token_writer()(formatted_text)
+            return {"output_content": f"{tool_progress(tool_name)}{formatted_text}"}
         
         if tool_name in document_tools_list:
             document_context = formatted_text
@@ -244,7 +367,8 @@ def node_generate_response(state: GraphState) -> dict:
 请开始回答："""
         
         if provider == "ollama":
-            llm = ChatOllama(
+            llm = get_llm(
+                provider="ollama",
                 model=model_name,
                 base_url=app_state.ollama_base_url if hasattr(app_state, 'ollama_base_url') else "http://localhost:11434",
                 temperature=0.7,
@@ -252,7 +376,7 @@ def node_generate_response(state: GraphState) -> dict:
                 num_predict=8000
             ).bind_tools(builtin_tools)
         elif provider == "openai":
-            llm = create_llm(
+            llm = get_llm(
                 provider="openai",
                 model=app_state.openai_current_model if hasattr(app_state, 'openai_current_model') and app_state.openai_current_model else model_name,
                 base_url=app_state.get_openai_base_url() if hasattr(app_state, 'get_openai_base_url') else None,
@@ -260,7 +384,7 @@ def node_generate_response(state: GraphState) -> dict:
                 temperature=0.7
             ).bind_tools(builtin_tools)
         elif provider == "anthropic":
-            llm = create_llm(
+            llm = get_llm(
                 provider="anthropic",
                 model=app_state.anthropic_current_model if hasattr(app_state, 'anthropic_current_model') and app_state.anthropic_current_model else model_name,
                 base_url=app_state.get_anthropic_base_url() if hasattr(app_state, 'get_anthropic_base_url') else None,
@@ -268,7 +392,8 @@ def node_generate_response(state: GraphState) -> dict:
                 temperature=0.7
             ).bind_tools(builtin_tools)
         else:
-            llm = ChatOllama(
+            llm = get_llm(
+                provider="ollama",
                 model=model_name,
                 base_url="http://localhost:11434",
                 temperature=0.7,
@@ -278,12 +403,14 @@ def node_generate_response(state: GraphState) -> dict:
         
         messages = prepare_messages(conversation, query, system_prompt, images if images else None)
         
+        write = _token_writer()
         output_content = ""
         tool_result_buffer = []
         
         for chunk in llm.stream(messages):
-            if app_state.should_stop:
+            if is_cancelled():
                 output_content += "\n\n操作已中断"
+                write("\n\n操作已中断")
                 break
             
             if hasattr(chunk, 'content') and isinstance(chunk.content, list):
@@ -292,6 +419,7 @@ def node_generate_response(state: GraphState) -> dict:
                         if part.get('type') == 'text':
                             text = part.get('text', '')
                             output_content += text
+                            write(text)
                         elif part.get('type') == 'tool_use':
                             tool_name = part.get('name', '')
                             tool_input = part.get('input', {})
@@ -303,11 +431,14 @@ def node_generate_response(state: GraphState) -> dict:
                                 'result': tool_result
                             })
                             output_content += f"\n[执行工具: {tool_name}]\n"
+                            write(f"\n[执行工具: {tool_name}]\n")
                     elif isinstance(part, str):
                         output_content += part
+                        write(part)
             else:
                 chunk_text = str(getattr(chunk, 'content', chunk))
                 output_content += chunk_text
+                write(chunk_text)
             
             if tool_result_buffer:
                 continue
@@ -319,25 +450,31 @@ def node_generate_response(state: GraphState) -> dict:
                     content=f"工具 {tr['tool_name']} 返回结果: {tr['result']}"
                 ))
             
-            output_content = ""
+            # 工具执行前的内容已推送给客户端，工具结果之后的回答接在后面
+            output_content += "\n"
+            write("\n")
             for chunk in llm.stream(messages):
-                if app_state.should_stop:
+                if is_cancelled():
                     output_content += "\n\n操作已中断"
+                    write("\n\n操作已中断")
                     break
                 
                 if hasattr(chunk, 'content') and isinstance(chunk.content, list):
-                    for part in chunk.content:
-                        if isinstance(part, dict) and part.get('type') == 'text':
-                            output_content += part.get('text', '')
-                        elif isinstance(part, str):
-                            output_content += part
+                    text = "".join(
+                        part.get('text', '') if isinstance(part, dict) and part.get('type') == 'text'
+                        else part if isinstance(part, str) else ''
+                        for part in chunk.content
+                    )
                 else:
-                    output_content += str(getattr(chunk, 'content', chunk))
+                    text = str(getattr(chunk, 'content', chunk))
+                output_content += text
+                write(text)
         
         return {"output_content": output_content}
     else:
         if provider == "ollama":
-            llm = ChatOllama(
+            llm = get_llm(
+                provider="ollama",
                 model=model_name,
                 base_url=app_state.ollama_base_url if hasattr(app_state, 'ollama_base_url') else "http://localhost:11434",
                 temperature=0.7,
@@ -345,7 +482,7 @@ def node_generate_response(state: GraphState) -> dict:
                 num_predict=8000
             )
         elif provider == "openai":
-            llm = create_llm(
+            llm = get_llm(
                 provider="openai",
                 model=app_state.openai_current_model if hasattr(app_state, 'openai_current_model') and app_state.openai_current_model else model_name,
                 base_url=app_state.get_openai_base_url() if hasattr(app_state, 'get_openai_base_url') else None,
@@ -353,7 +490,7 @@ def node_generate_response(state: GraphState) -> dict:
                 temperature=0.7
             )
         elif provider == "anthropic":
-            llm = create_llm(
+            llm = get_llm(
                 provider="anthropic",
                 model=app_state.anthropic_current_model if hasattr(app_state, 'anthropic_current_model') and app_state.anthropic_current_model else model_name,
                 base_url=app_state.get_anthropic_base_url() if hasattr(app_state, 'get_anthropic_base_url') else None,
@@ -361,7 +498,8 @@ def node_generate_response(state: GraphState) -> dict:
                 temperature=0.7
             )
         else:
-            llm = ChatOllama(
+            llm = get_llm(
+                provider="ollama",
                 model=model_name,
                 base_url="http://localhost:11434",
                 temperature=0.7,
@@ -369,12 +507,17 @@ def node_generate_response(state: GraphState) -> dict:
                 num_predict=8000
             )
         
-        context_parts = []
+        segments = list(state.get("context_segments") or [])
         if has_document and document_context:
-            context_parts.append(f"【文档内容】\n{document_context}")
-        if history_context:
-            context_parts.append(f"【历史对话上下文】\n{history_context}")
-        context_str = "\n\n".join(context_parts) if context_parts else ""
+            is_outline = mcp_result and mcp_result.get("tool_name") == "get_document_outline"
+            segments += text_segment("outline" if is_outline else "summary", document_context)
+        segments += text_segment("history", history_context)
+        segments += text_segment("skill", skill_context)
+        
+        budget = get_context_budget(get_active_model_name(model_name))
+        context_str, context_stats = pack_context(segments, budget, state.get("disclosure_level", "relevant"))
+        print(f"上下文打包: {context_stats['used_tokens']}/{budget} tokens，"
+              f"选中 {context_stats['selected']}/{context_stats['candidates']} 段，去重 {context_stats['duplicates']} 段")
 
         system_prompt = f"""你是一个专业、友好的AI助手。
 请根据以下信息回答用户的问题。
@@ -388,11 +531,24 @@ def node_generate_response(state: GraphState) -> dict:
         
         messages = prepare_messages(conversation, query, system_prompt, images if images else None)
         
+        # 推测生成：工具意图仍在后台判断，判断出需要工具时关闭当前回答流，改用工具结果重新回答；
+        # 判断结果出来前生成的内容先缓存，确认不需要工具后再推送给客户端
+        pending = pending_intents.take(state.get("turn_id", "")) if state.get("intent_pending") else None
+        write = _token_writer()
+        held = []
+        resolved = False
         output_content = ""
-        for chunk in llm.stream(messages):
-            if app_state.should_stop:
+        stream = llm.stream(messages)
+        for chunk in stream:
+            if is_cancelled():
                 output_content += "\n\n操作已中断"
+                write("\n\n操作已中断")
                 break
+            # 每段只读一次 done()，是否中断与是否推送依据同一个结果，避免两次读取之间意图刚好完成
+            if pending and not resolved and pending.done():
+                resolved = True
+                if _needs_tool(_pending_intent(pending)):
+                    break
             
             if hasattr(chunk, 'content') and isinstance(chunk.content, list):
                 text_parts = []
@@ -406,12 +562,29 @@ def node_generate_response(state: GraphState) -> dict:
                 chunk_text = str(chunk.content)
             
             output_content += chunk_text
+            if pending and not resolved:
+                held.append(chunk_text)
+            else:
+                write("".join(held) + chunk_text)
+                held = []
+        stream.close()
         
-        return {"output_content": output_content}
+        if pending and not is_cancelled():
+            intent = _pending_intent(pending)
+            pending_intents.record(kept=not _needs_tool(intent))
+            if _needs_tool(intent):
+                print(f"推测生成作废：需要调用工具 {intent.get('tool_name')}")
+                # 与意图节点直接判断出工具时一样，先提示正在调用的工具，再执行工具并重新回答
+                write(tool_progress(intent.get("tool_name")))
+                tool_result = _run_intent_tool(intent, state.get("disclosure_level", "relevant"))
+                return node_generate_response({**state, "mcp_result": tool_result, "intent_pending": False})
+        write("".join(held))
+        
+        return {"output_content": output_content, "context_stats": context_stats}
 
 
 def node_match_skill(state: GraphState) -> dict:
-    if state.get("should_stop"):
+    if is_cancelled():
         return {}
 
     query = state.get("query", "")
@@ -427,32 +600,38 @@ def node_match_skill(state: GraphState) -> dict:
     model_name = state.get("model_name", "qwen3.5:9b")
 
     if provider == "ollama":
-        llm = ChatOllama(
+        llm = get_llm(
+            provider="ollama",
             model=model_name,
             base_url=app_state.ollama_base_url if hasattr(app_state, 'ollama_base_url') else "http://localhost:11434",
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs(provider)
         )
     elif provider == "openai":
-        llm = create_llm(
+        llm = get_llm(
             provider="openai",
             model=app_state.openai_current_model if hasattr(app_state, 'openai_current_model') and app_state.openai_current_model else model_name,
             base_url=app_state.get_openai_base_url() if hasattr(app_state, 'get_openai_base_url') else None,
             api_key=app_state.get_openai_api_key() if hasattr(app_state, 'get_openai_api_key') else None,
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs(provider)
         )
     elif provider == "anthropic":
-        llm = create_llm(
+        llm = get_llm(
             provider="anthropic",
             model=app_state.anthropic_current_model if hasattr(app_state, 'anthropic_current_model') and app_state.anthropic_current_model else model_name,
             base_url=app_state.get_anthropic_base_url() if hasattr(app_state, 'get_anthropic_base_url') else None,
             api_key=app_state.get_anthropic_api_key() if hasattr(app_state, 'get_anthropic_api_key') else None,
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs(provider)
         )
     else:
-        llm = ChatOllama(
+        llm = get_llm(
+            provider="ollama",
             model=model_name,
             base_url="http://localhost:11434",
-            temperature=0.3
+            temperature=0.3,
+            **intent_llm_kwargs("ollama")
         )
 
     skills_schema = build_skills_schema()
@@ -482,7 +661,7 @@ def node_match_skill(state: GraphState) -> dict:
 
 
 def node_activate_skill(state: GraphState) -> dict:
-    if state.get("should_stop"):
+    if is_cancelled():
         return {}
     
     target_skill = state.get("target_skill")
@@ -0,0 +1,167 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from llm.tokens import estimate_tokens
+from storage.chunk_store import ChunkStore
+
+
+SEGMENT_TITLES = {
+    "chunk": "相关片段",
+    "summary": "文档摘要",
+    "outline": "文档大纲",
+    "history": "历史对话上下文",
+    "skill": "Skill 指导",
+}
+
+SEGMENT_SEPARATORS = {
+    "chunk": "\n\n",
+    "summary": "\n\n",
+    "outline": "\n",
+    "history": "\n\n",
+    "skill": "\n\n",
+}
+
+# 各披露级别下不同来源的基础权重；同一来源内按排名逐项递减 RANK_DECAY
+LEVEL_WEIGHTS = {
+    "relevant": {"chunk": 1.0, "skill": 0.9, "history": 0.7, "summary": 0.4, "outline": 0.3},
+    "summary": {"summary": 1.0, "skill": 0.9, "outline": 0.8, "chunk": 0.6, "history": 0.5},
+    "full": {"chunk": 1.0, "skill": 0.9, "summary": 0.8, "outline": 0.5, "history": 0.4},
+}
+
+RANK_DECAY = 0.01
+
+
+@dataclass
+class Segment:
+    """待放入提示词的一段上下文。
+
+    start/end 是该片段覆盖的文档块范围 [start, end)，不来自文档的片段为 -1。
+    """
+    kind: str
+    text: str
+    tokens: int
+    rank: int = 0
+    start: int = -1
+    end: int = -1
+
+    @property
+    def chunk_ids(self) -> range:
+        return range(self.start, self.end) if self.start >= 0 else range(0)
+
+
+def chunk_segments(sections) -> List[dict]:
+    """把父段落检索结果转换为片段，token 数由块的预计算值相加得到；有章节标题时标注在片段前。"""
+    segments = []
+    for rank, section in enumerate(sections):
+        text, tokens = section.text, section.tokens
+        if section.heading:
+            label = f"[{section.heading}]"
+            text, tokens = f"{label}\n{text}", tokens + estimate_tokens(label)
+        segments.append(asdict(Segment("chunk", text, tokens, rank, section.start, section.end)))
+    return segments
+
+
+def summary_segments(chunks: ChunkStore, n_chunks: int, document_summary: Optional[str] = None) -> List[dict]:
+    """文档摘要（如有）排在最前，其后是前 n_chunks 个块的原文。"""
+    segments = text_segment("summary", document_summary)
+    for i in range(min(n_chunks, len(chunks))):
+        text = f"--- 文本块 {i} ---\n{chunks.text(i)}"
+        segments.append(asdict(Segment("summary", text, int(chunks.token_count[i]) + 8, i + 1, i, i + 1)))
+    return segments
+
+
+def tree_segments(nodes) -> List[dict]:
+    """摘要树某一层的节点，每个节点覆盖一段连续块，可与原文块摘要互相去重。"""
+    return [
+        asdict(Segment("summary", f"--- 块 {node.start}-{node.end - 1} 摘要 ---\n{node.text}",
+                       node.tokens + 12, rank, node.start, node.end))
+        for rank, node in enumerate(nodes)
+    ]
+
+
+def outline_segments(outline: List[list]) -> List[dict]:
+    segments = []
+    for rank, (i, preview) in enumerate(outline):
+        text = f"[块 {i}] {preview}..."
+        segments.append(asdict(Segment("outline", text, estimate_tokens(text), rank, i, i + 1)))
+    return segments
+
+
+def heading_segments(headings: List[dict]) -> List[dict]:
+    """标题索引生成的大纲，不绑定块范围，不会因章节正文已被选中而去重。"""
+    segments = []
+    for rank, heading in enumerate(headings):
+        text = "  " * (heading["level"] - 1) + f"{heading['title']}（块 {heading['start']}-{heading['end'] - 1}）"
+        segments.append(asdict(Segment("outline", text, estimate_tokens(text), rank)))
+    return segments
+
+
+def text_segment(kind: str, text: Optional[str]) -> List[dict]:
+    if not text:
+        return []
+    return [asdict(Segment(kind, text, estimate_tokens(text)))]
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def pack_context(
+    segments: Iterable[dict],
+    budget: int,
+    disclosure_level: str = "relevant"
+) -> Tuple[str, Dict[str, int]]:
+    """在 token 预算内按权重贪心挑选片段，返回拼好的上下文和统计信息。
+
+    覆盖的文档块已全部被选中片段包含的片段、以及文本完全相同的片段会被去重；
+    放不下的片段跳过，继续尝试更小的片段。预算内一个都放不下时截断排名第一的片段。
+    """
+    weights = LEVEL_WEIGHTS.get(disclosure_level, LEVEL_WEIGHTS["relevant"])
+    candidates = [Segment(**segment) for segment in segments]
+    candidates.sort(key=lambda s: weights.get(s.kind, 0.0) - s.rank * RANK_DECAY, reverse=True)
+
+    selected: List[Segment] = []
+    covered = set()
+    seen_texts = set()
+    used = 0
+    duplicates = 0
+
+    for segment in candidates:
+        chunk_ids = segment.chunk_ids
+        if segment.text in seen_texts or (len(chunk_ids) and covered.issuperset(chunk_ids)):
+            duplicates += 1
+            continue
+        if used + segment.tokens > budget:
+            if selected:
+                continue
+            segment.text = truncate_to_tokens(segment.text, budget)
+            segment.tokens = estimate_tokens(segment.text)
+        selected.append(segment)
+        seen_texts.add(segment.text)
+        covered.update(chunk_ids)
+        used += segment.tokens
+
+    parts = []
+    for kind, title in SEGMENT_TITLES.items():
+        texts = [s.text for s in sorted(selected, key=lambda s: s.rank) if s.kind == kind]
+        if texts:
+            parts.append(f"【{title}】\n" + SEGMENT_SEPARATORS[kind].join(texts))
+
+    stats = {
+        "budget": budget,
+        "used_tokens": used,
+        "candidate_tokens": sum(s.tokens for s in candidates),
+        "selected": len(selected),
+        "candidates": len(candidates),
+        "duplicates": duplicates,
+    }
+    return "\n\n".join(parts), stats
@@ -0,0 +1,202 @@
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.manager import load_config
+from llm.embeddings import HashingEmbeddings
+
+NEWS_TYPES = ["社会", "国内", "国际", "娱乐", "体育", "科技", "财经"]
+NO_TOOL = {"need_tool": False, "reason": "本地路由：不需要工具"}
+
+_NEWS_RE = re.compile(r"新闻|头条|热点|资讯|报道|\bnews\b|\bheadlines?\b", re.IGNORECASE)
+_HEADLINE_RE = re.compile(r"头条|热点|热门|最新|今天|今日|最近|\blatest\b|\btop\b|\bheadlines?\b", re.IGNORECASE)
+_SEARCH_RE = re.compile(
+    r"(?:搜索|搜一下|查找|查一下|查询|有没有|关于|有关)\s*(?:关于|有关)?\s*[“\"'「]?(.+?)[”\"'」]?\s*(?:的|相关的?)?(?:新闻|资讯|报道)"
+    r"|\bnews\s+(?:about|on)\s+(.+)",
+    re.IGNORECASE
+)
+_PAGE_SIZE_RE = re.compile(r"(\d+)\s*(?:条|篇|则)")
+_DOCUMENT_RE = re.compile(r"文档|文件|文章|论文|这本书|这份|这篇|\bpdf\b|\bdocument\b|\bpaper\b|\bfile\b", re.IGNORECASE)
+_SUMMARY_RE = re.compile(r"总结|概括|概述|摘要|主要内容|大意|讲了什么|讲的是什么|\bsummar", re.IGNORECASE)
+_OUTLINE_RE = re.compile(r"目录|大纲|结构|章节|\boutline\b|table of contents", re.IGNORECASE)
+# 问的是文档中的某一部分（章、节、第 N 部分）而不是整篇文档时，不能直接用全文摘要回答
+_SECTION_RE = re.compile(
+    r"第\s*[\d一二三四五六七八九十百零两]+\s*[章节部篇卷条段]|(?<!文)章|(?<![细环季])节|部分"
+    r"|\bchapters?\b|\bsections?\b|\bpart\s+\w+",
+    re.IGNORECASE
+)
+_NUMBERED_SECTION_RE = re.compile(r"第\s*[\d一二三四五六七八九十百零两]+\s*[章节部篇卷条段]|\b(?:chapter|section|part)\s+\d+", re.IGNORECASE)
+
+# 参数都有默认值、可由本地路由直接调用的工具的示例问法；search_news 和 get_news_by_type 需要参数，只由规则处理
+TOOL_EXAMPLES: Dict[str, List[str]] = {
+    "get_headlines": [
+        "今天有什么新闻", "看看头条新闻", "最新的新闻有哪些", "最近有什么热点新闻", "给我来几条新闻",
+        "latest news headlines", "what's in the news today",
+    ],
+    "get_document_summary": [
+        "总结一下这篇文档", "这份文件的主要内容是什么", "概括这篇文章", "这篇论文讲了什么", "给文档写个摘要",
+        "summarize the document", "what is this paper about",
+    ],
+    "get_document_outline": [
+        "文档的目录", "这篇文章的结构是怎样的", "列出文档的章节", "这份文件有哪些部分", "文档大纲",
+        "document outline", "table of contents of the file",
+    ],
+}
+DOCUMENT_TOOLS = ("get_document_summary", "get_document_outline")
+
+# tool_threshold：最相近的示例相似度达到该值且领先第二名 min_margin 以上时直接调用该工具；
+# none_threshold：与所有示例的相似度都低于该值时判定为不需要工具；介于两者之间交给 LLM 判断
+ROUTER_DEFAULTS = {
+    "enabled": True,
+    "tool_threshold": 0.55,
+    "none_threshold": 0.25,
+    "min_margin": 0.08,
+}
+
+
+@dataclass
+class RouteStats:
+    rule: int = 0
+    embedding: int = 0
+    llm: int = 0
+    tools: Dict[str, int] = field(default_factory=dict)
+    local_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        local = self.rule + self.embedding
+        total = local + self.llm
+        return {
+            "total": total,
+            "rule": self.rule,
+            "embedding": self.embedding,
+            "llm": self.llm,
+            "local_ratio": round(local / total, 3) if total else 0.0,
+            "avg_local_ms": round(self.local_seconds * 1000 / local, 3) if local else 0.0,
+            "tools": dict(self.tools),
+        }
+
+
+def _page_size(query: str) -> Dict[str, int]:
+    match = _PAGE_SIZE_RE.search(query)
+    return {"page_size": min(max(int(match.group(1)), 1), 50)} if match else {}
+
+
+def _tool(name: str, **parameters) -> dict:
+    return {"need_tool": True, "tool_name": name, "parameters": parameters}
+
+
+def match_rules(query: str, has_document: bool) -> Optional[dict]:
+    """关键词规则：命中明确的新闻或文档请求时返回意图，否则返回 None。"""
+    if _NEWS_RE.search(query):
+        for news_type in NEWS_TYPES:
+            if news_type in query:
+                return _tool("get_news_by_type", news_type=news_type, **_page_size(query))
+        search = _SEARCH_RE.search(query)
+        keyword = next((group for group in search.groups() if group), "").strip() if search else ""
+        if keyword and not _HEADLINE_RE.fullmatch(keyword):
+            return _tool("search_news", keyword=keyword, **_page_size(query))
+        if _HEADLINE_RE.search(query):
+            return _tool("get_headlines", **_page_size(query))
+
+    if has_document and _DOCUMENT_RE.search(query):
+        if _OUTLINE_RE.search(query) and not _NUMBERED_SECTION_RE.search(query):
+            return _tool("get_document_outline")
+        if _SUMMARY_RE.search(query) and not _SECTION_RE.search(query):
+            return _tool("get_document_summary")
+    return None
+
+
+def is_section_question(query: str) -> bool:
+    """问某一章节讲了什么：看起来像摘要请求，但需要检索该章节，交给 LLM 判断。"""
+    return bool(_DOCUMENT_RE.search(query) and _SUMMARY_RE.search(query) and _SECTION_RE.search(query))
+
+
+class IntentRouter:
+    """本地意图路由，代替大部分工具意图判断的 LLM 调用。
+
+    先用关键词规则处理明确的请求；其余问题用进程内哈希向量与各工具的示例问法比较最近邻，
+    明显不需要工具或明显对应某个工具时直接给出结果，只有置信度不足时才返回 None 交给 LLM。
+    """
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.examples = examples
+        self.stats = RouteStats()
+        self._embeddings = HashingEmbeddings()
+        self._labels: List[str] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _index(self):
+        if self._vectors is None:
+            labels, texts = [], []
+            for name, examples in self.examples.items():
+                labels.extend([name] * len(examples))
+                texts.extend(examples)
+            self._labels = labels
+            self._vectors = np.asarray(self._embeddings.embed_documents(texts), dtype=np.float32)
+        return self._labels, self._vectors
+
+    def nearest(self, query: str, has_document: bool) -> Dict[str, float]:
+        """各工具示例中与问题最相近的余弦相似度。"""
+        labels, vectors = self._index()
+        similarity = vectors @ np.asarray(self._embeddings.embed_query(query), dtype=np.float32)
+        scores: Dict[str, float] = {}
+        for label, score in zip(labels, similarity):
+            if label in DOCUMENT_TOOLS and not has_document:
+                continue
+            scores[label] = max(scores.get(label, -1.0), float(score))
+        return scores
+
+    def _record(self, path: str, intent: Optional[dict], started: float):
+        with self._lock:
+            setattr(self.stats, path, getattr(self.stats, path) + 1)
+            if path != "llm":
+                self.stats.local_seconds += time.perf_counter() - started
+                name = intent.get("tool_name") if intent.get("need_tool") else "none"
+                self.stats.tools[name] = self.stats.tools.get(name, 0) + 1
+
+    def route(self, query: str, has_document: bool) -> Optional[dict]:
+        started = time.perf_counter()
+        config = dict(ROUTER_DEFAULTS)
+        config.update(load_config().get("intent_router", {}))
+        if not config["enabled"]:
+            self._record("llm", None, started)
+            return None
+
+        intent = match_rules(query, has_document)
+        if intent:
+            self._record("rule", intent, started)
+            return intent
+        # 与全文摘要的示例问法很接近，向量匹配容易误判
+        if has_document and is_section_question(query):
+            self._record("llm", None, started)
+            return None
+
+        ranked = sorted(self.nearest(query, has_document).items(), key=lambda item: item[1], reverse=True)
+        best_name, best = ranked[0] if ranked else ("", 0.0)
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+
+        if best < config["none_threshold"]:
+            intent = dict(NO_TOOL)
+        elif best >= config["tool_threshold"] and best - second >= config["min_margin"]:
+            intent = _tool(best_name)
+        else:
+            self._record("llm", None, started)
+            return None
+
+        self._record("embedding", intent, started)
+        return intent
+
+    def record_llm(self, intent: Optional[dict]):
+        """记录 LLM 给出的结果，便于对照本地路由的覆盖情况。"""
+        name = intent.get("tool_name") if intent and intent.get("need_tool") else "none"
+        with self._lock:
+            key = f"llm:{name}"
+            self.stats.tools[key] = self.stats.tools.get(key, 0) + 1
+
+
+intent_router = IntentRouter(TOOL_EXAMPLES)
@@ -0,0 +1,67 @@
+import contextvars
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from config.manager import load_config
+
+# 推测生成：需要 LLM 判断工具意图时不等结果，直接检索并生成回答，意图判断在后台进行。
+# 远程服务可并行处理请求，默认开启；本地 Ollama 通常串行执行，两个请求并发反而更慢，默认关闭。
+# config.json 中的 speculative_generation 可按 provider 覆盖
+SPECULATIVE_DEFAULTS = {
+    "ollama": False,
+    "openai": True,
+    "anthropic": True,
+}
+
+
+def is_speculative(provider: str) -> bool:
+    settings = dict(SPECULATIVE_DEFAULTS)
+    settings.update(load_config().get("speculative_generation", {}))
+    return bool(settings.get(provider, False))
+
+
+class PendingIntents:
+    """按轮次保存后台进行的工具意图判断，生成回答的节点取出结果决定保留还是作废推测的回答。"""
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64):
+        self.max_pending = max_pending
+        self.speculated = 0
+        self.kept = 0
+        self.cancelled = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="intent")
+        self._futures: "OrderedDict[str, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, turn_id: str, detect: Callable[[], Optional[dict]]):
+        # 在提交时的上下文中运行，取消令牌随之传入后台线程
+        future = self._executor.submit(contextvars.copy_context().run, detect)
+        with self._lock:
+            self.speculated += 1
+            self._futures[turn_id] = future
+            while len(self._futures) > self.max_pending:
+                self._futures.popitem(last=False)
+
+    def take(self, turn_id: str) -> Optional[Future]:
+        with self._lock:
+            return self._futures.pop(turn_id, None)
+
+    def record(self, kept: bool):
+        with self._lock:
+            if kept:
+                self.kept += 1
+            else:
+                self.cancelled += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "speculated": self.speculated,
+                "kept": self.kept,
+                "cancelled": self.cancelled,
+                "pending": len(self._futures),
+            }
+
+
+pending_intents = PendingIntents()
@@ -1,24 +1,76 @@
-from typing import List
+import threading
+import time
+from collections import deque
+from typing import List, Optional
 from core.graph import GraphState, create_initial_state
 from agent.graph import build_qa_graph, build_agent_graph
-from core import state as app_state
+from agent.checkpoint import thread_id_for
+from agent.nodes import tool_progress
+from core.cancel import is_cancelled
 
 
-def run_graph(query: str, model_name: str = "qwen3.5:4b", images: List[dict] = None, mode: str = "qa") -> str:
-    initial_state = create_initial_state(query, model_name, images, mode)
+class GenerationStats:
+    """最近若干轮回答的首 token 时间（TTFT，从开始执行图到推送第一段文本）和总耗时。"""
+
+    def __init__(self, window: int = 200):
+        self.turns = 0
+        self._ttft = deque(maxlen=window)
+        self._total = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ttft: Optional[float], total: float):
+        with self._lock:
+            self.turns += 1
+            if ttft is not None:
+                self._ttft.append(ttft)
+            self._total.append(total)
+
+    @staticmethod
+    def _summary(values) -> dict:
+        if not values:
+            return {"count": 0}
+        ordered = sorted(values)
+        return {
+            "count": len(ordered),
+            "last_ms": round(values[-1] * 1000, 1),
+            "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        }
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "ttft": self._summary(list(self._ttft)),
+                "total": self._summary(list(self._total)),
+            }
+
+
+generation_stats = GenerationStats()
+
+
+def run_graph(query: str, model_name: str = "qwen3.5:4b", images: List[dict] = None, mode: str = "qa",
+              conversation_id: str = "") -> str:
+    initial_state = create_initial_state(query, model_name, images, mode, conversation_id)
     
     if mode == "qa":
         executor = build_qa_graph()
     else:
         executor = build_agent_graph()
     
-    result = executor.invoke(initial_state, config={"configurable": {"thread_id": "default"}})
+    result = executor.invoke(
+        initial_state, config={"configurable": {"thread_id": thread_id_for(conversation_id, mode)}}
+    )
     
     return result.get("output_content", "")
 
 
-def stream_graph(query: str, model_name: str = "qwen3.5:4b", images: List[dict] = None, mode: str = "qa"):
-    initial_state = create_initial_state(query, model_name, images, mode)
+def stream_graph(query: str, model_name: str = "qwen3.5:4b", images: List[dict] = None, mode: str = "qa",
+                 conversation_id: str = ""):
+    """执行图并逐段产出回答：generate_response 通过 custom 流推送生成的文本片段，
+    没有逐段推送的输出（如中断提示）在节点结束时一次性产出。"""
+    initial_state = create_initial_state(query, model_name, images, mode, conversation_id)
     
     if mode == "qa":
         executor = build_qa_graph()
@@ -26,27 +78,42 @@ def stream_graph(query: str, model_name: str = "qwen3.5:4b", images: List[dict]
         executor = build_agent_graph()
     
     mcp_result = None
+    started = time.perf_counter()
+    first_token = None
+    streamed = False
+
+    def emit(text: str) -> str:
+        nonlocal first_token
+        if first_token is None and text:
+            first_token = time.perf_counter() - started
+            print(f"首 token 时间: {first_token * 1000:.0f} ms")
+        return text
     
-    for event in executor.stream(initial_state, config={"configurable": {"thread_id": "default"}}):
-        if app_state.should_stop:
-            yield "操作已中断"
-            return
-        
-        for node_name, node_output in event.items():
-            if node_name == "classify_intent":
-                mcp_result = node_output.get("mcp_result")
-                if mcp_result and mcp_result.get("success"):
-                    tool_name = mcp_result.get("tool_name", "")
-                    tool_display_names = {
-                        "get_headlines": "头条新闻",
-                        "get_news_by_type": "分类新闻",
-                        "search_news": "新闻搜索",
-                        "get_document_summary": "文档摘要",
-                        "get_document_outline": "文档大纲"
-                    }
-                    tool_display_name = tool_display_names.get(tool_name, tool_name)
-                    yield f"📰 正在从{tool_display_name}获取信息...\n\n"
+    try:
+        for stream_mode, event in executor.stream(
+            initial_state,
+            config={"configurable": {"thread_id": thread_id_for(conversation_id, mode)}},
+            stream_mode=["updates", "custom"]
+        ):
+            if is_cancelled():
+                yield "操作已中断"
+                return
+
+            if stream_mode == "custom":
+                token = event.get("token") if isinstance(event, dict) else None
+                if token:
+                    streamed = True
+                    yield emit(token)
+                continue
             
-            elif node_name == "generate_response":
-                output = node_output.get("output_content", "")
-                yield output
+            for node_name, node_output in event.items():
+                if node_name == "classify_intent":
+                    mcp_result = node_output.get("mcp_result")
+                    if mcp_result and mcp_result.get("success"):
+                        yield emit(tool_progress(mcp_result.get("tool_name", "")))
+                
+                elif node_name == "generate_response" and not streamed:
+                    output = node_output.get("output_content", "")
+                    yield emit(output)
+    finally:
+        generation_stats.record(first_token, time.perf_counter() - started)
@@ -1,15 +1,21 @@
 from flask import Blueprint, jsonify, Response, request
 from core import state
-import threading
-import asyncio
+from core.broker import format_sse
+from core.scheduler import SessionStatus, generation_scheduler, lane_for
 
 chat_bp = Blueprint('chat', __name__)
 
+
+def _find_session(data):
+    session_id = data.get('session_id')
+    if session_id:
+        return generation_scheduler.get(session_id)
+    conversation_id = data.get('conversation_id') or state.get_current_conversation().id
+    return generation_scheduler.active(conversation_id)
+
+
 @chat_bp.route('/messages', methods=['POST'])
 def generate():
-    if state.is_generating:
-        return jsonify({'error': '正在生成回答中，请稍候...'}), 400
-
     data = request.json
     query = data.get('query', '').strip()
     model_name = data.get('model', 'qwen3.5:9b')
@@ -19,73 +25,98 @@ def generate():
     if not query and not images:
         return jsonify({'error': '请输入问题或上传图片'}), 400
 
-    conversation = state.get_current_conversation()
+    conversation_id = data.get('conversation_id')
+    if conversation_id and conversation_id not in state.conversations:
+        return jsonify({'error': '对话不存在'}), 404
+    conversation = state.conversations[conversation_id] if conversation_id else state.get_current_conversation()
 
-    state.is_generating = True
-    state.should_stop = False
-
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            from utils import generate_answer
-            loop.run_until_complete(generate_answer(query, model_name, mode))
-        finally:
-            loop.close()
-
-    thread = threading.Thread(target=run_async_task)
-    thread.daemon = True
-    thread.start()
+    try:
+        session = generation_scheduler.submit(conversation.id, query, model_name, mode, lane_for(state))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     return jsonify({
         'success': True,
-        'message': '开始生成回答',
-        'conversation_id': conversation.id
+        'message': '开始生成回答' if session.status == SessionStatus.RUNNING else '已加入生成队列',
+        'conversation_id': conversation.id,
+        'session_id': session.id,
+        'status': session.status,
+        'position': generation_scheduler.position(session)
     })
 
 
 @chat_bp.route('/stop', methods=['POST'])
 def stop():
-    if state.is_generating:
-        state.should_stop = True
+    session = _find_session(request.get_json(silent=True) or {})
+    if session and generation_scheduler.cancel(session):
         return jsonify({'success': True, 'message': '正在中断操作...'})
     return jsonify({'error': '没有正在进行的操作'}), 400
 
 
 @chat_bp.route('/stream')
 def stream():
-    import queue
+    session = _find_session(request.args)
+    if not session:
+        return jsonify({'error': '没有正在进行的生成'}), 404
+
+    # 浏览器自动重连时带上 Last-Event-ID，从断开处继续回放
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        after = int(last_event_id)
+    except ValueError:
+        after = 0
 
     def event_stream():
-        while True:
-            try:
-                msg_type, content = state.response_queue.get(timeout=0.1)
-                if msg_type == "chunk":
-                    yield f"data: [chunk]{content}\n\n"
-                elif msg_type == "progress":
-                    yield f"data: [PROGRESS]{content}\n\n"
-                elif msg_type == "done":
-                    yield f"data: [DONE]\n\n"
-                    break
-                elif msg_type == "error":
-                    yield f"data: [ERROR]{content}\n\n"
-                    break
-            except queue.Empty:
-                if not state.is_generating:
-                    yield f"data: [DONE]\n\n"
-                    break
+        for event in session.channel.subscribe(after):
+            if event is None:
+                yield ": keepalive\n\n"
                 continue
+            event_id, msg_type, content = event
+            yield format_sse(event_id, msg_type, content)
+            if msg_type in ("done", "error"):
+                return
+        # 通道已关闭但没有结束事件，明确告知客户端结束，避免浏览器不断重连
+        yield "data: [DONE]\n\n"
+
+    return Response(event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
-    return Response(event_stream(), mimetype='text/event-stream')
+
+@chat_bp.route('/sessions')
+def list_sessions():
+    from core.broker import stream_broker
+    return jsonify({**generation_scheduler.stats(), "stream": stream_broker.stats()})
+
+
+@chat_bp.route('/sessions/<session_id>')
+def get_session(session_id):
+    session = generation_scheduler.get(session_id)
+    if not session:
+        return jsonify({'error': '会话不存在'}), 404
+    return jsonify({**session.to_dict(), 'position': generation_scheduler.position(session)})
 
 
 @chat_bp.route('/status')
 def status():
     conv = state.get_current_conversation()
+    session = generation_scheduler.active(conv.id) if conv else None
     return jsonify({
-        'is_generating': state.is_generating,
-        'has_document': conv.vector_store is not None if conv else False,
+        'is_generating': session is not None,
+        'session': dict(session.to_dict(), position=generation_scheduler.position(session)) if session else None,
+        'has_document': bool(conv.document_chunks) if conv else False,
         'current_document': conv.document_file if conv else None,
         'message_count': len(conv.messages) if conv else 0,
         'max_context_turns': state.max_context_turns
     })
+
+
+@chat_bp.route('/intent/stats')
+def intent_stats():
+    from agent.router import intent_router
+    from agent.speculation import pending_intents
+    return jsonify({**intent_router.stats.to_dict(), "speculation": pending_intents.stats()})
+
+
+@chat_bp.route('/generation/stats')
+def get_generation_stats():
+    from agent.stream import generation_stats
+    return jsonify(generation_stats.to_dict())
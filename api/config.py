@@ -1,15 +1,34 @@
+import threading
 from flask import Blueprint, request, jsonify
 from core import state
 from config.manager import load_config, save_config
+from llm.embeddings import has_vector_search
+from llm.factory import llm_clients
+from core.scheduler import generation_scheduler
 
 config_bp = Blueprint('config', __name__)
 
+
+def _rebuild_history_index():
+    from storage.history_rag import history_rag
+
+    def rebuild():
+        history_rag.clear()
+        if has_vector_search(state.llm_provider, state.embedding_backend):
+            history_rag.build_all_index()
+
+    thread = threading.Thread(target=rebuild)
+    thread.daemon = True
+    thread.start()
+
+
 @config_bp.route('/config', methods=['GET'])
 def get_config():
     config = load_config()
     return jsonify({
         'llm_provider': state.llm_provider,
         'ollama_base_url': state.ollama_base_url,
+        'embedding_backend': state.embedding_backend,
         'openai_endpoints': state.openai_endpoints,
         'openai_current_endpoint': state.openai_current_endpoint,
         'openai_current_model': state.openai_current_model,
@@ -29,6 +48,7 @@ def update_config():
 
     llm_provider = data.get('llm_provider')
     ollama_base_url = data.get('ollama_base_url')
+    embedding_backend = data.get('embedding_backend')
     openai_endpoints = data.get('openai_endpoints')
     openai_current_endpoint = data.get('openai_current_endpoint')
     openai_current_model = data.get('openai_current_model')
@@ -46,6 +66,10 @@ def update_config():
     if ollama_base_url:
         state.ollama_base_url = ollama_base_url
 
+    backend_changed = bool(embedding_backend) and embedding_backend != state.embedding_backend
+    if backend_changed:
+        state.embedding_backend = embedding_backend
+
     if openai_endpoints is not None:
         state.openai_endpoints = openai_endpoints
     if openai_current_endpoint is not None:
@@ -75,6 +99,7 @@ def update_config():
     config = load_config()
     config['llm_provider'] = state.llm_provider
     config['ollama_base_url'] = state.ollama_base_url
+    config['embedding_backend'] = state.embedding_backend
     config['openai_endpoints'] = state.openai_endpoints
     config['openai_current_endpoint'] = state.openai_current_endpoint
     config['openai_current_model'] = state.openai_current_model
@@ -86,6 +111,11 @@ def update_config():
     config['speech_synthesis_lang'] = state.speech_synthesis_lang
     config['max_recording_time'] = state.max_recording_time
     save_config(config)
+    llm_clients.invalidate()
+    generation_scheduler.reload_limits()
+
+    if backend_changed:
+        _rebuild_history_index()
 
     return jsonify({
         'success': True,
@@ -96,6 +126,11 @@ def update_config():
     })
 
 
+@config_bp.route('/llm/clients', methods=['GET'])
+def get_llm_clients():
+    return jsonify(llm_clients.stats())
+
+
 @config_bp.route('/openai/endpoints', methods=['GET'])
 def get_openai_endpoints():
     return jsonify({
@@ -172,6 +207,7 @@ def update_openai_endpoint(endpoint_name):
     config = load_config()
     config['openai_endpoints'] = state.openai_endpoints
     save_config(config)
+    llm_clients.invalidate('openai')
 
     return jsonify({
         'success': True,
@@ -204,6 +240,7 @@ def delete_openai_endpoint(endpoint_name):
     config['openai_current_endpoint'] = state.openai_current_endpoint
     config['openai_current_model'] = state.openai_current_model
     save_config(config)
+    llm_clients.invalidate('openai')
 
     return jsonify({
         'success': True,
@@ -245,6 +282,7 @@ def switch_openai_endpoint():
     config['openai_current_endpoint'] = state.openai_current_endpoint
     config['openai_current_model'] = state.openai_current_model
     save_config(config)
+    llm_clients.invalidate('openai')
 
     return jsonify({
         'success': True,
@@ -329,6 +367,7 @@ def update_anthropic_endpoint(endpoint_name):
     config = load_config()
     config['anthropic_endpoints'] = state.anthropic_endpoints
     save_config(config)
+    llm_clients.invalidate('anthropic')
 
     return jsonify({
         'success': True,
@@ -361,6 +400,7 @@ def delete_anthropic_endpoint(endpoint_name):
     config['anthropic_current_endpoint'] = state.anthropic_current_endpoint
     config['anthropic_current_model'] = state.anthropic_current_model
     save_config(config)
+    llm_clients.invalidate('anthropic')
 
     return jsonify({
         'success': True,
@@ -402,6 +442,7 @@ def switch_anthropic_endpoint():
     config['anthropic_current_endpoint'] = state.anthropic_current_endpoint
     config['anthropic_current_model'] = state.anthropic_current_model
     save_config(config)
+    llm_clients.invalidate('anthropic')
 
     return jsonify({
         'success': True,
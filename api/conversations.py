@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify
 from core import state
+from document.jobs import ingestion_jobs
+from agent.checkpoint import checkpointer
 
 conversations_bp = Blueprint('conversations', __name__)
 
@@ -19,7 +21,10 @@ def create_conversation():
 
 @conversations_bp.route('/<conversation_id>', methods=['DELETE'])
 def delete_conversation(conversation_id):
+    if ingestion_jobs.active_job(conversation_id):
+        return jsonify({'error': '该对话的文档正在处理，请先取消任务'}), 400
     if state.delete_conversation(conversation_id):
+        checkpointer.delete_conversation(conversation_id)
         return jsonify({'success': True, 'current_id': state.current_conversation_id})
     return jsonify({'error': '对话不存在'}), 404
 
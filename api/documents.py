@@ -1,20 +1,15 @@
-import threading
-import os
-import tempfile
-import queue
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from core import state
-from utils import load_document, get_embedding_model
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
+from config.manager import load_config
+from storage.conversation import conversation_manager
+from core.broker import format_sse
+from document.jobs import JobPhase, ingestion_jobs
+from document.uploads import upload_sessions, save_stream, UploadError, SUPPORTED_EXTENSIONS
 
 documents_bp = Blueprint('documents', __name__)
 
 @documents_bp.route('/upload', methods=['POST'])
 def upload_file():
-    if state.is_generating:
-        return jsonify({'error': '正在处理中，请稍候...'}), 400
-
     conversation = state.get_current_conversation()
 
     if 'file' not in request.files:
@@ -24,111 +19,186 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
 
-    try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        temp_file_path = temp_file.name
-        temp_file.close()
-        file.save(temp_file_path)
+    file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        return jsonify({'error': f'不支持的文件类型，仅支持 {", ".join(SUPPORTED_EXTENSIONS)}'}), 400
 
-        state.is_generating = True
-        state.should_stop = False
-        state.response_queue = queue.Queue()
+    if ingestion_jobs.active_job(conversation.id):
+        return jsonify({'error': '该对话已有文档正在处理，请稍候...'}), 400
 
-        file_ext = file.filename.rsplit('.', 1)[1].lower()
+    try:
         filename = file.filename
+        model_name = request.form.get('model', 'qwen3.5:9b')
+
+        file_path = ingestion_jobs.upload_path(file_ext)
+        content_hash = save_stream(file.stream, file_path)
 
-        def process_document_async():
-            try:
-                state.response_queue.put(("progress", "正在解析文档..."))
-
-                if state.should_stop:
-                    state.response_queue.put(("error", "操作已中断"))
-                    return
-
-                docs = load_document(temp_file_path, file_ext)
-
-                state.response_queue.put(("progress", f"文档已解析，正在分块..."))
-
-                if state.should_stop:
-                    state.response_queue.put(("error", "操作已中断"))
-                    return
-
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=500,
-                    chunk_overlap=50,
-                    length_function=len
-                )
-                document_chunks = text_splitter.split_documents(docs)
-
-                total_chunks = len(document_chunks)
-                state.response_queue.put(("progress", f"已分块 {total_chunks} 个，正在建立索引..."))
-
-                if state.should_stop:
-                    state.response_queue.put(("error", "操作已中断"))
-                    return
-
-                for i, chunk in enumerate(document_chunks):
-                    chunk.metadata["chunk_index"] = i
-
-                if state.llm_provider == "ollama":
-                    embedding = get_embedding_model(state.ollama_base_url)
-                    conversation.vector_store = FAISS.from_documents(document_chunks, embedding)
-                conversation.document_file = filename
-                conversation.document_chunks = document_chunks
-                conversation.document_summary = None
-
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
-
-                state.response_queue.put(("progress", "正在生成摘要..."))
-
-                from agent import stream_graph
-                query = "请总结这个文档的主要内容"
-
-                summary_text = ""
-                for chunk in stream_graph(query, model_name="qwen3.5:9b", mode="qa"):
-                    if state.should_stop:
-                        break
-                    summary_text += chunk
-                    state.response_queue.put(("chunk", chunk))
-
-                if not state.should_stop:
-                    conversation.document_summary = summary_text
-                    conversation.add_message("user", f"上传文档《{filename}》，请总结")
-                    conversation.add_message("assistant", summary_text)
-                    state.persist_message("user", f"上传文档《{filename}》，请总结")
-                    state.persist_message("assistant", summary_text)
-                    state.response_queue.put(("done", f"{file_ext.upper()}文件解析完成，共生成 {total_chunks} 个文本块"))
-                else:
-                    state.response_queue.put(("stopped", "操作已中断，文档已加载，可正常问答"))
-
-            except Exception as e:
-                state.response_queue.put(("error", f"处理失败：{str(e)}"))
-            finally:
-                state.is_generating = False
-
-        thread = threading.Thread(target=process_document_async)
-        thread.daemon = True
-        thread.start()
+        job = ingestion_jobs.submit(conversation.id, filename, file_ext, file_path, model_name, content_hash)
 
         return jsonify({
             'success': True,
             'message': '开始解析文档',
-            'conversation_id': conversation.id
+            'conversation_id': conversation.id,
+            'job_id': job.id
         })
 
     except Exception as e:
         return jsonify({'error': f'上传失败：{str(e)}'}), 500
 
 
+@documents_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    conversation = state.get_current_conversation()
+    data = request.json or {}
+    filename = data.get('filename', '')
+    size = int(data.get('size', 0))
+    file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    config = load_config()
+
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        return jsonify({'error': f'不支持的文件类型，仅支持 {", ".join(SUPPORTED_EXTENSIONS)}'}), 400
+    if size <= 0 or size > config.get("max_upload_mb", 100) * 1024 * 1024:
+        return jsonify({'error': f'文件大小需在 {config.get("max_upload_mb", 100)}MB 以内'}), 400
+    if ingestion_jobs.active_job(conversation.id):
+        return jsonify({'error': '该对话已有文档正在处理，请稍候...'}), 400
+
+    session = upload_sessions.create(
+        conversation.id,
+        filename,
+        file_ext,
+        data.get('model', 'qwen3.5:9b'),
+        size,
+        config.get("upload_part_mb", 8) * 1024 * 1024
+    )
+    return jsonify(session.to_dict())
+
+
+@documents_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if not session:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    return jsonify(session.to_dict())
+
+
+def _start_upload_job(session):
+    def submit(file_path):
+        job = ingestion_jobs.submit(session.conversation_id, session.filename, session.file_ext,
+                                    file_path, session.model_name, session.content_hash)
+        return job.id
+
+    upload_sessions.hand_off(session, submit)
+    return session
+
+
+@documents_bp.route('/uploads/<upload_id>/parts/<int:index>', methods=['PUT'])
+def upload_part(upload_id, index):
+    session = upload_sessions.get(upload_id)
+    if not session:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+
+    try:
+        upload_sessions.write_part(session, index, request.stream)
+        if session.complete:
+            _start_upload_job(session)
+    except UploadError as e:
+        return jsonify({'error': str(e), **session.to_dict()}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'上传失败：{str(e)}', **session.to_dict()}), 500
+
+    return jsonify(session.to_dict())
+
+
+@documents_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if not session:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    if not session.complete:
+        return jsonify({'error': f'上传未完成，需要上传第 {session.next_part} 个分片', **session.to_dict()}), 409
+
+    expected = (request.json or {}).get('sha256') if request.is_json else None
+    if expected and expected.lower() != session.content_hash:
+        if session.job_id:
+            ingestion_jobs.cancel(session.job_id)
+        upload_sessions.discard(upload_id)
+        return jsonify({'error': '文件校验失败，请重新上传'}), 400
+
+    try:
+        _start_upload_job(session)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(session.to_dict())
+
+
+@documents_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if not session:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    upload_sessions.discard(upload_id)
+    return jsonify({'success': True, 'message': '上传已取消'})
+
+
+@documents_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    conversation_id = request.args.get('conversation_id')
+    return jsonify({'jobs': [job.to_dict() for job in ingestion_jobs.list_jobs(conversation_id)]})
+
+
+@documents_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+
+@documents_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if ingestion_jobs.cancel(job_id):
+        return jsonify({'success': True, 'message': '正在取消任务...'})
+    return jsonify({'error': '任务不存在或已结束'}), 400
+
+
+@documents_bp.route('/jobs/<job_id>/stream')
+def stream_job(job_id):
+    events = ingestion_jobs.get_events(job_id)
+    if events is None:
+        return jsonify({'error': '任务不存在'}), 404
+
+    # 浏览器自动重连时带上 Last-Event-ID，从断开处继续回放
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        after = 0
+
+    def event_stream():
+        for event in events.subscribe(after):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(*event)
+            if event[1] in ("done", "stopped", "error"):
+                return
+        # 服务重启后恢复的任务没有事件记录，按任务状态补发结束事件，避免浏览器不断重连
+        job = ingestion_jobs.get(job_id)
+        failed = job is not None and job.phase in (JobPhase.FAILED, JobPhase.CANCELLED)
+        yield format_sse(events.last_id, "error" if failed else "done", job.message if job else "")
+
+    return Response(event_stream(), mimetype='text/event-stream')
+
+
 @documents_bp.route('/remove', methods=['DELETE'])
 def remove_document():
     conversation = state.get_current_conversation()
-    conversation.vector_store = None
+    if ingestion_jobs.active_job(conversation.id):
+        return jsonify({'error': '文档正在处理中，请先取消任务'}), 400
+    conversation.clear_document()
     conversation.document_file = None
     conversation.summary = None
-    conversation.document_chunks = []
+    conversation_manager.set_document(conversation.id, "")
 
     return jsonify({'success': True, 'message': '文档已移除'})
@@ -1,10 +1,28 @@
+import os
 from flask import Flask, render_template
 from core import state
 from routes import register_routes
+from config.manager import load_config
+from document.jobs import ingestion_jobs
 
 app = Flask(__name__)
+# 单次请求体上限：整文件上传受此限制，分片上传的每个分片远小于它
+app.config['MAX_CONTENT_LENGTH'] = load_config().get("max_upload_mb", 100) * 1024 * 1024
 
 register_routes(app)
 
+
+@app.before_request
+def recover_jobs():
+    # 恢复中断的文档任务：flask run、WSGI 服务器等任何启动方式下都在实际提供服务的进程收到首个请求时执行，
+    # debug 重载的父进程只监视文件、不处理请求，不会重复提交任务；recover() 在同一进程内只执行一次
+    ingestion_jobs.recover()
+
+
+# 重载子进程启动时即恢复，不必等到首个请求
+if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    ingestion_jobs.recover()
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,87 @@
+"""对比旧的全量拼接与按 token 预算打包后的检索上下文大小。
+
+用法：
+    python benchmarks/context_packing.py [--pages 40]
+
+旧方式：相关片段 + 完整大纲采样 + 前 10 块摘要直接拼接。
+新方式：同样的候选片段经 agent.packer.pack_context 去重并按模型档位预算挑选。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from agent.packer import chunk_segments, summary_segments, outline_segments, pack_context
+from config.context import get_chunk_config, get_context_budget, get_search_k
+from document.artifacts import build_outline
+from document.indexer import split_documents
+from llm.tokens import estimate_tokens
+from storage.chunk_store import ChunkStore
+from storage.parent_index import ParentChildIndex
+from storage.retriever import BM25Retriever, build_keyword_index
+
+
+SAMPLE_SENTENCES = [
+    "LangGraph 使用状态图编排多个节点，每个节点读取并更新共享状态。",
+    "The retriever returns the most relevant chunks for the user's question.",
+    "文档上传后会被切分为多个文本块，并建立向量索引和关键词索引。",
+    "FAISS performs approximate nearest neighbour search over dense vectors.",
+    "历史对话检索可以帮助模型回忆之前讨论过的内容。",
+    "Streaming responses reduce the perceived latency for end users.",
+]
+
+MODELS = ["qwen3:8b", "qwen3.5:9b", "llama3:70b"]
+
+
+def make_pages(n: int):
+    rng = random.Random(0)
+    return [
+        Document(
+            page_content="\n".join(rng.choice(SAMPLE_SENTENCES) for _ in range(40)),
+            metadata={"page": i}
+        )
+        for i in range(n)
+    ]
+
+
+def legacy_context(sections, chunks: ChunkStore) -> str:
+    main_context = "\n\n".join(section.text for section in sections)
+    step = max(1, len(chunks) // 10)
+    outline = "\n".join(f"[块 {i}] {chunks.preview(i, 150)}..." for i in range(0, len(chunks), step))
+    summary = "\n\n".join(f"--- 文本块 {i} ---\n{text}" for i, text in enumerate(chunks.texts(0, 10)))
+    return f"【相关片段】\n{main_context}\n\n【文档大纲】\n{outline}\n\n【文档摘要】\n{summary}\n"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--query", default="向量索引 retriever")
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    for model_name in MODELS:
+        chunks = ChunkStore.from_documents(split_documents(pages, model_name))
+        parent_index = ParentChildIndex(chunks, get_chunk_config(model_name)["parent_size"])
+        retriever = BM25Retriever(build_keyword_index(chunks), chunks)
+        docs = retriever.retrieve(args.query, get_search_k(model_name))
+        sections = parent_index.expand(doc.metadata["chunk_index"] for doc in docs)
+
+        legacy_tokens = estimate_tokens(legacy_context(sections, chunks))
+
+        start = time.perf_counter()
+        segments = chunk_segments(sections) + summary_segments(chunks, 10) + outline_segments(build_outline(chunks))
+        packed, stats = pack_context(segments, get_context_budget(model_name))
+        elapsed = (time.perf_counter() - start) * 1000
+
+        print(f"{model_name:<12} 旧: {legacy_tokens:6d} tokens   打包: {estimate_tokens(packed):6d} tokens "
+              f"(预算 {stats['budget']}, 选中 {stats['selected']}/{stats['candidates']}, "
+              f"去重 {stats['duplicates']})   打包耗时 {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
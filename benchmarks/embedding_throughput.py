@@ -0,0 +1,70 @@
+"""对比本地哈希向量化与 Ollama 向量化的吞吐量。
+
+用法：
+    python benchmarks/embedding_throughput.py [--n 500] [--base-url http://localhost:11434]
+
+Ollama 不可用时只输出本地后端的结果。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm.embeddings import EmbeddingBackend, get_embedding_model
+
+
+SAMPLE_SENTENCES = [
+    "LangGraph 使用状态图编排多个节点，每个节点读取并更新共享状态。",
+    "The retriever returns the most relevant chunks for the user's question.",
+    "文档上传后会被切分为多个文本块，并建立向量索引和关键词索引。",
+    "FAISS performs approximate nearest neighbour search over dense vectors.",
+    "历史对话检索可以帮助模型回忆之前讨论过的内容。",
+    "Streaming responses reduce the perceived latency for end users.",
+]
+
+
+def make_texts(n: int, sentences_per_text: int = 6):
+    rng = random.Random(0)
+    return [" ".join(rng.choice(SAMPLE_SENTENCES) for _ in range(sentences_per_text)) for _ in range(n)]
+
+
+def bench(name: str, embedding, texts, batch_size: int = 32):
+    embedding.embed_documents(texts[:2])
+
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        embedding.embed_documents(texts[i:i + batch_size])
+    doc_elapsed = time.perf_counter() - start
+
+    queries = texts[:50]
+    start = time.perf_counter()
+    for q in queries:
+        embedding.embed_query(q)
+    query_elapsed = time.perf_counter() - start
+
+    print(f"{name:<8} 文档: {len(texts) / doc_elapsed:10.1f} 条/秒   "
+          f"查询: {query_elapsed / len(queries) * 1000:8.2f} ms/条")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=500)
+    parser.add_argument("--base-url", default="http://localhost:11434")
+    args = parser.parse_args()
+
+    texts = make_texts(args.n)
+    print(f"样本数: {len(texts)}，平均长度: {sum(map(len, texts)) // len(texts)} 字符")
+
+    bench(EmbeddingBackend.LOCAL, get_embedding_model(backend=EmbeddingBackend.LOCAL), texts)
+
+    try:
+        bench(EmbeddingBackend.OLLAMA, get_embedding_model(args.base_url, EmbeddingBackend.OLLAMA), texts)
+    except Exception as e:
+        print(f"{EmbeddingBackend.OLLAMA:<8} 不可用: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,62 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from config.manager import load_config
 
 
 MODEL_CONTEXT_CONFIGS = {
     "small": {
         "max_tokens": 8192,
+        "context_budget": 2048,
         "description": "8k 上下文窗口",
         "summary_max_chars": 300,
-        "search_k": 2,
-        "chunk_size": 500,
-        "chunk_overlap": 50
+        "search_k": 4,
+        "chunk_size": 160,
+        "chunk_overlap": 16,
+        "parent_size": 640
     },
     "medium": {
         "max_tokens": 32768,
+        "context_budget": 6144,
         "description": "32k 上下文窗口",
         "summary_max_chars": 800,
-        "search_k": 4,
-        "chunk_size": 800,
-        "chunk_overlap": 100
+        "search_k": 6,
+        "chunk_size": 240,
+        "chunk_overlap": 24,
+        "parent_size": 1200
     },
     "large": {
         "max_tokens": 131072,
+        "context_budget": 16384,
         "description": "128k+ 上下文窗口",
         "summary_max_chars": 1500,
-        "search_k": 6,
-        "chunk_size": 1200,
-        "chunk_overlap": 200
+        "search_k": 8,
+        "chunk_size": 360,
+        "chunk_overlap": 40,
+        "parent_size": 2000
     }
 }
 
+# chunk_size / chunk_overlap / parent_size / context_budget 的单位是 token（见 llm.tokens.estimate_tokens）
+# context_budget 是注入系统提示词的检索上下文（文档片段、摘要、大纲、历史、Skill）的总预算，
+# 其余窗口留给对话历史和模型输出
+
+# 各披露级别（及历史对话检索）的自适应检索参数，字段含义见 storage.ranking.RetrievalPolicy；
+# relevant 级别的 k 默认取模型档位的 search_k。config.json 中的 retrieval 字段可按级别覆盖
+RETRIEVAL_POLICIES = {
+    "relevant": {"min_k": 1, "fetch_k": 24, "min_score": 0.2, "max_drop": 0.45, "mmr_lambda": 0.75},
+    "summary": {"k": 4, "min_k": 1, "fetch_k": 16, "min_score": 0.25, "max_drop": 0.35, "mmr_lambda": 0.5},
+    "full": {"k": 12, "min_k": 2, "fetch_k": 48, "min_score": 0.15, "max_drop": 0.6, "mmr_lambda": 0.5},
+    "history": {"k": 3, "min_k": 0, "fetch_k": 10, "min_score": 0.3, "max_drop": 0.3, "mmr_lambda": 0.6},
+}
+
+# 问答图中并行检索分支的超时（秒），超时的分支按空结果处理，不再等待；None 表示不限时。
+# 文档检索在首次提问时可能需要建立向量索引，时限放宽；超时后索引在后台继续建完，下一轮即可使用。
+# config.json 中的 branch_timeouts 字段可覆盖
+BRANCH_TIMEOUTS = {
+    "retrieve_docs": 60.0,
+    "retrieve_history": 8.0,
+}
+
 MODEL_WINDOW_MAP = {
     "qwen3:8b": "small",
     "qwen3:14b": "medium",
@@ -44,22 +73,27 @@ MODEL_WINDOW_MAP = {
 }
 
 
+def get_context_profile(model_name: str) -> str:
+    """模型的上下文档位：先按 MODEL_WINDOW_MAP 精确匹配，再匹配带后缀的变体（如 qwen3:8b-q4_K_M），
+    都没有时才按名称中的参数量推测。"""
+    name = model_name.lower()
+    windows = {key.lower(): size for key, size in MODEL_WINDOW_MAP.items()}
+    if name in windows:
+        return windows[name]
+
+    variants = [key for key in windows if name.startswith(key)]
+    if variants:
+        return windows[max(variants, key=len)]
+
+    if any(x in name for x in ["70b", "72b", "128k", "large"]):
+        return "large"
+    if any(x in name for x in ["0.5b", "0.8b", "1b", "1.5b", "2b", "3b", "7b", "8b", "small"]):
+        return "small"
+    return "medium"
+
+
 def get_model_context_config(model_name: str) -> Dict[str, Any]:
-    base_name = model_name.split(":")[0] if ":" in model_name else model_name
-    
-    window_size = "medium"
-    
-    for model_key, size in MODEL_WINDOW_MAP.items():
-        if model_key.lower() in model_name.lower() or base_name.lower() in model_key.lower():
-            window_size = size
-            break
-    
-    if any(x in model_name.lower() for x in ["70b", "72b", "128k", "large"]):
-        window_size = "large"
-    elif any(x in model_name.lower() for x in ["0.5b", "0.8b", "1b", "1.5b", "2b", "3b", "7b", "8b", "small"]):
-        window_size = "small"
-    
-    return MODEL_CONTEXT_CONFIGS[window_size]
+    return MODEL_CONTEXT_CONFIGS[get_context_profile(model_name)]
 
 
 def get_search_k(model_name: str) -> int:
@@ -68,13 +102,37 @@ def get_search_k(model_name: str) -> int:
 
 
 def get_chunk_config(model_name: str) -> Dict[str, int]:
-    config = get_model_context_config(model_name)
+    return get_profile_chunk_config(get_context_profile(model_name))
+
+
+def get_profile_chunk_config(profile: str) -> Dict[str, int]:
+    config = MODEL_CONTEXT_CONFIGS[profile]
     return {
         "chunk_size": config["chunk_size"],
-        "chunk_overlap": config["chunk_overlap"]
+        "chunk_overlap": config["chunk_overlap"],
+        "parent_size": config["parent_size"]
     }
 
 
 def get_summary_max_chars(model_name: str) -> int:
     config = get_model_context_config(model_name)
     return config["summary_max_chars"]
+
+
+def get_context_budget(model_name: str) -> int:
+    config = get_model_context_config(model_name)
+    return config["context_budget"]
+
+
+def get_retrieval_policy(level: str, k: Optional[int] = None) -> Dict[str, Any]:
+    policy = dict(RETRIEVAL_POLICIES.get(level, RETRIEVAL_POLICIES["relevant"]))
+    if k is not None:
+        policy["k"] = k
+    policy.update(load_config().get("retrieval", {}).get(level, {}))
+    return policy
+
+
+def get_branch_timeout(branch: str) -> Optional[float]:
+    timeouts = dict(BRANCH_TIMEOUTS)
+    timeouts.update(load_config().get("branch_timeouts", {}))
+    return timeouts.get(branch)
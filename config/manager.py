@@ -6,6 +6,16 @@ CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "config.json")
 DEFAULT_CONFIG = {
     "llm_provider": "ollama",
     "ollama_base_url": "http://localhost:11434",
+    "embedding_backend": "ollama",
+    "summary_workers": 4,
+    "ingestion_workers": 2,
+    "max_upload_mb": 100,
+    "upload_part_mb": 8,
+    "checkpoint_keep_last": 10,
+    "checkpoint_max_threads": 64,
+    "generation_workers": 8,
+    "stream_replay_events": 4096,
+    "stream_retention_seconds": 300,
     "max_context_turns": 5,
     "speech_recognition_lang": "zh-CN",
     "speech_synthesis_lang": "zh-CN",
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from config.manager import load_config
+
+Event = Tuple[int, str, str]
+
+
+class Channel:
+    """一个生成会话的输出通道。
+
+    事件带从 1 开始递增的 id，只保留最近 max_events 条用于断线重连时回放；
+    每个订阅者从自己的位置独立读取，多个标签页订阅同一通道互不影响。
+    """
+
+    def __init__(self, channel_id: str, max_events: int = 4096):
+        self.id = channel_id
+        self.closed = False
+        self.closed_at: Optional[float] = None
+        self.subscribers = 0
+        self._events: Deque[Event] = deque(maxlen=max_events)
+        self._next_id = 1
+        self._condition = threading.Condition()
+
+    @property
+    def last_id(self) -> int:
+        return self._next_id - 1
+
+    def publish(self, event_type: str, content: str = "") -> int:
+        with self._condition:
+            if self.closed:
+                return self.last_id
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, event_type, content))
+            self._condition.notify_all()
+            return event_id
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self.closed_at = time.time()
+            self._condition.notify_all()
+
+    def read(self, after: int, timeout: Optional[float] = None) -> Tuple[List[Event], bool]:
+        """返回 id 大于 after 的事件；没有新事件且通道未关闭时阻塞等待至多 timeout 秒。
+
+        第二个返回值表示 after 之后有事件已被挤出回放缓冲，订阅者错过了部分输出。
+        """
+        with self._condition:
+            if after >= self.last_id and not self.closed:
+                self._condition.wait(timeout)
+            first = self._events[0][0] if self._events else self._next_id
+            events = [event for event in self._events if event[0] > after]
+            return events, after + 1 < first
+
+    def subscribe(self, after: int = 0, heartbeat: float = 15.0) -> Iterator[Optional[Event]]:
+        """依次产出事件，通道关闭且读完后结束；超过 heartbeat 秒没有新事件时产出 None，供调用方发送心跳。
+
+        错过的事件无法补回时先产出一个 resync 事件。
+        """
+        with self._condition:
+            self.subscribers += 1
+        try:
+            position = after
+            while True:
+                events, missed = self.read(position, heartbeat)
+                if missed:
+                    yield (position, "resync", "")
+                if events:
+                    yield from events
+                    position = events[-1][0]
+                elif self.closed and position >= self.last_id:
+                    return
+                else:
+                    yield None
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+
+
+# 事件类型在 SSE data 中的前缀，前端按前缀区分
+SSE_PREFIXES = {
+    "chunk": "[chunk]",
+    "progress": "[PROGRESS]",
+    "done": "[DONE]",
+    "stopped": "[stopped]",
+    "error": "[ERROR]",
+}
+
+
+def format_sse(event_id: int, event_type: str, content: str = "") -> str:
+    """把事件格式化为一条 SSE 消息；多行内容拆成多个 data 行，客户端收到时会用换行重新拼接。"""
+    if event_type == "resync":
+        # 断线期间的部分输出已超出回放范围，客户端在结束后重新加载即可得到完整内容
+        return "data: [RESYNC]\n\n"
+    prefix = SSE_PREFIXES.get(event_type)
+    if prefix is None:
+        return ""
+    data = (prefix + content).replace("\n", "\ndata: ")
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+class StreamBroker:
+    """按生成会话管理输出通道。已关闭的通道保留 retention_seconds 秒供迟到的订阅者回放，通道总数不超过 max_channels。"""
+
+    def __init__(self, max_events: int = 4096, retention_seconds: float = 300.0, max_channels: int = 256):
+        self.max_events = max_events
+        self.retention_seconds = retention_seconds
+        self.max_channels = max_channels
+        self._channels: "OrderedDict[str, Channel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, channel_id: str) -> Channel:
+        with self._lock:
+            self._prune()
+            channel = self._channels[channel_id] = Channel(channel_id, self.max_events)
+            return channel
+
+    def get(self, channel_id: str) -> Optional[Channel]:
+        with self._lock:
+            return self._channels.get(channel_id)
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            channel_id for channel_id, channel in self._channels.items()
+            if channel.closed and now - channel.closed_at > self.retention_seconds
+        ]
+        for channel_id in expired:
+            del self._channels[channel_id]
+        # 仍超出上限时淘汰最早的已关闭通道，进行中的通道不淘汰
+        for channel_id in [cid for cid, channel in self._channels.items() if channel.closed]:
+            if len(self._channels) < self.max_channels:
+                break
+            del self._channels[channel_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            channels = list(self._channels.values())
+        return {
+            "channels": len(channels),
+            "open": sum(1 for channel in channels if not channel.closed),
+            "subscribers": sum(channel.subscribers for channel in channels),
+            "max_events": self.max_events,
+            "retention_seconds": self.retention_seconds,
+        }
+
+
+_config = load_config()
+stream_broker = StreamBroker(
+    max_events=_config.get("stream_replay_events", 4096),
+    retention_seconds=_config.get("stream_retention_seconds", 300)
+)
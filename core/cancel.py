@@ -0,0 +1,125 @@
+import socket
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+import httpx
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _abort(response: httpx.Response):
+    """关闭响应所在连接的 socket：阻塞在读取上的线程立即收到连接错误，服务端检测到断开后停止生成。
+
+    这里只做 shutdown 而不 close，连接对象由读取线程在异常处理中自行回收。
+    """
+    stream = response.extensions.get("network_stream")
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is None:
+        return
+    try:
+        # TLS 连接直接对底层 socket 操作，不改动 SSL 对象的状态
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class CancelToken:
+    """一次生成（或一个文档任务）的取消令牌。
+
+    令牌通过 contextvars 传递到图节点和 LLM 调用所在的线程：取消时中断令牌下所有进行中的 HTTP 响应，
+    之后再通过 get_llm 获取模型客户端会抛出 Cancelled。
+    带 parent 的子令牌（如图中的超时分支）可以单独取消，父令牌取消时子令牌同样视为已取消。
+    """
+
+    def __init__(self, parent: Optional["CancelToken"] = None):
+        self.parent = parent
+        self._event = threading.Event()
+        self._responses: "weakref.WeakSet[httpx.Response]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or bool(self.parent and self.parent.cancelled)
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            responses = list(self._responses)
+            self._responses.clear()
+        for response in responses:
+            _abort(response)
+
+    def track(self, response: httpx.Response):
+        if self.parent:
+            self.parent.track(response)
+        with self._lock:
+            if not self._event.is_set():
+                self._responses.add(response)
+                return
+        _abort(response)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._event.wait(timeout)
+
+
+_current_token: ContextVar[Optional[CancelToken]] = ContextVar("cancel_token", default=None)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def is_cancelled() -> bool:
+    token = _current_token.get()
+    return bool(token and token.cancelled)
+
+
+def raise_if_cancelled():
+    token = _current_token.get()
+    if token:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def cancel_scope(token: CancelToken) -> Iterator[CancelToken]:
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def _track_response(response: httpx.Response):
+    token = _current_token.get()
+    if token:
+        token.track(response)
+
+
+def install_http_hooks(client: httpx.Client):
+    """给 httpx 客户端加上响应钩子，把响应登记到当前令牌；客户端可能被多个模型实例共享，重复安装无副作用。"""
+    hooks = client.event_hooks
+    if _track_response not in hooks["response"]:
+        hooks["response"].append(_track_response)
+        client.event_hooks = hooks
+
+
+def install_llm_hooks(llm):
+    """找到聊天模型底层的同步 httpx 客户端并安装钩子（Ollama、OpenAI、Anthropic）。"""
+    for path in (("_client", "_client"), ("root_client", "_client")):
+        target = llm
+        for name in path:
+            target = getattr(target, name, None)
+            if target is None:
+                break
+        # OpenAI/Anthropic SDK 可能使用 httpx 的兼容分支，按接口而不是类型判断
+        if target is not None and isinstance(getattr(target, "event_hooks", None), dict):
+            install_http_hooks(target)
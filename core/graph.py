@@ -1,20 +1,25 @@
 from typing import TypedDict, Annotated, List, Optional, Any
 import operator
+import uuid
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 
 
 class GraphState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
     query: str
+    turn_id: str
+    intent_pending: bool
+    query_embedding: Optional[List[float]]
     images: List[dict]
     model_name: str
     retrieved_docs: List[str]
     mcp_result: Optional[dict]
     output_content: str
-    should_stop: bool
     conversation_id: str
     has_document: bool
     document_context: str
+    context_segments: List[dict]
+    context_stats: Optional[dict]
     disclosure_level: str
     history_context: str
     target_skill: Optional[str]
@@ -41,20 +46,26 @@ def decide_disclosure_level(query: str) -> str:
         return "relevant"
 
 
-def create_initial_state(query: str, model_name: str = "qwen3.5:4b", images: List[dict] = None, mode: str = "qa") -> dict:
+def create_initial_state(query: str, model_name: str = "qwen3.5:4b", images: List[dict] = None, mode: str = "qa",
+                         conversation_id: str = "") -> dict:
     return {
         "messages": [],
         "query": query,
+        "turn_id": uuid.uuid4().hex,
+        "intent_pending": False,
+        "query_embedding": None,
         "images": images or [],
         "model_name": model_name,
         "retrieved_docs": [],
         "mcp_result": None,
         "output_content": "",
-        "should_stop": False,
-        "conversation_id": "",
+        "conversation_id": conversation_id,
         "has_document": False,
         "document_context": "",
+        "context_segments": [],
+        "context_stats": None,
         "disclosure_level": "relevant",
+        "history_context": "",
         "target_skill": None,
         "skill_params": None,
         "skill_context": None,
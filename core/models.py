@@ -2,9 +2,12 @@ from datetime import datetime
 import uuid
 import copy
 import threading
-import queue
 from storage.conversation import conversation_manager
+from storage.chunk_store import ChunkStore
+from document.artifacts import DocumentArtifacts
 from config.manager import load_config
+from llm.embeddings import has_vector_search
+from core.scheduler import session_conversation_id
 
 
 class Message:
@@ -47,13 +50,34 @@ class Conversation:
             self.vector_store = None
             self.document_file = None
             self.document_summary = None
-            self.document_chunks = []
+            self.document_chunks = ChunkStore()
             self.images = []
             self.messages = []
             self.summary = None
         
         self.vector_store = None
-        self.document_chunks = []
+        self.keyword_index = None
+        self.parent_index = None
+        self.chunk_profile = None
+        self.document_chunks = ChunkStore()
+        self.document_pages = ChunkStore()
+        self.document_artifacts = DocumentArtifacts()
+        if from_persisted and self.document_file:
+            from document.indexer import load_document_index
+            load_document_index(self)
+
+    def clear_document(self):
+        self.vector_store = None
+        self.keyword_index = None
+        self.parent_index = None
+        self.chunk_profile = None
+        self.document_summary = None
+        self.document_chunks.close()
+        self.document_chunks = ChunkStore()
+        self.document_pages.close()
+        self.document_pages = ChunkStore()
+        self.document_artifacts = DocumentArtifacts()
+        conversation_manager.delete_document_data(self.id)
 
     def add_message(self, role, content, images=None):
         message = Message(role, content, images)
@@ -87,12 +111,11 @@ class AppState:
         self.speech_recognition_lang = config.get("speech_recognition_lang", "zh-CN")
         self.speech_synthesis_lang = config.get("speech_synthesis_lang", "zh-CN")
         self.max_recording_time = config.get("max_recording_time", 30)
-        self.is_generating = False
-        self.should_stop = False
-        self.response_queue = queue.Queue()
         
         self.llm_provider = config.get("llm_provider", "ollama")
         self.ollama_base_url = config.get("ollama_base_url", "http://localhost:11434")
+        self.embedding_backend = config.get("embedding_backend", "ollama")
+        self.summary_workers = config.get("summary_workers", 4)
 
         self.openai_endpoints = config.get("openai_endpoints", [])
         self.openai_current_endpoint = config.get("openai_current_endpoint", "")
@@ -148,7 +171,7 @@ class AppState:
         if persisted_convs:
             self.current_conversation_id = persisted_convs[0]["id"]
         
-        if self.llm_provider == "ollama":
+        if has_vector_search(self.llm_provider, self.embedding_backend):
             from storage.history_rag import history_rag
             history_rag.build_all_index()
 
@@ -168,16 +191,21 @@ class AppState:
         return conv
 
     def get_current_conversation(self):
+        # 生成会话中固定使用会话所属的对话，不受用户切换对话影响
+        session_conversation = self.conversations.get(session_conversation_id())
+        if session_conversation:
+            return session_conversation
         if self.current_conversation_id is None:
             return self.create_conversation()
         return self.conversations.get(self.current_conversation_id)
 
     def delete_conversation(self, conversation_id):
         if conversation_id in self.conversations:
+            self.conversations[conversation_id].clear_document()
             del self.conversations[conversation_id]
             
             conversation_manager.delete_conversation(conversation_id)
-            if self.llm_provider == "ollama":
+            if has_vector_search(self.llm_provider, self.embedding_backend):
                 from storage.history_rag import history_rag
                 history_rag.delete_conversation_index(conversation_id)
             
@@ -209,17 +237,23 @@ class AppState:
         
         return new_conv
 
-    def persist_message(self, role: str, content: str, images=None):
-        conv = self.get_current_conversation()
-        conversation_manager.append_message(conv.id, role, content, images)
+    def persist_message(self, role: str, content: str, images=None, conversation_id=None):
+        if conversation_id is None:
+            conversation_id = self.get_current_conversation().id
+        conversation_manager.append_message(conversation_id, role, content, images)
+
+    def _active_conversation_id(self):
+        return session_conversation_id() or self.current_conversation_id
 
     def persist_conversation_name(self, name: str):
-        if self.current_conversation_id:
-            conversation_manager.update_conversation_name(self.current_conversation_id, name)
+        conversation_id = self._active_conversation_id()
+        if conversation_id:
+            conversation_manager.update_conversation_name(conversation_id, name)
 
     def persist_summary(self, summary: str):
-        if self.current_conversation_id:
-            conversation_manager.update_summary(self.current_conversation_id, summary)
+        conversation_id = self._active_conversation_id()
+        if conversation_id:
+            conversation_manager.update_summary(conversation_id, summary)
 
     def switch_conversation(self, conversation_id: str):
         if conversation_id in self.conversations:
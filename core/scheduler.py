@@ -0,0 +1,262 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+from config.manager import load_config
+from core.broker import stream_broker
+from core.cancel import CancelToken, cancel_scope
+
+# 每个 provider 同时生成的回答数；本地 Ollama 默认串行，远程服务可以并行。
+# config.json 的 generation_concurrency 可按 provider 或 "provider:端点" 覆盖
+CONCURRENCY_DEFAULTS = {
+    "ollama": 1,
+    "openai": 4,
+    "anthropic": 4,
+}
+
+
+class SessionStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+
+_session_conversation: ContextVar[Optional[str]] = ContextVar("session_conversation", default=None)
+
+
+def session_conversation_id() -> Optional[str]:
+    """当前线程所属生成会话的对话 id；不在会话中时返回 None。"""
+    return _session_conversation.get()
+
+
+@contextmanager
+def conversation_scope(conversation_id: str) -> Iterator[str]:
+    reset = _session_conversation.set(conversation_id)
+    try:
+        yield conversation_id
+    finally:
+        _session_conversation.reset(reset)
+
+
+def lane_for(app_state) -> str:
+    """当前配置的后端通道：provider 加端点（Ollama 为服务地址），同一端点的会话共享并发名额。"""
+    provider = app_state.llm_provider
+    if provider == "openai":
+        endpoint = app_state.openai_current_endpoint
+    elif provider == "anthropic":
+        endpoint = app_state.anthropic_current_endpoint
+    else:
+        endpoint = app_state.ollama_base_url
+    return f"{provider}:{endpoint}" if endpoint else provider
+
+
+class GenerationSession:
+    """一次回答生成：固定所属对话、模型与后端通道，输出发布到以会话 id 命名的流通道。"""
+
+    def __init__(self, conversation_id: str, query: str, model_name: str, mode: str, lane: str):
+        self.id = uuid.uuid4().hex
+        self.conversation_id = conversation_id
+        self.query = query
+        self.model_name = model_name
+        self.mode = mode
+        self.lane = lane
+        self.status = SessionStatus.QUEUED
+        self.error: Optional[str] = None
+        self.token = CancelToken()
+        self.channel = stream_broker.open(self.id)
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in SessionStatus.FINISHED
+
+    @property
+    def should_stop(self) -> bool:
+        return self.token.cancelled
+
+    def put(self, event_type: str, content: str = ""):
+        self.channel.publish(event_type, content)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "conversation_id": self.conversation_id,
+            "mode": self.mode,
+            "model": self.model_name,
+            "lane": self.lane,
+            "status": self.status,
+            "error": self.error,
+            "wait_seconds": round((self.started_at or time.time()) - self.created_at, 3),
+        }
+
+
+class GenerationScheduler:
+    """回答生成调度器。
+
+    每个对话同时只有一个未结束的会话（回答依赖前一轮的历史）。会话按后端通道（provider + 端点）排队，
+    每个通道的并发数由 generation_concurrency 限制，全部通道合计不超过 generation_workers 个工作线程。
+    空出名额时在有余量的通道中选等待最久的队首会话启动：同一通道内先到先得，
+    某个后端满载时排在它后面的请求不会挡住其他后端的请求。
+    """
+
+    def __init__(self, runner: Callable[[GenerationSession], object], max_workers: int = 8, max_history: int = 200):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_history = max_history
+        self.sessions: Dict[str, GenerationSession] = {}
+        self._queues: Dict[str, Deque[GenerationSession]] = {}
+        self._running: Dict[str, int] = {}
+        self._active: Dict[str, GenerationSession] = {}
+        self._finished: Deque[str] = deque()
+        self._limits: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generate")
+        self._local = threading.local()
+
+    def reload_limits(self):
+        """配置保存后调用：重新读取 generation_concurrency，上限提高时立即启动排队中的会话。"""
+        with self._lock:
+            self._limits = None
+            self._dispatch()
+
+    def lane_limit(self, lane: str) -> int:
+        limits = self._limits
+        if limits is None:
+            limits = dict(CONCURRENCY_DEFAULTS)
+            limits.update(load_config().get("generation_concurrency", {}))
+            self._limits = limits
+        provider = lane.split(":", 1)[0]
+        return max(1, int(limits.get(lane, limits.get(provider, 1))))
+
+    def submit(self, conversation_id: str, query: str, model_name: str, mode: str, lane: str) -> GenerationSession:
+        with self._lock:
+            if conversation_id in self._active:
+                raise ValueError("正在生成回答中，请稍候...")
+            session = GenerationSession(conversation_id, query, model_name, mode, lane)
+            self.sessions[session.id] = session
+            self._active[conversation_id] = session
+            waiting = self._queues.setdefault(lane, deque())
+            waiting.append(session)
+            self._dispatch()
+            if session.status == SessionStatus.QUEUED:
+                session.put("progress", f"排队中，前面还有 {waiting.index(session)} 个请求")
+        return session
+
+    def get(self, session_id: str) -> Optional[GenerationSession]:
+        return self.sessions.get(session_id)
+
+    def active(self, conversation_id: str) -> Optional[GenerationSession]:
+        return self._active.get(conversation_id)
+
+    def position(self, session: GenerationSession) -> int:
+        """排在该会话前面、同一通道内等待的会话数；已开始或已结束时为 0。"""
+        with self._lock:
+            waiting = self._queues.get(session.lane, ())
+            return waiting.index(session) if session in waiting else 0
+
+    def cancel(self, session: GenerationSession) -> bool:
+        with self._lock:
+            if session.finished:
+                return False
+            session.token.cancel()
+            waiting = self._queues.get(session.lane)
+            if session.status == SessionStatus.QUEUED and waiting and session in waiting:
+                waiting.remove(session)
+                session.put("error", "操作已中断")
+                self._finish(session, SessionStatus.CANCELLED)
+                self._notify_positions(session.lane)
+        return True
+
+    def _dispatch(self):
+        while sum(self._running.values()) < self.max_workers:
+            ready = [
+                waiting[0] for lane, waiting in self._queues.items()
+                if waiting and self._running.get(lane, 0) < self.lane_limit(lane)
+            ]
+            if not ready:
+                break
+            session = min(ready, key=lambda s: s.created_at)
+            self._queues[session.lane].popleft()
+            self._running[session.lane] = self._running.get(session.lane, 0) + 1
+            session.status = SessionStatus.RUNNING
+            session.started_at = time.time()
+            self._executor.submit(self._run, session)
+            self._notify_positions(session.lane)
+
+    def _notify_positions(self, lane: str):
+        for position, session in enumerate(self._queues.get(lane, ())):
+            session.put("progress", f"排队中，前面还有 {position} 个请求")
+
+    def _finish(self, session: GenerationSession, status: str):
+        session.status = status
+        session.finished_at = time.time()
+        session.channel.close()
+        if self._active.get(session.conversation_id) is session:
+            del self._active[session.conversation_id]
+        self._finished.append(session.id)
+        while len(self._finished) > self.max_history:
+            self.sessions.pop(self._finished.popleft(), None)
+
+    def _loop(self) -> asyncio.AbstractEventLoop:
+        # 每个工作线程复用一个事件循环，不再为每个请求新建
+        loop = getattr(self._local, "loop", None)
+        if loop is None:
+            loop = self._local.loop = asyncio.new_event_loop()
+        return loop
+
+    def _run(self, session: GenerationSession):
+        status = SessionStatus.DONE
+        try:
+            with cancel_scope(session.token), conversation_scope(session.conversation_id):
+                self._loop().run_until_complete(self.runner(session))
+        except Exception as e:
+            print(f"生成会话失败: {str(e)}")
+            session.error = str(e)
+            session.put("error", f"生成失败：{str(e)}")
+            status = SessionStatus.FAILED
+        finally:
+            with self._lock:
+                if session.error and status == SessionStatus.DONE:
+                    status = SessionStatus.FAILED
+                if session.token.cancelled:
+                    status = SessionStatus.CANCELLED
+                self._running[session.lane] -= 1
+                self._finish(session, status)
+                self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lanes = set(self._queues) | set(self._running)
+            return {
+                "max_workers": self.max_workers,
+                "running": sum(self._running.values()),
+                "queued": sum(len(waiting) for waiting in self._queues.values()),
+                "lanes": {
+                    lane: {
+                        "limit": self.lane_limit(lane),
+                        "running": self._running.get(lane, 0),
+                        "queued": len(self._queues.get(lane, ())),
+                    }
+                    for lane in sorted(lanes)
+                },
+                "active": [session.to_dict() for session in self._active.values()],
+            }
+
+
+def _run_generation(session: GenerationSession):
+    from utils import generate_answer
+    return generate_answer(session)
+
+
+generation_scheduler = GenerationScheduler(_run_generation, max_workers=load_config().get("generation_workers", 8))
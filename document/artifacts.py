@@ -0,0 +1,100 @@
+import os
+import json
+import threading
+from typing import Any, Callable, List, Optional
+
+from storage.chunk_store import ChunkStore
+
+_ARTIFACTS_FILE = "artifacts.json"
+
+DEFAULT_OUTLINE_SAMPLE_RATE = 10
+DEFAULT_SUMMARY_CHUNKS = 10
+
+
+class DocumentArtifacts:
+    """文档派生内容缓存：大纲采样、前 N 块摘要、LLM 生成的文档摘要等。
+
+    与一个分块集合绑定，version 是该分块集合的摘要值，分块变化后旧缓存自动失效。
+    directory 为空时只缓存在内存中。
+    """
+
+    def __init__(self, directory: Optional[str] = None, version: str = ""):
+        self.directory = directory
+        self.version = version
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.items.get(key, default)
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self.items[key] = value
+            self._save()
+
+    def get_or_build(self, key: str, build: Callable[[], Any]) -> Any:
+        if key not in self.items:
+            self.put(key, build())
+        return self.items[key]
+
+    def _save(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, _ARTIFACTS_FILE)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "items": self.items}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, version: str) -> "DocumentArtifacts":
+        artifacts = cls(directory, version)
+        path = os.path.join(directory, _ARTIFACTS_FILE)
+        if not os.path.exists(path):
+            return artifacts
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == version:
+                artifacts.items = data.get("items", {})
+        except Exception as e:
+            print(f"加载文档缓存失败: {str(e)}")
+        return artifacts
+
+
+def build_outline(chunks: ChunkStore, sample_rate: int = DEFAULT_OUTLINE_SAMPLE_RATE,
+                  preview_chars: int = 150) -> List[list]:
+    total = len(chunks)
+    step = max(1, total // sample_rate)
+    return [
+        [i, chunks.preview(i, preview_chars).replace("\n", " ")]
+        for i in range(0, total, step)
+    ]
+
+
+def build_summary(chunks: ChunkStore, n_chunks: int = DEFAULT_SUMMARY_CHUNKS) -> str:
+    n_chunks = min(n_chunks, len(chunks))
+    return "\n\n".join(
+        f"--- 文本块 {i} ---\n{text}" for i, text in enumerate(chunks.texts(0, n_chunks))
+    )
+
+
+def get_outline(conversation, sample_rate: int = DEFAULT_OUTLINE_SAMPLE_RATE) -> List[list]:
+    chunks = conversation.document_chunks
+    return conversation.document_artifacts.get_or_build(
+        f"outline:{sample_rate}", lambda: build_outline(chunks, sample_rate)
+    )
+
+
+def get_summary(conversation, n_chunks: int = DEFAULT_SUMMARY_CHUNKS) -> str:
+    chunks = conversation.document_chunks
+    n_chunks = min(n_chunks, len(chunks))
+    return conversation.document_artifacts.get_or_build(
+        f"summary:{n_chunks}", lambda: build_summary(chunks, n_chunks)
+    )
+
+
+def precompute_artifacts(conversation):
+    from document.headings import get_headings
+
+    get_outline(conversation)
+    get_summary(conversation)
+    get_headings(conversation)
@@ -0,0 +1,81 @@
+import re
+from typing import List, Set
+
+import numpy as np
+
+from storage.chunk_store import ChunkStore, NO_SECTION
+
+_NORMALIZE_RE = re.compile(r"[\s\W_]+")
+
+
+def build_heading_index(chunks: ChunkStore) -> List[dict]:
+    """按文档顺序列出各章节：标题、层级、标题路径及覆盖的块范围 [start, end)。
+
+    上级章节的范围包含其所有下级章节。
+    """
+    sections = np.asarray(chunks.section)
+    valid = np.flatnonzero(sections != NO_SECTION)
+    if not len(valid):
+        return []
+
+    ids, first = np.unique(sections[valid], return_index=True)
+    _, last = np.unique(sections[valid][::-1], return_index=True)
+    last = len(valid) - 1 - last
+
+    entries = []
+    for section, i, j in zip(ids, first, last):
+        path = chunks.headings[section] if section < len(chunks.headings) else []
+        if not path:
+            continue
+        entries.append({
+            "section": int(section),
+            "level": len(path),
+            "title": path[-1],
+            "path": " > ".join(path),
+            "start": int(valid[i]),
+            "end": int(valid[j]) + 1,
+        })
+    entries.sort(key=lambda entry: (entry["start"], entry["level"]))
+
+    stack = []
+    for entry in entries:
+        while stack and stack[-1]["level"] >= entry["level"]:
+            stack.pop()
+        for parent in stack:
+            parent["end"] = max(parent["end"], entry["end"])
+        stack.append(entry)
+    return entries
+
+
+def get_headings(conversation) -> List[dict]:
+    chunks = conversation.document_chunks
+    return conversation.document_artifacts.get_or_build("headings", lambda: build_heading_index(chunks))
+
+
+def _normalize(text: str) -> str:
+    return _NORMALIZE_RE.sub("", text).lower()
+
+
+def match_sections(headings: List[dict], query: str, min_chars: int = 2) -> Set[int]:
+    """找出标题出现在问题中的章节（含其下级章节），用于检索时优先这些章节。"""
+    normalized_query = _normalize(query)
+    if not normalized_query:
+        return set()
+
+    matched = set()
+    for entry in headings:
+        title = _normalize(entry["title"])
+        if len(title) >= min_chars and title in normalized_query:
+            matched.add(entry["path"])
+
+    return {
+        entry["section"] for entry in headings
+        if any(entry["path"] == path or entry["path"].startswith(path + " > ") for path in matched)
+    }
+
+
+def format_headings(headings: List[dict]) -> str:
+    return "\n".join(
+        "  " * (entry["level"] - 1) + f"- {entry['title']}（块 {entry['start']}-{entry['end'] - 1}）"
+        for entry in headings
+    )
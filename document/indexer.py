@@ -0,0 +1,329 @@
+import os
+import json
+import shutil
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+from config.context import get_chunk_config, get_context_profile
+from document.artifacts import DocumentArtifacts, precompute_artifacts
+from llm.embeddings import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    get_embedding_model,
+    get_embedding_namespace,
+    has_vector_search
+)
+from llm.tokens import estimate_tokens
+from storage.chunk_store import ChunkStore
+from storage.conversation import conversation_manager
+from storage.retriever import build_keyword_index
+
+_SOURCE_DIR = "source"
+_META_FILE = "document.json"
+_EMBEDDINGS_FILE = "embeddings.npz"
+
+
+_index_locks: Dict[str, threading.RLock] = {}
+_index_locks_guard = threading.Lock()
+
+
+def index_lock(conversation_id: str) -> threading.RLock:
+    """对话文档索引（分块、FAISS、向量缓存）的写锁，入库任务和问答时的索引重建共用。"""
+    with _index_locks_guard:
+        return _index_locks.setdefault(conversation_id, threading.RLock())
+
+
+class StagedDocument:
+    """入库任务在暂存目录中建立的文档索引。
+
+    与对话的文档字段同名，分块、索引和摘要函数可以直接作用于它；任务完成后由 commit_document
+    换入对话，失败或取消时 discard 删除，对话原有的文档不受影响。
+    """
+
+    def __init__(self, conversation_id: str, path: str):
+        self.id = conversation_id
+        self.path = path
+        self.vector_store = None
+        self.keyword_index = None
+        self.parent_index = None
+        self.chunk_profile = None
+        self.document_summary = None
+        self.document_chunks = ChunkStore()
+        self.document_pages = ChunkStore()
+        self.document_artifacts = DocumentArtifacts()
+
+    def discard(self):
+        self.document_chunks.close()
+        self.document_pages.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def stage_document(conversation_id: str, job_id: str) -> StagedDocument:
+    path = os.path.join(conversation_manager.staging_dir, job_id)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return StagedDocument(conversation_id, path)
+
+
+def commit_document(conversation, staged: StagedDocument, document_file: str):
+    """把暂存的文档索引换入对话：替换磁盘上的文档目录并接管内存中的分块和索引，旧文档随之释放。"""
+    document_path = conversation_manager.get_document_path(conversation.id)
+    with index_lock(conversation.id):
+        conversation.clear_document()
+        os.replace(staged.path, document_path)
+        # 复用其他对话的索引时分块里记录的是原对话的文件名，统一为本次上传的文件名
+        _set_source(staged, document_file)
+        conversation.document_file = document_file
+
+        conversation.document_pages = staged.document_pages
+        conversation.document_chunks = staged.document_chunks
+        conversation.chunk_profile = staged.chunk_profile
+        conversation.keyword_index = staged.keyword_index
+        conversation.parent_index = staged.parent_index
+        conversation.vector_store = staged.vector_store
+        conversation.document_summary = staged.document_summary
+        conversation.document_artifacts = staged.document_artifacts
+        if staged.chunk_profile:
+            # 已打开的映射不受目录改名影响，派生缓存改写到新位置
+            conversation.document_artifacts.directory = _chunks_dir(document_path, staged.chunk_profile)
+
+    staged.document_pages = ChunkStore()
+    staged.document_chunks = ChunkStore()
+
+
+def _set_source(conversation, source: str):
+    conversation.document_pages.source = source
+    conversation.document_chunks.source = source
+
+
+def _with_source(documents: Iterable[Document], source: str) -> Iterator[Document]:
+    for document in documents:
+        document.metadata["source"] = source
+        yield document
+
+
+def _document_path(conversation) -> str:
+    if isinstance(conversation, StagedDocument):
+        return conversation.path
+    return conversation_manager.get_document_path(conversation.id)
+
+
+def _chunks_dir(document_path: str, profile: str) -> str:
+    return os.path.join(document_path, f"chunks-{profile}")
+
+
+def _read_meta(document_path: str) -> dict:
+    meta_path = os.path.join(document_path, _META_FILE)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_meta(document_path: str, meta: dict):
+    with open(os.path.join(document_path, _META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def split_documents(documents: Iterable[Document], model_name: str) -> Iterator[Document]:
+    """逐个文档切分并依次产出块，可以直接消费流式加载器的输出。
+
+    文档自带 start_index（在原文中的位置）时，块的 start_index 换算为原文中的位置。
+    """
+    chunk_config = get_chunk_config(model_name)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_config["chunk_size"],
+        chunk_overlap=chunk_config["chunk_overlap"],
+        length_function=estimate_tokens,
+        add_start_index=True
+    )
+    chunk_index = 0
+    for document in documents:
+        base = document.metadata.get("start_index", 0)
+        for chunk in text_splitter.split_documents([document]):
+            chunk.metadata["start_index"] += base
+            chunk.metadata["chunk_index"] = chunk_index
+            chunk_index += 1
+            yield chunk
+
+
+def _build_vector_store(conversation, chunks: ChunkStore, base_url: str, backend: str):
+    document_path = _document_path(conversation)
+    cache_path = os.path.join(document_path, _EMBEDDINGS_FILE)
+    cache = EmbeddingCache.load(cache_path, get_embedding_namespace(backend))
+
+    embedding = CachedEmbeddings(get_embedding_model(base_url, backend), cache)
+    vector_store = FAISS.from_documents(chunks.to_documents(), embedding)
+    cache.save(cache_path)
+    return vector_store
+
+
+def _apply_chunks(conversation, chunks: ChunkStore, profile: str, chunks_dir: str):
+    previous = conversation.document_chunks
+    conversation.document_chunks = chunks
+    # 重新分块时释放旧分块的文件映射
+    if previous is not None and previous is not chunks:
+        previous.close()
+    conversation.chunk_profile = profile
+    conversation.keyword_index = None
+    conversation.parent_index = None
+    conversation.vector_store = None
+
+    artifacts = DocumentArtifacts.load(chunks_dir, chunks.digest)
+    summary = artifacts.get("document_summary")
+    if summary:
+        conversation.document_summary = summary
+    elif conversation.document_summary:
+        # 文档摘要与分块方式无关，重新分块后沿用
+        artifacts.put("document_summary", conversation.document_summary)
+    conversation.document_artifacts = artifacts
+
+
+def _chunk_and_store(conversation, documents: Iterable[Document], model_name: str) -> ChunkStore:
+    profile = get_context_profile(model_name)
+    document_path = _document_path(conversation)
+    chunks_dir = _chunks_dir(document_path, profile)
+
+    if not ChunkStore.exists(chunks_dir):
+        ChunkStore.write(chunks_dir, split_documents(documents, model_name))
+
+    chunks = ChunkStore.load(chunks_dir)
+    _apply_chunks(conversation, chunks, profile, chunks_dir)
+    conversation.keyword_index = build_keyword_index(chunks)
+    precompute_artifacts(conversation)
+
+    meta = _read_meta(document_path)
+    meta["profile"] = profile
+    _write_meta(document_path, meta)
+    return chunks
+
+
+def index_document(
+    staged: StagedDocument,
+    documents: Iterable[Document],
+    model_name: str,
+    provider: str,
+    base_url: Optional[str] = None,
+    backend: Optional[str] = None,
+    progress: Optional[Callable[[str], None]] = None,
+    content_hash: Optional[str] = None,
+    source: Optional[str] = None
+) -> ChunkStore:
+    """在暂存目录中解析、分块并建立索引，完成后由调用方 commit_document 换入对话。
+
+    source 为用户上传时的文件名，写入每个块的 source 元数据，代替加载器记录的临时上传路径。
+    """
+    progress = progress or (lambda message: None)
+    if source:
+        documents = _with_source(documents, source)
+
+    if content_hash:
+        _write_meta(staged.path, {"content_hash": content_hash})
+
+    # 原文先逐段写入磁盘再以 mmap 打开，分块时从映射区逐段读取，内存占用与文件大小无关
+    source_dir = os.path.join(staged.path, _SOURCE_DIR)
+    ChunkStore.write(source_dir, documents)
+    staged.document_pages = ChunkStore.load(source_dir)
+
+    progress("文档已解析，正在分块...")
+    chunks = _chunk_and_store(staged, staged.document_pages, model_name)
+
+    progress(f"已分块 {len(chunks)} 个，正在建立索引...")
+    if has_vector_search(provider, backend):
+        staged.vector_store = _build_vector_store(staged, chunks, base_url, backend)
+
+    return chunks
+
+
+def find_document_by_hash(content_hash: str) -> Optional[str]:
+    """按原文件内容哈希查找已建好索引的文档，返回其所属对话 id。"""
+    documents_dir = conversation_manager.documents_dir
+    if not content_hash or not os.path.isdir(documents_dir):
+        return None
+    for conversation_id in os.listdir(documents_dir):
+        meta = _read_meta(os.path.join(documents_dir, conversation_id))
+        if meta.get("content_hash") == content_hash and meta.get("profile"):
+            return conversation_id
+    return None
+
+
+def copy_document_index(staged: StagedDocument, source_conversation_id: str):
+    """复用已入库的相同文档的分块、向量缓存和摘要，不重新解析和向量化。"""
+    with index_lock(source_conversation_id):
+        shutil.copytree(
+            conversation_manager.get_document_path(source_conversation_id),
+            staged.path,
+            dirs_exist_ok=True
+        )
+    load_document_index(staged)
+
+
+def set_document_summary(conversation, summary: str):
+    conversation.document_summary = summary
+    conversation.document_artifacts.put("document_summary", summary)
+
+
+def load_document_index(conversation):
+    document_path = _document_path(conversation)
+    profile = _read_meta(document_path).get("profile")
+    if not profile:
+        return
+
+    try:
+        source_dir = os.path.join(document_path, _SOURCE_DIR)
+        if ChunkStore.exists(source_dir):
+            conversation.document_pages = ChunkStore.load(source_dir)
+
+        chunks_dir = _chunks_dir(document_path, profile)
+        if ChunkStore.exists(chunks_dir):
+            _apply_chunks(conversation, ChunkStore.load(chunks_dir), profile, chunks_dir)
+
+        # 早期版本建立的分块记录的是临时上传路径，加载时改用对话记录的原文件名
+        document_file = getattr(conversation, "document_file", None)
+        if document_file:
+            _set_source(conversation, document_file)
+    except Exception as e:
+        print(f"加载文档索引失败: {str(e)}")
+
+
+def ensure_document_index(
+    conversation,
+    model_name: str,
+    provider: str,
+    base_url: Optional[str] = None,
+    backend: Optional[str] = None
+):
+    """让文档索引与当前模型匹配：上下文档位变化时重新分块，向量索引缺失时重建。
+
+    重新分块后内容未变的块直接复用持久化的向量缓存，不会重复调用向量化服务。
+    """
+    if not conversation:
+        return
+
+    # 另一线程正在换入新文档或重建索引时不等待，本轮沿用现有索引（向量索引缺失时检索只用关键词）
+    lock = index_lock(conversation.id)
+    if not lock.acquire(blocking=False):
+        print("文档索引正在更新，本轮使用现有索引")
+        return
+    try:
+        if not conversation.document_chunks:
+            return
+
+        profile = get_context_profile(model_name)
+        if profile != conversation.chunk_profile and conversation.document_pages:
+            print(f"模型上下文档位变为 {profile}，重新分块文档")
+            _chunk_and_store(conversation, conversation.document_pages, model_name)
+
+        if conversation.vector_store is None and has_vector_search(provider, backend):
+            try:
+                conversation.vector_store = _build_vector_store(
+                    conversation, conversation.document_chunks, base_url, backend
+                )
+            except Exception as e:
+                print(f"重建向量索引失败: {str(e)}")
+    finally:
+        lock.release()
@@ -0,0 +1,377 @@
+import os
+import json
+import time
+import shutil
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Deque, Dict, Iterable, Iterator, List, Optional
+
+from config.manager import load_config
+from core.broker import Channel
+from core.cancel import CancelToken, cancel_scope
+from storage.conversation import conversation_manager
+
+PROGRESS_BYTES = 4 * 1024 * 1024
+
+
+class JobPhase:
+    QUEUED = "queued"
+    PARSING = "parsing"
+    INDEXING = "indexing"
+    SUMMARIZING = "summarizing"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class IngestionJob:
+    conversation_id: str
+    filename: str
+    file_ext: str
+    file_path: str
+    model_name: str
+    content_hash: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    phase: str = JobPhase.QUEUED
+    progress: float = 0.0
+    message: str = "等待处理"
+    error: Optional[str] = None
+    total_chunks: int = 0
+    cancel_requested: bool = False
+    resumed: bool = False
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    @property
+    def finished(self) -> bool:
+        return self.phase in JobPhase.FINISHED
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class JobEvents(Channel):
+    """单个任务的事件记录（进度、摘要片段、结束状态），只保留最近 max_events 条，可被多个订阅者从任意位置读取。"""
+
+    def __init__(self, job_id: str, max_events: int = 1024):
+        super().__init__(job_id, max_events)
+
+    def put(self, event_type: str, content: str = ""):
+        self.publish(event_type, content)
+
+
+class IngestionJobQueue:
+    """文档入库任务队列。
+
+    上传只负责保存文件并提交任务，解析、分块、建索引和生成摘要在有界线程池中执行，
+    不占用回答生成的调度名额。任务状态持久化在 jobs 目录下，服务重启后由 recover()
+    重新排队未完成的任务，源文件已丢失的任务标记为失败并清理半成品。
+    """
+
+    def __init__(self, jobs_dir: str, uploads_dir: str, max_workers: int = 2, max_history: int = 100):
+        self.jobs_dir = jobs_dir
+        self.uploads_dir = uploads_dir
+        self.max_history = max_history
+        self.jobs: Dict[str, IngestionJob] = {}
+        self.events: Dict[str, JobEvents] = {}
+        self._finished: Deque[str] = deque()
+        self._tokens: Dict[str, CancelToken] = {}
+        self._recovered = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.uploads_dir, exist_ok=True)
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job: IngestionJob):
+        with self._save_lock:
+            job.updated_at = datetime.now().isoformat()
+            with open(self._job_path(job.id), "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def upload_path(self, file_ext: str) -> str:
+        return os.path.join(self.uploads_dir, f"{uuid.uuid4().hex}.{file_ext}")
+
+    def submit(self, conversation_id: str, filename: str, file_ext: str, file_path: str,
+               model_name: str, content_hash: Optional[str] = None) -> IngestionJob:
+        with self._lock:
+            if self.active_job(conversation_id):
+                raise ValueError("该对话已有文档正在处理")
+            job = IngestionJob(conversation_id, filename, file_ext, file_path, model_name, content_hash)
+            self.jobs[job.id] = job
+            self.events[job.id] = JobEvents(job.id)
+            self._save(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def get_events(self, job_id: str) -> Optional[JobEvents]:
+        return self.events.get(job_id)
+
+    def list_jobs(self, conversation_id: Optional[str] = None) -> List[IngestionJob]:
+        jobs = [job for job in list(self.jobs.values()) if not conversation_id or job.conversation_id == conversation_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def active_job(self, conversation_id: str) -> Optional[IngestionJob]:
+        for job in list(self.jobs.values()):
+            if job.conversation_id == conversation_id and not job.finished:
+                return job
+        return None
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        job.cancel_requested = True
+        job.message = "正在取消..."
+        self._save(job)
+        # 中断摘要阶段进行中的模型请求，不必等当前这一组生成完
+        token = self._tokens.get(job_id)
+        if token:
+            token.cancel()
+        return True
+
+    def _update(self, job: IngestionJob, phase: str, progress: Optional[float], message: str):
+        job.phase = phase
+        if progress is not None:
+            job.progress = progress
+        job.message = message
+        self._save(job)
+        self.events[job.id].put("progress", message)
+
+    def _check_cancelled(self, job: IngestionJob):
+        if job.cancel_requested:
+            raise JobCancelled()
+
+    def _finish(self, job: IngestionJob, phase: str, event_type: str, message: str):
+        job.phase = phase
+        job.message = message
+        if phase == JobPhase.DONE:
+            job.progress = 1.0
+        self._save(job)
+        events = self.events[job.id]
+        events.put(event_type, message)
+        events.close()
+        self._retire(job.id)
+        if os.path.exists(job.file_path):
+            try:
+                os.unlink(job.file_path)
+            except OSError:
+                pass
+
+    def _retire(self, job_id: str):
+        """已结束的任务只在内存中保留最近 max_history 个，更早的连同事件记录一起移除（任务文件仍在磁盘上）。"""
+        with self._lock:
+            self._finished.append(job_id)
+            while len(self._finished) > self.max_history:
+                expired = self._finished.popleft()
+                self.jobs.pop(expired, None)
+                self.events.pop(expired, None)
+
+    def _run(self, job: IngestionJob):
+        token = self._tokens[job.id] = CancelToken()
+        if job.cancel_requested:
+            token.cancel()
+        try:
+            with cancel_scope(token):
+                self._execute(job)
+        finally:
+            self._tokens.pop(job.id, None)
+
+    def _execute(self, job: IngestionJob):
+        from core import state
+        from document.indexer import stage_document
+
+        # 新文档在暂存目录中建立索引，完成后才换入对话；失败或取消时对话保留原有文档
+        staged = None
+        try:
+            conversation = state.conversations.get(job.conversation_id)
+            if not conversation:
+                raise ValueError("对话不存在")
+            staged = stage_document(conversation.id, job.id)
+            self._process(job, conversation, state, staged)
+        except JobCancelled:
+            self._finish(job, JobPhase.CANCELLED, "error", "操作已中断")
+        except Exception as e:
+            print(f"文档处理失败: {str(e)}")
+            job.error = str(e)
+            self._finish(job, JobPhase.FAILED, "error", f"处理失败：{str(e)}")
+        finally:
+            if staged:
+                staged.discard()
+
+    def _process(self, job: IngestionJob, conversation, state, staged):
+        from utils import load_document
+        from llm.helpers import get_active_model_name
+        from document.indexer import (
+            index_document,
+            commit_document,
+            set_document_summary,
+            find_document_by_hash,
+            copy_document_index
+        )
+        from document.summary_tree import build_document_summary_tree
+
+        events = self.events[job.id]
+        source_id = find_document_by_hash(job.content_hash)
+        if source_id:
+            self._update(job, JobPhase.INDEXING, 0.5, "检测到相同的文档，复用已有索引...")
+            copy_document_index(staged, source_id)
+        else:
+            self._update(job, JobPhase.PARSING, 0.05, "正在解析文档...")
+            docs = load_document(job.file_path, job.file_ext)
+            self._check_cancelled(job)
+
+            index_document(
+                staged,
+                self._read_documents(job, docs),
+                model_name=get_active_model_name(job.model_name),
+                provider=state.llm_provider,
+                base_url=state.ollama_base_url,
+                backend=state.embedding_backend,
+                progress=lambda message: self._update(job, JobPhase.INDEXING, 0.2, message),
+                content_hash=job.content_hash,
+                source=job.filename
+            )
+        job.total_chunks = len(staged.document_chunks)
+        self._check_cancelled(job)
+
+        self._update(job, JobPhase.SUMMARIZING, 0.6, "正在生成摘要...")
+        message = f"{job.file_ext.upper()}文件解析完成，共生成 {job.total_chunks} 个文本块"
+        summary = staged.document_summary
+        if summary:
+            events.put("chunk", summary)
+        else:
+            def summary_progress(level, done, total):
+                progress = min(0.95, 0.6 + 0.35 * (level + done / total) / (level + 2))
+                self._update(job, JobPhase.SUMMARIZING, progress, f"正在生成摘要：第 {level + 1} 层 {done}/{total}")
+
+            try:
+                tree = build_document_summary_tree(
+                    staged,
+                    job.model_name,
+                    max_workers=state.summary_workers,
+                    progress=summary_progress,
+                    should_stop=lambda: job.cancel_requested,
+                    on_token=lambda piece: events.put("chunk", piece)
+                )
+            except Exception as e:
+                # 取消会直接断开进行中的请求，由此产生的异常按取消处理
+                self._check_cancelled(job)
+                print(f"生成文档摘要失败: {str(e)}")
+                message += "（摘要生成失败）"
+            else:
+                self._check_cancelled(job)
+                if tree:
+                    summary = tree.root.text
+                    set_document_summary(staged, summary)
+
+        commit_document(conversation, staged, job.filename)
+        conversation_manager.set_document(conversation.id, job.filename)
+        if summary:
+            self._record_summary(job, conversation, state, summary)
+        self._finish(job, JobPhase.DONE, "done", message)
+
+    def _read_documents(self, job: IngestionJob, docs: Iterable) -> Iterator:
+        """流式加载的文档边读边检查取消，并按已读取的字节数报告进度。"""
+        total = max(1, os.path.getsize(job.file_path))
+        reported = 0
+        for doc in docs:
+            self._check_cancelled(job)
+            offset = doc.metadata.get("byte_offset")
+            if offset is not None and offset - reported >= PROGRESS_BYTES:
+                reported = offset
+                self._update(job, JobPhase.PARSING, 0.05 + 0.15 * offset / total,
+                             f"正在读取文档：{offset * 100 // total}%")
+            yield doc
+
+    def _record_summary(self, job: IngestionJob, conversation, state, summary_text: str):
+        user_message = f"上传文档《{job.filename}》，请总结"
+        conversation.add_message("user", user_message)
+        conversation.add_message("assistant", summary_text)
+        state.persist_message("user", user_message, conversation_id=conversation.id)
+        state.persist_message("assistant", summary_text, conversation_id=conversation.id)
+
+    def recover(self, retention_seconds: int = 24 * 3600):
+        """服务启动时调用：未完成且源文件仍在的任务重新排队，其余标记失败；上次中断留下的暂存索引一并清理。"""
+        from document.uploads import upload_sessions
+
+        # 同一进程只恢复一次，之后的调用直接返回
+        if self._recovered:
+            return
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+
+        upload_sessions.cleanup(retention_seconds)
+        shutil.rmtree(conversation_manager.staging_dir, ignore_errors=True)
+        now = time.time()
+        for filename in os.listdir(self.jobs_dir):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.jobs_dir, filename)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = IngestionJob(**json.load(f))
+            except Exception as e:
+                print(f"读取任务失败 {filename}: {str(e)}")
+                continue
+
+            if job.finished:
+                if now - os.path.getmtime(path) > retention_seconds:
+                    os.unlink(path)
+                else:
+                    self.jobs[job.id] = job
+                    self.events[job.id] = JobEvents(job.id)
+                    self.events[job.id].close()
+                    self._retire(job.id)
+                continue
+
+            self.jobs[job.id] = job
+            self.events[job.id] = JobEvents(job.id)
+            if job.cancel_requested or not os.path.exists(job.file_path):
+                reason = "操作已中断" if job.cancel_requested else "服务重启时上传文件已丢失"
+                self._finish(job, JobPhase.CANCELLED if job.cancel_requested else JobPhase.FAILED, "error", reason)
+                continue
+
+            print(f"恢复未完成的文档任务: {job.filename}")
+            job.phase = JobPhase.QUEUED
+            job.progress = 0.0
+            job.message = "服务重启，重新处理"
+            job.resumed = True
+            self._save(job)
+            self._executor.submit(self._run, job)
+
+        for filename in os.listdir(self.uploads_dir):
+            path = os.path.join(self.uploads_dir, filename)
+            if os.path.isdir(path):
+                continue
+            if not any(job.file_path == path for job in self.jobs.values() if not job.finished):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+
+ingestion_jobs = IngestionJobQueue(
+    conversation_manager.jobs_dir,
+    conversation_manager.uploads_dir,
+    max_workers=load_config().get("ingestion_workers", 2)
+)
@@ -1,44 +1,339 @@
+import re
+import csv
+import json
+import codecs
+from typing import Iterable, Iterator, List, Optional, Tuple
+
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 from docx import Document as DocxDocument
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from docx.table import Table
 from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaEmbeddings
+from llm.embeddings import get_embedding_model, has_vector_search
+from document.indexer import split_documents
+
+_HEADING_STYLE_RE = re.compile(r"^(?:heading|标题)\s*(\d)$", re.IGNORECASE)
+_MARKDOWN_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class _SectionBuilder:
+    """按标题层级切分正文：每个章节输出一个 Document，metadata 带章节编号和标题路径。"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.documents: List[Document] = []
+        self.stack: List[tuple] = []
+        self.section: Optional[int] = None
+        self.lines: List[str] = []
+        self.page: Optional[int] = None
+        self.count = 0
+
+    def heading(self, level: int, title: str):
+        self.flush()
+        while self.stack and self.stack[-1][0] >= level:
+            self.stack.pop()
+        self.stack.append((level, title))
+        self.section = self.count
+        self.count += 1
+        # 标题本身作为章节首行，只有标题没有正文的章节也能被检索和编入目录
+        self.lines = [title]
+
+    def text(self, text: str):
+        if text.strip():
+            self.lines.append(text)
+
+    def flush(self):
+        text = "\n".join(self.lines).strip()
+        if text:
+            metadata = {"source": self.source}
+            if self.page is not None:
+                metadata["page"] = self.page
+            if self.section is not None:
+                metadata["section"] = self.section
+                metadata["heading_path"] = [title for _, title in self.stack]
+            self.documents.append(Document(page_content=text, metadata=metadata))
+        self.lines = []
+
+
+def _docx_heading_level(paragraph) -> int:
+    style_name = paragraph.style.name if paragraph.style is not None else ""
+    match = _HEADING_STYLE_RE.match(style_name.strip())
+    return int(match.group(1)) if match else 0
+
+
+def _table_text(table: Table) -> str:
+    rows = []
+    for row in table.rows:
+        cells = []
+        for cell in row.cells:
+            text = cell.text.strip().replace("\n", " ")
+            # 合并单元格会重复返回同一个单元格
+            if not cells or cells[-1] != text:
+                cells.append(text)
+        if any(cells):
+            rows.append("| " + " | ".join(cells) + " |")
+    return "\n".join(rows)
+
+
+def load_docx(file_path: str) -> List[Document]:
+    doc = DocxDocument(file_path)
+    builder = _SectionBuilder(file_path)
+    for block in doc.iter_inner_content():
+        if isinstance(block, Table):
+            builder.text(_table_text(block))
+            continue
+        level = _docx_heading_level(block)
+        if level and block.text.strip():
+            builder.heading(level, block.text.strip())
+        else:
+            builder.text(block.text)
+    builder.flush()
+    return builder.documents
+
+
+def _pdf_outline(file_path: str) -> List[tuple]:
+    """读取 PDF 书签，返回 [(页码, 层级, 标题)]，没有书签时为空。"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    entries = []
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            if page is not None and page >= 0 and item.title and item.title.strip():
+                entries.append((page, level, item.title.strip()))
+
+    try:
+        walk(reader.outline, 1)
+    except Exception as e:
+        print(f"读取 PDF 书签失败: {str(e)}")
+        return []
+    return sorted(entries, key=lambda entry: entry[0])
+
+
+def load_pdf(file_path: str) -> List[Document]:
+    pages = PyPDFLoader(file_path).load()
+    outline = _pdf_outline(file_path)
+    if not outline:
+        return pages
+
+    builder = _SectionBuilder(file_path)
+    position = 0
+    for page_number, page in enumerate(pages):
+        builder.flush()
+        builder.page = page.metadata.get("page", page_number)
+        text = page.page_content
+        cursor = 0
+        while position < len(outline) and outline[position][0] <= page_number:
+            _, level, title = outline[position]
+            # 标题在页内出现时从标题处切开，否则整页归入该章节
+            found = text.find(title, cursor)
+            if found >= 0:
+                builder.text(text[cursor:found])
+                cursor = found + len(title)
+            builder.heading(level, title)
+            position += 1
+        builder.text(text[cursor:])
+    builder.flush()
+    return builder.documents
+
+
+def _iter_lines(file_path: str) -> Iterator[Tuple[int, int, str]]:
+    """逐行读取 UTF-8 文本，产出 (行首字节位置, 行首字符位置, 行文本)。
+
+    单行最多读取 STREAM_BLOCK_SIZE 字节，超长的行被拆成多段，避免一次读入整行。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    byte_offset = 0
+    char_offset = 0
+    with open(file_path, "rb") as f:
+        while True:
+            raw = f.readline(STREAM_BLOCK_SIZE)
+            if not raw:
+                break
+            line = decoder.decode(raw)
+            if byte_offset == 0 and line.startswith("\ufeff"):
+                line = line[1:]
+            yield byte_offset, char_offset, line
+            byte_offset += len(raw)
+            char_offset += len(line)
+
+
+class _BlockBuilder:
+    """把连续的行累积成约 STREAM_BLOCK_SIZE 个字符的文本段，每段记录在原文件中的字节和字符位置。"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.lines: List[str] = []
+        self.size = 0
+        self.byte_offset = 0
+        self.start_index = 0
+        self.metadata = {}
+
+    def add(self, byte_offset: int, char_offset: int, line: str) -> Optional[Document]:
+        document = self.flush() if self.size >= STREAM_BLOCK_SIZE else None
+        if not self.lines:
+            self.byte_offset = byte_offset
+            self.start_index = char_offset
+        self.lines.append(line)
+        self.size += len(line)
+        return document
+
+    def flush(self) -> Optional[Document]:
+        text = "".join(self.lines)
+        self.lines = []
+        self.size = 0
+        if not text.strip():
+            return None
+        metadata = {"source": self.source, "byte_offset": self.byte_offset, "start_index": self.start_index}
+        metadata.update(self.metadata)
+        return Document(page_content=text, metadata=metadata)
+
+
+def iter_text(file_path: str) -> Iterator[Document]:
+    builder = _BlockBuilder(file_path)
+    for byte_offset, char_offset, line in _iter_lines(file_path):
+        document = builder.add(byte_offset, char_offset, line)
+        if document:
+            yield document
+    document = builder.flush()
+    if document:
+        yield document
+
+
+def iter_markdown(file_path: str) -> Iterator[Document]:
+    """按 # 标题切分章节，章节内再按大小分段；代码块中的 # 行不视为标题。"""
+    builder = _BlockBuilder(file_path)
+    stack: List[tuple] = []
+    section = -1
+    in_code = False
+    for byte_offset, char_offset, line in _iter_lines(file_path):
+        if line.lstrip().startswith(("```", "~~~")):
+            in_code = not in_code
+        match = None if in_code else _MARKDOWN_HEADING_RE.match(line)
+        if match:
+            document = builder.flush()
+            if document:
+                yield document
+            level = len(match.group(1))
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, match.group(2).strip()))
+            section += 1
+            builder.metadata = {"section": section, "heading_path": [title for _, title in stack]}
+        document = builder.add(byte_offset, char_offset, line)
+        if document:
+            yield document
+    document = builder.flush()
+    if document:
+        yield document
+
+
+def _iter_records(file_path: str, parse) -> Iterator[Document]:
+    """逐条解析记录并渲染为文本行，多条记录合并成一段；byte_offset 是段内第一条记录的位置。"""
+    builder = _BlockBuilder(file_path)
+    position = 0
+    for byte_offset, text in parse(_iter_lines(file_path)):
+        document = builder.add(byte_offset, position, text + "\n")
+        position += len(text) + 1
+        if document:
+            yield document
+    document = builder.flush()
+    if document:
+        yield document
+
+
+def _format_record(record) -> str:
+    if isinstance(record, dict):
+        return "; ".join(
+            f"{key}: {value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)}"
+            for key, value in record.items()
+        )
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _parse_csv(lines) -> Iterator[Tuple[int, str]]:
+    # 多行字段会让一条记录跨多行，记录位置取读取该记录时的第一行
+    state = {"first": None}
+
+    def text_lines():
+        for byte_offset, _, line in lines:
+            if state["first"] is None:
+                state["first"] = byte_offset
+            yield line
+
+    reader = csv.reader(text_lines())
+    header = None
+    while True:
+        state["first"] = None
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            print(f"跳过无法解析的 CSV 行: {str(e)}")
+            continue
+        row_offset = state["first"]
+        if header is None:
+            header = row
+            continue
+        if any(cell.strip() for cell in row):
+            yield row_offset, _format_record(dict(zip(header, row)) if len(row) <= len(header) else row)
+
+
+def _parse_jsonl(lines) -> Iterator[Tuple[int, str]]:
+    for byte_offset, _, line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield byte_offset, _format_record(json.loads(line))
+        except json.JSONDecodeError:
+            yield byte_offset, line
+
+
+def iter_csv(file_path: str) -> Iterator[Document]:
+    return _iter_records(file_path, _parse_csv)
+
+
+def iter_jsonl(file_path: str) -> Iterator[Document]:
+    return _iter_records(file_path, _parse_jsonl)
 
 
-def get_embedding_model(base_url: str):
-    return OllamaEmbeddings(
-        model="nomic-embed-text",
-        base_url=base_url
-    )
+_STREAM_LOADERS = {
+    "txt": iter_text,
+    "md": iter_markdown,
+    "csv": iter_csv,
+    "jsonl": iter_jsonl,
+}
 
 
-def load_document(file_path, file_type):
+def load_document(file_path, file_type) -> Iterable[Document]:
+    """pdf/docx 返回章节列表；纯文本类文件返回流式生成器，边读边分段，不会一次读入整个文件。"""
     if file_type == "pdf":
-        loader = PyPDFLoader(file_path)
-        return loader.load()
+        return load_pdf(file_path)
     elif file_type == "docx":
-        doc = DocxDocument(file_path)
-        text = "\n".join([para.text for para in doc.paragraphs])
-        return [Document(page_content=text, metadata={"source": file_path})]
-    elif file_type == "txt":
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
-        return [Document(page_content=text, metadata={"source": file_path})]
+        return load_docx(file_path)
+    elif file_type in _STREAM_LOADERS:
+        return _STREAM_LOADERS[file_type](file_path)
     return []
 
 
-def process_document(documents, base_url: str):
+def process_document(documents, base_url: str, model_name: str = "qwen3.5:9b"):
     from core import state
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = text_splitter.split_documents(documents)
+    chunks = list(split_documents(documents, model_name))
     
-    if state.llm_provider == "ollama":
+    if has_vector_search(state.llm_provider):
         embedding = get_embedding_model(base_url)
         vector_store = FAISS.from_documents(chunks, embedding)
         return vector_store
@@ -0,0 +1,230 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable, List, Optional
+
+from llm.tokens import estimate_tokens
+from storage.chunk_store import ChunkStore
+
+LEAF_PROMPT = """请概括以下文档片段的要点，保留关键事实、数据和结论，不要添加片段中没有的内容。
+用与原文相同的语言回答，不超过 {max_words} 字。
+
+【文档片段】
+{text}
+
+要点："""
+
+MERGE_PROMPT = """以下是同一文档中连续几个部分的摘要，请将它们合并为一段连贯的摘要，
+保留主要论点和关键事实，去掉重复内容。用与原文相同的语言回答，不超过 {max_words} 字。
+
+【分部分摘要】
+{text}
+
+合并摘要："""
+
+ROOT_PROMPT = """请根据以下文档内容（或文档各部分的摘要）总结这个文档的主要内容。
+先用一两句话说明文档主题，再分条列出主要内容和结论。用与原文相同的语言回答。
+
+【内容】
+{text}
+
+文档摘要："""
+
+
+# 每次摘要调用为模型输出预留的 token 数（根节点的全文摘要最长）
+SUMMARY_OUTPUT_TOKENS = 1024
+
+
+@dataclass
+class SummaryNode:
+    start: int
+    end: int
+    text: str
+    tokens: int
+
+
+class SummaryTree:
+    """文档的分层摘要。
+
+    levels[0] 是叶子层，每个节点概括一组连续文本块 [start, end)；
+    上一层的每个节点合并下一层若干相邻节点，最后一层只有根节点（全文摘要）。
+    """
+
+    def __init__(self, levels: List[List[SummaryNode]]):
+        self.levels = levels
+
+    @property
+    def root(self) -> Optional[SummaryNode]:
+        return self.levels[-1][0] if self.levels else None
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def level_within(self, budget: int) -> List[SummaryNode]:
+        """返回 token 总数不超过预算的最详细的一层，都超出时返回根节点。"""
+        for level in self.levels:
+            if sum(node.tokens for node in level) <= budget:
+                return level
+        return [self.root] if self.root else []
+
+    def to_dict(self) -> dict:
+        return {"levels": [[asdict(node) for node in level] for level in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SummaryTree":
+        return cls([[SummaryNode(**node) for node in level] for level in data.get("levels", [])])
+
+
+def group_chunks(chunks: ChunkStore, group_tokens: int) -> List[tuple]:
+    groups = []
+    start = 0
+    size = 0
+    for i in range(len(chunks)):
+        tokens = int(chunks.token_count[i])
+        if i > start and size + tokens > group_tokens:
+            groups.append((start, i))
+            start = i
+            size = 0
+        size += tokens
+    if len(chunks):
+        groups.append((start, len(chunks)))
+    return groups
+
+
+def build_summary_tree(
+    chunks: ChunkStore,
+    summarize: Callable[[str, int], str],
+    group_tokens: int,
+    fanout: int = 4,
+    max_workers: int = 4,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    summarize_root: Optional[Callable[[str], str]] = None
+) -> Optional[SummaryTree]:
+    """自底向上构建摘要树（map-reduce）：同一层的各组在线程池中并行调用 summarize(text, level)。
+
+    progress(level, done, total) 在每个节点完成时回调；should_stop 返回 True 时放弃构建并返回 None。
+    summarize_root 不为空时，只剩一组的那一层（根节点）改用它生成，便于流式输出最终摘要。
+    """
+    should_stop = should_stop or (lambda: False)
+
+    def run_level(level: int, inputs: List[tuple]) -> Optional[List[SummaryNode]]:
+        done = [0]
+        lock = threading.Lock()
+
+        def summarize_group(index: int) -> Optional[SummaryNode]:
+            if should_stop():
+                return None
+            start, end, text = inputs[index]
+            if summarize_root and len(inputs) == 1:
+                summary = summarize_root(text).strip()
+            else:
+                summary = summarize(text, level).strip()
+            node = SummaryNode(start, end, summary, estimate_tokens(summary))
+            if progress:
+                with lock:
+                    done[0] += 1
+                    progress(level, done[0], len(inputs))
+            return node
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 每组在提交时的上下文副本中运行，取消令牌随之传入工作线程
+            futures = [executor.submit(contextvars.copy_context().run, summarize_group, index) for index in range(len(inputs))]
+            nodes = [future.result() for future in futures]
+        if should_stop() or any(node is None for node in nodes):
+            return None
+        return nodes
+
+    leaf_inputs = [(start, end, "\n".join(chunks.texts(start, end))) for start, end in group_chunks(chunks, group_tokens)]
+    if not leaf_inputs:
+        return None
+
+    levels = []
+    nodes = run_level(0, leaf_inputs)
+    while nodes is not None:
+        levels.append(nodes)
+        if len(nodes) == 1:
+            return SummaryTree(levels)
+        inputs = []
+        for i in range(0, len(nodes), fanout):
+            group = nodes[i:i + fanout]
+            inputs.append((group[0].start, group[-1].end, "\n\n".join(node.text for node in group)))
+        nodes = run_level(len(levels), inputs)
+    return None
+
+
+def make_summarizer(llm, max_words: int = 300) -> Callable[[str, int], str]:
+    from llm.helpers import get_text_content
+
+    def summarize(text: str, level: int) -> str:
+        prompt = LEAF_PROMPT if level == 0 else MERGE_PROMPT
+        response = llm.invoke(prompt.format(text=text, max_words=max_words))
+        return get_text_content(response.content)
+
+    return summarize
+
+
+def make_root_summarizer(
+    llm,
+    on_token: Callable[[str], None],
+    should_stop: Optional[Callable[[], bool]] = None
+) -> Callable[[str], str]:
+    from llm.helpers import get_text_content
+
+    should_stop = should_stop or (lambda: False)
+
+    def summarize_root(text: str) -> str:
+        parts = []
+        for chunk in llm.stream(ROOT_PROMPT.format(text=text)):
+            if should_stop():
+                break
+            piece = get_text_content(chunk.content)
+            if piece:
+                parts.append(piece)
+                on_token(piece)
+        return "".join(parts)
+
+    return summarize_root
+
+
+def get_summary_tree(conversation) -> Optional[SummaryTree]:
+    data = conversation.document_artifacts.get("summary_tree")
+    return SummaryTree.from_dict(data) if data else None
+
+
+def set_summary_tree(conversation, tree: SummaryTree):
+    conversation.document_artifacts.put("summary_tree", tree.to_dict())
+
+
+def build_document_summary_tree(
+    conversation,
+    model_name: str,
+    max_workers: int = 4,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    on_token: Optional[Callable[[str], None]] = None
+) -> Optional[SummaryTree]:
+    """用所选模型为文档构建摘要树；给出 on_token 时根节点（全文摘要）逐段流式回调。"""
+    from config.context import get_model_context_config
+    from llm.helpers import get_active_model_name, get_llm_model
+
+    # 每次调用的窗口 = 一组文本 + 提示词 + 输出预留，不超过模型的实际窗口；超出时缩小分组
+    config = get_model_context_config(get_active_model_name(model_name))
+    prompt_tokens = max(estimate_tokens(prompt) for prompt in (LEAF_PROMPT, MERGE_PROMPT, ROOT_PROMPT))
+    num_ctx = min(config["max_tokens"], config["context_budget"] + prompt_tokens + SUMMARY_OUTPUT_TOKENS)
+    group_tokens = num_ctx - prompt_tokens - SUMMARY_OUTPUT_TOKENS
+
+    llm = get_llm_model(temperature=0.3, model_name=model_name, num_ctx=num_ctx)
+    tree = build_summary_tree(
+        conversation.document_chunks,
+        make_summarizer(llm),
+        group_tokens=group_tokens,
+        max_workers=max_workers,
+        progress=progress,
+        should_stop=should_stop,
+        summarize_root=make_root_summarizer(llm, on_token, should_stop) if on_token else None
+    )
+    if tree:
+        set_summary_tree(conversation, tree)
+    return tree
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Optional
+
+from storage.conversation import conversation_manager
+
+COPY_BUFFER_SIZE = 64 * 1024
+SUPPORTED_EXTENSIONS = ("pdf", "docx", "txt", "md", "csv", "jsonl")
+SESSION_TTL_SECONDS = 24 * 3600
+
+
+def save_stream(stream: BinaryIO, path: str) -> str:
+    """把请求体分块写入磁盘并同时计算 SHA-256，内存占用只有一个缓冲区。"""
+    hasher = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            data = stream.read(COPY_BUFFER_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+            f.write(data)
+    return hasher.hexdigest()
+
+
+class UploadError(Exception):
+    pass
+
+
+@dataclass
+class UploadSession:
+    conversation_id: str
+    filename: str
+    file_ext: str
+    model_name: str
+    size: int
+    part_size: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    received: int = 0
+    content_hash: Optional[str] = None
+    job_id: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    @property
+    def total_parts(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    @property
+    def next_part(self) -> int:
+        return self.received // self.part_size
+
+    @property
+    def complete(self) -> bool:
+        return self.received >= self.size
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data.update(total_parts=self.total_parts, next_part=self.next_part, complete=self.complete)
+        return data
+
+
+class UploadSessionStore:
+    """可续传的分片上传。
+
+    分片必须按顺序上传：每个分片直接写到数据文件的对应位置，同时更新增量 SHA-256。
+    分片中途断开时文件截断回上一个完整分片，客户端查询 next_part 后从断点继续。
+    会话元数据持久化在 uploads/sessions/<id>/ 下，服务重启后重新计算已接收部分的哈希即可续传。
+    """
+
+    def __init__(self, sessions_dir: str):
+        self.sessions_dir = sessions_dir
+        self.sessions: Dict[str, UploadSession] = {}
+        self._hashers: Dict[str, "hashlib._Hash"] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        os.makedirs(self.sessions_dir, exist_ok=True)
+
+    def _session_dir(self, upload_id: str) -> str:
+        return os.path.join(self.sessions_dir, upload_id)
+
+    def data_path(self, session: UploadSession) -> str:
+        return os.path.join(self._session_dir(session.id), f"data.{session.file_ext}")
+
+    def _save(self, session: UploadSession):
+        with open(os.path.join(self._session_dir(session.id), "session.json"), "w", encoding="utf-8") as f:
+            json.dump(asdict(session), f, ensure_ascii=False, indent=2)
+
+    def create(self, conversation_id: str, filename: str, file_ext: str, model_name: str,
+               size: int, part_size: int) -> UploadSession:
+        session = UploadSession(conversation_id, filename, file_ext, model_name, size, part_size)
+        os.makedirs(self._session_dir(session.id), exist_ok=True)
+        open(self.data_path(session), "wb").close()
+        self.sessions[session.id] = session
+        self._hashers[session.id] = hashlib.sha256()
+        self._locks[session.id] = threading.Lock()
+        self._save(session)
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        session = self.sessions.get(upload_id)
+        if session is None:
+            session = self._load(upload_id)
+        return session
+
+    def _load(self, upload_id: str) -> Optional[UploadSession]:
+        meta_path = os.path.join(self._session_dir(upload_id), "session.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            session = UploadSession(**json.load(f))
+
+        # 进程重启后哈希状态丢失，从已确认的数据重新计算
+        data_path = self.data_path(session)
+        hasher = hashlib.sha256()
+        if not session.job_id and os.path.exists(data_path):
+            with open(data_path, "r+b") as f:
+                f.truncate(session.received)
+                while True:
+                    data = f.read(COPY_BUFFER_SIZE)
+                    if not data:
+                        break
+                    hasher.update(data)
+
+        self.sessions[session.id] = session
+        self._hashers[session.id] = hasher
+        self._locks[session.id] = threading.Lock()
+        return session
+
+    def write_part(self, session: UploadSession, index: int, stream: BinaryIO) -> UploadSession:
+        lock = self._locks[session.id]
+        if not lock.acquire(blocking=False):
+            raise UploadError("该分片正在上传")
+        try:
+            if session.complete:
+                raise UploadError("上传已完成")
+            if index != session.next_part:
+                raise UploadError(f"需要上传第 {session.next_part} 个分片")
+
+            offset = session.received
+            expected = min(session.part_size, session.size - offset)
+            hasher = self._hashers[session.id].copy()
+            written = 0
+
+            with open(self.data_path(session), "r+b") as f:
+                f.seek(offset)
+                try:
+                    while written < expected:
+                        data = stream.read(min(COPY_BUFFER_SIZE, expected - written))
+                        if not data:
+                            break
+                        hasher.update(data)
+                        f.write(data)
+                        written += len(data)
+                    if written != expected or stream.read(1):
+                        raise UploadError(f"分片大小不符，应为 {expected} 字节")
+                except Exception:
+                    f.truncate(offset)
+                    raise
+
+            self._hashers[session.id] = hasher
+            session.received = offset + written
+            if session.complete:
+                session.content_hash = hasher.hexdigest()
+            self._save(session)
+            return session
+        finally:
+            lock.release()
+
+    def release(self, session: UploadSession) -> str:
+        """上传完成后把数据文件移交给入库任务，返回新路径；会话元数据保留到过期清理。"""
+        target = os.path.join(conversation_manager.uploads_dir, f"{session.id}.{session.file_ext}")
+        os.replace(self.data_path(session), target)
+        return target
+
+    def hand_off(self, session: UploadSession, submit: Callable[[str], str]) -> str:
+        """把完成的上传交给入库任务并返回任务 id。
+
+        移动数据文件和提交任务在会话锁内完成，重复调用直接返回已有任务；提交失败时把文件移回原处，会话仍可重试。
+        """
+        with self._locks.setdefault(session.id, threading.Lock()):
+            if session.job_id:
+                return session.job_id
+            file_path = self.release(session)
+            try:
+                job_id = submit(file_path)
+            except Exception:
+                os.replace(file_path, self.data_path(session))
+                raise
+            self.attach_job(session, job_id)
+            return job_id
+
+    def attach_job(self, session: UploadSession, job_id: str):
+        session.job_id = job_id
+        self._save(session)
+
+    def discard(self, upload_id: str):
+        self.sessions.pop(upload_id, None)
+        self._hashers.pop(upload_id, None)
+        self._locks.pop(upload_id, None)
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def cleanup(self, ttl_seconds: int = SESSION_TTL_SECONDS):
+        now = time.time()
+        for upload_id in os.listdir(self.sessions_dir):
+            meta_path = os.path.join(self._session_dir(upload_id), "session.json")
+            if not os.path.exists(meta_path) or now - os.path.getmtime(meta_path) > ttl_seconds:
+                self.discard(upload_id)
+
+
+upload_sessions = UploadSessionStore(os.path.join(conversation_manager.uploads_dir, "sessions"))
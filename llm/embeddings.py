@@ -0,0 +1,219 @@
+import os
+import math
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+
+from storage.keyword_index import tokenize
+
+DEFAULT_OLLAMA_BASE_URL = "http://localhost:11434"
+DEFAULT_OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
+
+
+class EmbeddingBackend:
+    OLLAMA = "ollama"
+    LOCAL = "local"
+
+
+class HashingEmbeddings(Embeddings):
+    """进程内 CPU 向量化：哈希 n-gram 投影。
+
+    词（中日韩文字为单字/二字组合，英文为单词）与英文单词的字符 n-gram
+    通过 CRC32 带符号地投影到固定维度，按次线性词频加权后做 L2 归一化。
+    无需模型文件和外部服务，相同文本在不同进程中得到相同向量。
+    """
+
+    def __init__(self, dim: int = 512, char_ngram: int = 3):
+        self.dim = dim
+        self.char_ngram = char_ngram
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for token in tokenize(text):
+            features.append(token)
+            if token.isascii() and len(token) > self.char_ngram:
+                padded = f"<{token}>"
+                n = self.char_ngram
+                features.extend("#" + padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def _embed(self, text: str) -> np.ndarray:
+        counts: Dict[int, float] = {}
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            bucket = h % self.dim
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for bucket, value in counts.items():
+            vector[bucket] = math.copysign(1.0 + math.log(abs(value)), value) if value else 0.0
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+class EmbeddingCache:
+    """按文本内容哈希缓存向量，可按文档持久化。
+
+    namespace 标识向量来源（后端与模型），来源不同的缓存不会被复用。
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.vectors: Dict[str, List[float]] = {}
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        return self.vectors.get(self.key(text))
+
+    def put(self, text: str, vector: List[float]):
+        self.vectors[self.key(text)] = vector
+
+    def retain(self, texts: List[str]):
+        keep = {self.key(text) for text in texts}
+        self.vectors = {k: v for k, v in self.vectors.items() if k in keep}
+
+    def save(self, path: str):
+        if not self.vectors:
+            return
+        keys = list(self.vectors.keys())
+        np.savez(
+            path,
+            namespace=np.array(self.namespace),
+            keys=np.array(keys),
+            vectors=np.asarray([self.vectors[k] for k in keys], dtype=np.float32)
+        )
+
+    @classmethod
+    def load(cls, path: str, namespace: str) -> "EmbeddingCache":
+        cache = cls(namespace)
+        if not os.path.exists(path):
+            return cache
+        try:
+            with np.load(path) as data:
+                if str(data["namespace"]) != namespace:
+                    return cache
+                cache.vectors = {
+                    str(k): v.tolist() for k, v in zip(data["keys"], data["vectors"])
+                }
+        except Exception as e:
+            print(f"加载向量缓存失败: {str(e)}")
+        return cache
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = [text for text in dict.fromkeys(texts) if self.cache.get(text) is None]
+        if missing:
+            for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+                self.cache.put(text, vector)
+        return [self.cache.get(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def _create_ollama_embeddings(base_url: Optional[str]) -> Embeddings:
+    return OllamaEmbeddings(
+        model=DEFAULT_OLLAMA_EMBEDDING_MODEL,
+        base_url=base_url or DEFAULT_OLLAMA_BASE_URL
+    )
+
+
+_local_embeddings = HashingEmbeddings()
+
+_BACKENDS: Dict[str, Callable[[Optional[str]], Embeddings]] = {
+    EmbeddingBackend.OLLAMA: _create_ollama_embeddings,
+    EmbeddingBackend.LOCAL: lambda base_url: _local_embeddings,
+}
+
+
+def register_embedding_backend(name: str, factory: Callable[[Optional[str]], Embeddings]):
+    _BACKENDS[name] = factory
+
+
+def get_embedding_backend() -> str:
+    from config.manager import load_config
+    return load_config().get("embedding_backend", EmbeddingBackend.OLLAMA)
+
+
+def get_embedding_model(base_url: Optional[str] = None, backend: Optional[str] = None) -> Embeddings:
+    backend = backend or get_embedding_backend()
+    factory = _BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return factory(base_url)
+
+
+def get_embedding_namespace(backend: Optional[str] = None) -> str:
+    backend = backend or get_embedding_backend()
+    if backend == EmbeddingBackend.OLLAMA:
+        return f"{backend}:{DEFAULT_OLLAMA_EMBEDDING_MODEL}"
+    if backend == EmbeddingBackend.LOCAL:
+        return f"{backend}:hash{_local_embeddings.dim}"
+    return backend
+
+
+def has_vector_search(provider: str, backend: Optional[str] = None) -> bool:
+    backend = backend or get_embedding_backend()
+    return provider == "ollama" or backend != EmbeddingBackend.OLLAMA
+
+
+class QueryEmbeddingCache:
+    """问题向量的 LRU 缓存：同一轮对话中文档检索、历史检索和文档工具共用一次向量化，重复提问直接命中。"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str, base_url: Optional[str] = None, backend: Optional[str] = None) -> List[float]:
+        key = (get_embedding_namespace(backend), text)
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        vector = get_embedding_model(base_url, backend).embed_query(text)
+        with self._lock:
+            self.misses += 1
+            self._items[key] = vector
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+query_embeddings = QueryEmbeddingCache()
@@ -1,8 +1,14 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 from langchain_ollama import ChatOllama
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 
+from core.cancel import install_llm_hooks, raise_if_cancelled
+
 DEFAULT_OLLAMA_BASE_URL = "http://localhost:11434"
 DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
 
@@ -20,6 +26,24 @@ def create_llm(
     api_key: Optional[str] = None,
     temperature: float = 0.7,
     **kwargs
+):
+    """创建聊天模型并在其 HTTP 客户端上安装取消钩子。
+
+    取消令牌在响应头到达后才能中断请求：回答生成用 stream() 按调用流式请求，开始输出即可中断；
+    invoke() 的非流式请求（意图判断、摘要等）在响应返回前无法中断，取消后不再发起新的请求。
+    """
+    llm = _create_llm(provider, model, base_url, api_key, temperature, **kwargs)
+    install_llm_hooks(llm)
+    return llm
+
+
+def _create_llm(
+    provider: str,
+    model: str,
+    base_url: Optional[str],
+    api_key: Optional[str],
+    temperature: float,
+    **kwargs
 ):
     if provider == LLMProvider.OLLAMA:
         return ChatOllama(
@@ -46,3 +70,112 @@ def create_llm(
         )
     else:
         raise ValueError(f"Unknown provider: {provider}")
+
+
+class LLMClientPool:
+    """复用聊天模型客户端及其 HTTP 连接池。
+
+    按 (provider, 地址, 模型, 密钥摘要, 采样参数) 缓存 create_llm 的结果，
+    同一配置的各节点共用一个客户端，避免每次调用都新建连接和 TLS 握手。
+    配置或端点切换后调用 invalidate 丢弃旧客户端；超过 max_size 时淘汰最久未用的。
+    """
+
+    def __init__(self, max_size: int = 16):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._clients: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(provider: str, model: str, base_url: Optional[str], api_key: Optional[str],
+             temperature: float, kwargs: dict) -> tuple:
+        key_digest = hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:12] if api_key else ""
+        params = tuple(sorted((name, repr(value)) for name, value in kwargs.items()))
+        return provider, base_url or "", model, key_digest, temperature, params
+
+    def get(
+        self,
+        provider: str,
+        model: str,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        temperature: float = 0.7,
+        **kwargs
+    ):
+        raise_if_cancelled()
+        key = self._key(provider, model, base_url, api_key, temperature, kwargs)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._clients.move_to_end(key)
+                entry["uses"] += 1
+                self.hits += 1
+                return entry["client"]
+
+        client = create_llm(provider, model, base_url=base_url, api_key=api_key, temperature=temperature, **kwargs)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry["uses"] += 1
+                self.hits += 1
+                return entry["client"]
+            self.misses += 1
+            self._clients[key] = {"client": client, "uses": 1, "created_at": time.time()}
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+        return client
+
+    def invalidate(self, provider: Optional[str] = None) -> int:
+        """丢弃缓存的客户端（指定 provider 时只丢弃该 provider 的），返回丢弃数量。
+
+        正在使用旧客户端的请求不受影响，客户端在引用释放后由垃圾回收关闭连接。
+        """
+        with self._lock:
+            keys = [key for key in self._clients if provider is None or key[0] == provider]
+            for key in keys:
+                del self._clients[key]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            clients = [
+                {
+                    "provider": key[0],
+                    "base_url": key[1],
+                    "model": key[2],
+                    "temperature": key[4],
+                    "uses": entry["uses"],
+                    "age_seconds": round(now - entry["created_at"], 1),
+                }
+                for key, entry in self._clients.items()
+            ]
+            return {
+                "size": len(clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "clients": clients,
+            }
+
+
+llm_clients = LLMClientPool()
+
+
+def get_llm(
+    provider: str,
+    model: str,
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    temperature: float = 0.7,
+    **kwargs
+):
+    """与 create_llm 参数相同，但从 llm_clients 中复用已有客户端。"""
+    return llm_clients.get(provider, model, base_url=base_url, api_key=api_key, temperature=temperature, **kwargs)
@@ -1,36 +1,54 @@
-from langchain_ollama import OllamaEmbeddings
+from llm.embeddings import get_embedding_model
 
 
-def get_embedding_model(base_url: str):
-    return OllamaEmbeddings(
-        model="nomic-embed-text",
-        base_url=base_url
-    )
+def get_active_model_name(model_name=None):
+    from core import state
+
+    if state.llm_provider == "openai" and state.openai_current_model:
+        return state.openai_current_model
+    if state.llm_provider == "anthropic" and state.anthropic_current_model:
+        return state.anthropic_current_model
+    return model_name or "qwen3.5:9b"
+
 
+def get_text_content(content):
+    if isinstance(content, list):
+        text_parts = []
+        for part in content:
+            if isinstance(part, dict) and part.get('type') == 'text':
+                text_parts.append(part.get('text', ''))
+            elif isinstance(part, str):
+                text_parts.append(part)
+        return ''.join(text_parts)
+    return content
 
-def get_llm_model(temperature=0.7):
+
+def get_llm_model(temperature=0.7, model_name=None, num_ctx=None):
+    """按当前 provider 获取聊天模型；num_ctx 只对 Ollama 生效（其默认窗口较小，长提示词会被截断）。"""
     from core import state
-    from llm.factory import create_llm
+    from llm.factory import get_llm
     
     provider = state.llm_provider
     
     if provider == "ollama":
-        return create_llm(
+        options = {"num_ctx": num_ctx} if num_ctx else {}
+        return get_llm(
             provider="ollama",
-            model="qwen3.5:4b",
+            model=model_name or "qwen3.5:4b",
             base_url=state.ollama_base_url,
-            temperature=temperature
+            temperature=temperature,
+            **options
         )
     elif provider == "openai":
-        return create_llm(
+        return get_llm(
             provider="openai",
-            model=state.openai_current_model if hasattr(state, 'openai_current_model') and state.openai_current_model else model_name,
+            model=state.openai_current_model if hasattr(state, 'openai_current_model') and state.openai_current_model else model_name or "gpt-4",
             base_url=state.get_openai_base_url() if hasattr(state, 'get_openai_base_url') else None,
             api_key=state.get_openai_api_key() if hasattr(state, 'get_openai_api_key') else None,
             temperature=temperature
         )
     elif provider == "anthropic":
-        return create_llm(
+        return get_llm(
             provider="anthropic",
             model=state.anthropic_current_model if hasattr(state, 'anthropic_current_model') and state.anthropic_current_model else "claude-3-sonnet-20240229",
             base_url=state.get_anthropic_base_url() if hasattr(state, 'get_anthropic_base_url') else None,
@@ -66,15 +84,7 @@ def generate_summary(messages):
         llm = get_llm_model(temperature=0.3)
         response = llm.invoke(prompt)
         
-        content = response.content
-        if isinstance(content, list):
-            text_parts = []
-            for part in content:
-                if isinstance(part, dict) and part.get('type') == 'text':
-                    text_parts.append(part.get('text', ''))
-                elif isinstance(part, str):
-                    text_parts.append(part)
-            content = ''.join(text_parts)
+        content = get_text_content(response.content)
         
         return content.strip()
     except Exception as e:
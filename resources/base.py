@@ -35,8 +35,20 @@ class DocumentResource(BaseResource):
         conversation = state.get_current_conversation()
         return bool(conversation and conversation.document_chunks)
     
+    def _query_embedding(self, conversation, query: str) -> Optional[List[float]]:
+        from core import state
+        from llm.embeddings import query_embeddings
+
+        if not conversation.vector_store or not query:
+            return None
+        return query_embeddings.get(query, state.ollama_base_url, state.embedding_backend)
+    
     def load(self, strategy: str, params: Dict[str, Any]) -> LoadResult:
         from core import state
+        from storage.retriever import create_retriever, get_parent_index, retrieve_with_sections
+        from document.artifacts import get_outline, get_summary
+        from document.headings import get_headings, match_sections, format_headings
+        from document.summary_tree import get_summary_tree
         conversation = state.get_current_conversation()
         
         if not conversation or not conversation.document_chunks:
@@ -45,25 +57,36 @@ class DocumentResource(BaseResource):
         chunks = conversation.document_chunks
         total = len(chunks)
         
-        if strategy == "summary":
+        if strategy == "summary" and get_summary_tree(conversation):
+            tree = get_summary_tree(conversation)
+            nodes = tree.level_within(params.get("max_tokens", 3000))
+            content = "\n\n".join(f"--- 块 {node.start}-{node.end - 1} ---\n{node.text}" for node in nodes)
+            return LoadResult(
+                True,
+                f"文档《{conversation.document_file}》分层摘要（{len(nodes)} 段，覆盖全部 {total} 块）：\n\n{content}",
+                {"levels": len(tree), "nodes": len(nodes), "total": total}
+            )
+        
+        elif strategy == "summary":
             n_chunks = min(params.get("n_chunks", 10), total)
-            content_parts = []
-            for i in range(n_chunks):
-                content_parts.append(f"--- 文本块 {i} ---\n{chunks[i].page_content}")
-            content = "\n\n".join(content_parts)
+            content = get_summary(conversation, n_chunks)
             return LoadResult(
                 True, 
                 f"文档《{conversation.document_file}》前 {n_chunks} 个文本块（共 {total} 块）：\n\n{content}",
                 {"n_chunks": n_chunks, "total": total}
             )
         
+        elif strategy == "structure" and get_headings(conversation):
+            headings = get_headings(conversation)
+            return LoadResult(
+                True,
+                f"文档《{conversation.document_file}》目录（{len(headings)} 个章节，共 {total} 块）：\n\n" + format_headings(headings),
+                {"sections": len(headings), "total": total}
+            )
+        
         elif strategy == "structure":
             sample_rate = params.get("sample_rate", 10)
-            step = max(1, total // sample_rate)
-            sampled = []
-            for i in range(0, total, step):
-                preview = chunks[i].page_content[:150].replace("\n", " ")
-                sampled.append(f"[块 {i}] {preview}...")
+            sampled = [f"[块 {i}] {preview}..." for i, preview in get_outline(conversation, sample_rate)]
             return LoadResult(
                 True,
                 f"文档《{conversation.document_file}》结构采样（共 {total} 块）：\n\n" + "\n".join(sampled),
@@ -74,23 +97,20 @@ class DocumentResource(BaseResource):
             query = params.get("query", "")
             k = params.get("k", 4)
             
-            if not conversation.vector_store:
+            retriever = create_retriever(conversation, state.llm_provider)
+            if not retriever:
                 return LoadResult(False, "文档索引不可用")
             
-            docs = conversation.vector_store.similarity_search(query, k=k)
+            sections = match_sections(get_headings(conversation), params.get("section") or query)
+            docs = retrieve_with_sections(retriever, query, k, sections, self._query_embedding(conversation, query))
             if not docs:
                 return LoadResult(False, "未找到相关内容")
             
+            parent_index = get_parent_index(conversation)
+            sections = parent_index.expand(doc.metadata.get("chunk_index", 0) for doc in docs)
             results = []
-            for doc in docs:
-                chunk_idx = doc.metadata.get("chunk_index", 0)
-                start = max(0, chunk_idx - 1)
-                end = min(total, chunk_idx + 2)
-                expanded_parts = []
-                for i in range(start, end):
-                    expanded_parts.append(f"[块 {i}] {chunks[i].page_content}")
-                expanded = "\n".join(expanded_parts)
-                results.append(f"--- 相关片段（块 {start}-{end-1}）---\n{expanded}")
+            for section in sections:
+                results.append(f"--- 相关片段（块 {section.start}-{section.end - 1}）---\n{section.text}")
             
             return LoadResult(
                 True,
@@ -102,10 +122,12 @@ class DocumentResource(BaseResource):
             query = params.get("query", "")
             k = params.get("k", 4)
             
-            if not conversation.vector_store:
+            retriever = create_retriever(conversation, state.llm_provider)
+            if not retriever:
                 return LoadResult(False, "文档索引不可用")
             
-            docs = conversation.vector_store.similarity_search(query, k=k)
+            sections = match_sections(get_headings(conversation), params.get("section") or query)
+            docs = retrieve_with_sections(retriever, query, k, sections, self._query_embedding(conversation, query))
             if not docs:
                 return LoadResult(False, "未找到相关内容")
             
@@ -1,8 +1,10 @@
 let currentConversationId = null;
 let isGenerating = false;
 let eventSource = null;
+let currentSessionId = null;
 let currentImages = [];
 let streamingContent = '';
+let currentJobId = null;
 let currentConfig = { 
     max_context_turns: 5,
     speech_recognition_lang: 'zh-CN',
@@ -58,7 +60,11 @@ function startStatusPolling() {
                     messageInput.disabled = isGenerating;
                 }
                 if (statusText) {
-                    statusText.textContent = isGenerating ? '生成中...' : '就绪';
+                    if (data.session && data.session.status === 'queued') {
+                        statusText.textContent = `排队中，前面还有 ${data.session.position} 个请求`;
+                    } else {
+                        statusText.textContent = isGenerating ? '生成中...' : '就绪';
+                    }
                 }
             })
             .catch(error => console.error('获取状态失败:', error));
@@ -473,7 +479,8 @@ function sendMessage() {
         body: JSON.stringify({ 
             query, 
             model: currentModel,
-            mode: document.getElementById('modeSelect').value
+            mode: document.getElementById('modeSelect').value,
+            conversation_id: currentConversationId
         })
     })
         .then(response => response.json())
@@ -483,6 +490,7 @@ function sendMessage() {
                     currentConversationId = data.conversation_id;
                     updateConversationList();
                 }
+                currentSessionId = data.session_id;
                 startStreaming();
             } else {
                 alert(data.error);
@@ -516,7 +524,7 @@ function startStreaming() {
     container.appendChild(assistantMessage);
     container.scrollTop = container.scrollHeight;
 
-    eventSource = new EventSource('/api/stream');
+    eventSource = new EventSource(`/api/stream?session_id=${currentSessionId}`);
 
     eventSource.onmessage = function(event) {
         const data = event.data;
@@ -538,10 +546,18 @@ function startStreaming() {
         } else if (data.startsWith('[PROGRESS]')) {
             const progressMsg = data.substring(10);
             console.log('Progress:', progressMsg);
+            document.getElementById('statusText').textContent = progressMsg;
+        } else if (data.startsWith('[RESYNC]')) {
+            console.warn('部分输出已超出回放范围，生成结束后重新加载消息');
         }
     };
 
     eventSource.onerror = function(error) {
+        // 连接意外断开时浏览器会带上 Last-Event-ID 自动重连，服务端从断开处继续推送
+        if (eventSource && eventSource.readyState === EventSource.CONNECTING) {
+            console.warn('流式连接中断，正在重连...');
+            return;
+        }
         console.error('流式响应错误:', error);
         stopStreaming();
     };
@@ -593,7 +609,11 @@ function appendStreamingMessage(content) {
 
 
 function stopGeneration() {
-    fetch('/api/stop', { method: 'POST' })
+    fetch('/api/stop', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ session_id: currentSessionId, conversation_id: currentConversationId })
+    })
         .then(response => response.json())
         .then(data => {
             if (data.success) {
@@ -624,13 +644,47 @@ function handleKeyDown(event) {
     }
 }
 
-function uploadFile(event) {
+const UPLOAD_PART_RETRIES = 3;
+
+async function uploadParts(upload, file, onProgress) {
+    let retries = 0;
+    while (!upload.complete) {
+        const index = upload.next_part;
+        const start = index * upload.part_size;
+        const part = file.slice(start, Math.min(start + upload.part_size, upload.size));
+        try {
+            const response = await fetch(`/api/documents/uploads/${upload.id}/parts/${index}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: part
+            });
+            const data = await response.json();
+            if (!response.ok && response.status !== 409) {
+                throw new Error(data.error || '上传分片失败');
+            }
+            // 409 表示分片顺序与服务端不一致，按服务端返回的 next_part 继续
+            upload = data;
+            if (response.ok) {
+                retries = 0;
+            } else if (++retries > UPLOAD_PART_RETRIES) {
+                throw new Error(data.error);
+            }
+        } catch (error) {
+            if (++retries > UPLOAD_PART_RETRIES) throw error;
+            const response = await fetch(`/api/documents/uploads/${upload.id}`);
+            if (!response.ok) throw error;
+            upload = await response.json();
+        }
+        onProgress(upload.received / upload.size);
+    }
+    return upload;
+}
+
+async function uploadFile(event) {
     const file = event.target.files[0];
     if (!file) return;
+    event.target.value = '';
 
-    const formData = new FormData();
-    formData.append('file', file);
-    
     const filename = file.name;
 
     const progressBar = document.getElementById('progressBar');
@@ -640,35 +694,51 @@ function uploadFile(event) {
     
     progressBar.classList.remove('hidden');
     progressText.textContent = '正在上传文档...';
-    progressFill.style.width = '10%';
+    progressFill.style.width = '0%';
     uploadBtn.disabled = true;
 
-    fetch('/api/documents/upload', {
-        method: 'POST',
-        body: formData
-    })
+    try {
+        const response = await fetch('/api/documents/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: filename, size: file.size, model: currentModel })
+        });
+        let upload = await response.json();
+        if (!response.ok) throw new Error(upload.error);
+
+        upload = await uploadParts(upload, file, ratio => {
+            progressText.textContent = `正在上传文档... ${Math.round(ratio * 100)}%`;
+            progressFill.style.width = `${Math.round(ratio * 10)}%`;
+        });
+        if (!upload.job_id) {
+            const completeResponse = await fetch(`/api/documents/uploads/${upload.id}/complete`, { method: 'POST' });
+            upload = await completeResponse.json();
+            if (!completeResponse.ok) throw new Error(upload.error);
+        }
+        startDocumentProcessing(upload.job_id, progressBar, progressText, progressFill, uploadBtn, filename);
+    } catch (error) {
+        console.error('上传文件失败:', error);
+        progressBar.classList.add('hidden');
+        uploadBtn.disabled = false;
+        alert(error.message || '上传文件失败');
+    }
+}
+
+function cancelDocumentJob() {
+    if (!currentJobId) return;
+    fetch(`/api/documents/jobs/${currentJobId}`, { method: 'DELETE' })
         .then(response => response.json())
         .then(data => {
             if (data.success) {
-                startDocumentProcessing(progressBar, progressText, progressFill, uploadBtn, filename);
-            } else {
-                progressBar.classList.add('hidden');
-                uploadBtn.disabled = false;
-                alert(data.error);
+                document.getElementById('progressText').textContent = data.message;
             }
         })
-        .catch(error => {
-            console.error('上传文件失败:', error);
-            progressBar.classList.add('hidden');
-            uploadBtn.disabled = false;
-            alert('上传文件失败');
-        });
-
-    event.target.value = '';
+        .catch(error => console.error('取消任务失败:', error));
 }
 
-function startDocumentProcessing(progressBar, progressText, progressFill, uploadBtn, filename) {
-    const eventSource = new EventSource('/api/stream');
+function startDocumentProcessing(jobId, progressBar, progressText, progressFill, uploadBtn, filename) {
+    currentJobId = jobId;
+    const eventSource = new EventSource(`/api/documents/jobs/${jobId}/stream`);
     let streamingContent = '';
     let streamingMessageElement = null;
     let userMessageElement = null;
@@ -730,6 +800,7 @@ function startDocumentProcessing(progressBar, progressText, progressFill, upload
             appendChunk(chunk);
         } else if (data.startsWith('[DONE]')) {
             eventSource.close();
+            currentJobId = null;
             progressFill.style.width = '100%';
             isGenerating = false;
             
@@ -747,6 +818,7 @@ function startDocumentProcessing(progressBar, progressText, progressFill, upload
             updateUIState();
         } else if (data.startsWith('[stopped]')) {
             eventSource.close();
+            currentJobId = null;
             
             if (userMessageElement) {
                 userMessageElement.remove();
@@ -769,6 +841,7 @@ function startDocumentProcessing(progressBar, progressText, progressFill, upload
         } else if (data.startsWith('[ERROR]')) {
             const errorMsg = data.replace('[ERROR]', '');
             eventSource.close();
+            currentJobId = null;
             
             if (userMessageElement) {
                 userMessageElement.remove();
@@ -789,6 +862,7 @@ function startDocumentProcessing(progressBar, progressText, progressFill, upload
     
     eventSource.onerror = function() {
         eventSource.close();
+        currentJobId = null;
         
         if (userMessageElement) {
             userMessageElement.remove();
@@ -1760,7 +1834,7 @@ function handleDrop(e) {
 }
 
 function isDocumentFile(file) {
-    const docExtensions = ['pdf', 'docx', 'txt'];
+    const docExtensions = ['pdf', 'docx', 'txt', 'md', 'csv', 'jsonl'];
     const ext = file.name.split('.').pop().toLowerCase();
     return docExtensions.includes(ext);
 }
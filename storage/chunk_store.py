@@ -0,0 +1,303 @@
+import io
+import os
+import json
+import mmap
+import hashlib
+from array import array
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+from llm.tokens import estimate_tokens
+
+
+NO_PAGE = -1
+NO_START = -1
+NO_SECTION = -1
+NO_OFFSET = -1
+
+_BUFFER_FILE = "chunks.bin"
+_META_FILE = "chunks.json"
+_COLUMNS = ("offsets", "lengths", "chunk_index", "page", "start", "token_count", "section", "byte_offset")
+_DTYPES = {
+    "offsets": np.int64,
+    "lengths": np.int64,
+    "chunk_index": np.int32,
+    "page": np.int32,
+    "start": np.int64,
+    "token_count": np.int32,
+    "section": np.int32,
+    "byte_offset": np.int64,
+}
+
+
+class ChunkStore:
+    """文档分块的紧凑存储。
+
+    所有块的文本按顺序以 UTF-8 存放在一段连续缓冲区中，
+    offsets/lengths 记录每块的字节位置，chunk_index/page/start 等元数据按列存放。
+    start 是块在所属页（或原文）中的字符起始位置，用于合并相邻块时去除重叠。
+    token_count 是建库时预先估算的每块 token 数，供上下文预算直接使用。
+    section 是块所属章节的编号，headings[section] 为该章节的标题路径（从顶级标题到本级）。
+    byte_offset 是块所在的源文本段在原文件中的字节位置（流式读取的纯文本类文件才有）。
+    缓冲区可以是内存中的 bytes，也可以是磁盘文件的 mmap 映射。
+    """
+
+    def __init__(
+        self,
+        buffer: Union[bytes, mmap.mmap, None] = None,
+        offsets: Optional[np.ndarray] = None,
+        lengths: Optional[np.ndarray] = None,
+        chunk_index: Optional[np.ndarray] = None,
+        page: Optional[np.ndarray] = None,
+        start: Optional[np.ndarray] = None,
+        token_count: Optional[np.ndarray] = None,
+        source: Optional[str] = None,
+        section: Optional[np.ndarray] = None,
+        headings: Optional[List[List[str]]] = None,
+        byte_offset: Optional[np.ndarray] = None
+    ):
+        self._buffer = buffer if buffer is not None else b""
+        self._view = memoryview(self._buffer)
+        self.offsets = offsets if offsets is not None else np.zeros(0, dtype=np.int64)
+        self.lengths = lengths if lengths is not None else np.zeros(0, dtype=np.int64)
+        self.chunk_index = chunk_index if chunk_index is not None else np.zeros(0, dtype=np.int32)
+        self.page = page if page is not None else np.zeros(0, dtype=np.int32)
+        self.start = start if start is not None else np.full(len(self.offsets), NO_START, dtype=np.int64)
+        self.source = source
+        self.section = section if section is not None else np.full(len(self.offsets), NO_SECTION, dtype=np.int32)
+        self.headings = headings or []
+        self.byte_offset = byte_offset if byte_offset is not None else np.full(len(self.offsets), NO_OFFSET, dtype=np.int64)
+        if token_count is None:
+            # 旧版本保存的分块没有 token_count 列，加载时补算
+            token_count = np.fromiter(
+                (estimate_tokens(self.text(i)) for i in range(len(self.offsets))),
+                dtype=np.int32,
+                count=len(self.offsets)
+            )
+        self.token_count = token_count
+        self._digest = None
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document]) -> "ChunkStore":
+        buffer = io.BytesIO()
+        writer = _ChunkWriter(buffer)
+        for doc in documents:
+            writer.add(doc)
+        return cls(buffer.getvalue(), source=writer.source, headings=writer.headings, **writer.columns())
+
+    @classmethod
+    def write(cls, directory: str, documents: Iterable[Document]) -> int:
+        """逐个把文档写入目录下的分块文件，内存中只累积定长的元数据列，返回块数。
+
+        写出的文件与 save() 相同，可直接用 load() 以 mmap 方式打开。
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, _BUFFER_FILE), "wb") as f:
+            writer = _ChunkWriter(f)
+            for doc in documents:
+                writer.add(doc)
+
+        columns = writer.columns()
+        for column in _COLUMNS:
+            np.save(os.path.join(directory, f"{column}.npy"), columns[column])
+        writer.hasher.update(np.ascontiguousarray(columns["lengths"], dtype=np.int64).tobytes())
+        with open(os.path.join(directory, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"source": writer.source, "count": writer.count, "digest": writer.hasher.hexdigest(),
+                       "headings": writer.headings}, f, ensure_ascii=False)
+        return writer.count
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.document(i) for i in range(*item.indices(len(self)))]
+        return self.document(item)
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self.document(i)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._view)
+
+    @property
+    def digest(self) -> str:
+        """分块集合的内容摘要（文本与切分边界），用于给派生缓存标记版本。"""
+        if self._digest is None:
+            h = hashlib.sha1(self._view)
+            h.update(np.ascontiguousarray(self.lengths, dtype=np.int64).tobytes())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def _normalize(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("chunk index out of range")
+        return i
+
+    def raw(self, i: int) -> memoryview:
+        i = self._normalize(i)
+        start = int(self.offsets[i])
+        return self._view[start:start + int(self.lengths[i])]
+
+    def text(self, i: int) -> str:
+        return str(self.raw(i), "utf-8")
+
+    def preview(self, i: int, n_chars: int) -> str:
+        # UTF-8 单字符最多 4 字节，只解码需要的前缀
+        return str(self.raw(i)[:n_chars * 4], "utf-8", "ignore")[:n_chars]
+
+    def span(self, start: int, end: int) -> memoryview:
+        """返回 [start, end) 范围内所有块的连续字节视图，不复制数据。"""
+        start = max(0, start)
+        end = min(len(self), end)
+        if start >= end:
+            return self._view[0:0]
+        byte_start = int(self.offsets[start])
+        byte_end = int(self.offsets[end - 1] + self.lengths[end - 1])
+        return self._view[byte_start:byte_end]
+
+    def texts(self, start: int, end: int) -> List[str]:
+        start = max(0, start)
+        end = min(len(self), end)
+        return [self.text(i) for i in range(start, end)]
+
+    def window(self, i: int, radius: int = 1) -> Tuple[int, int]:
+        i = self._normalize(i)
+        return max(0, i - radius), min(len(self), i + radius + 1)
+
+    def heading_path(self, i: int) -> List[str]:
+        section = int(self.section[self._normalize(i)])
+        return self.headings[section] if section != NO_SECTION else []
+
+    def metadata(self, i: int) -> Dict:
+        i = self._normalize(i)
+        metadata = {"chunk_index": int(self.chunk_index[i])}
+        if self.page[i] != NO_PAGE:
+            metadata["page"] = int(self.page[i])
+        if self.start[i] != NO_START:
+            metadata["start_index"] = int(self.start[i])
+        if self.section[i] != NO_SECTION:
+            metadata["section"] = int(self.section[i])
+            metadata["heading_path"] = list(self.heading_path(i))
+        if self.byte_offset[i] != NO_OFFSET:
+            metadata["byte_offset"] = int(self.byte_offset[i])
+        if self.source:
+            metadata["source"] = self.source
+        return metadata
+
+    def document(self, i: int) -> Document:
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def to_documents(self) -> List[Document]:
+        return list(self)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, _BUFFER_FILE), "wb") as f:
+            f.write(self._view)
+        for column in _COLUMNS:
+            np.save(os.path.join(directory, f"{column}.npy"), getattr(self, column))
+        with open(os.path.join(directory, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "count": len(self), "digest": self.digest, "headings": self.headings},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, use_mmap: bool = True) -> "ChunkStore":
+        with open(os.path.join(directory, _META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        columns = {}
+        for column in _COLUMNS:
+            path = os.path.join(directory, f"{column}.npy")
+            if os.path.exists(path):
+                columns[column] = np.load(path, mmap_mode="r" if use_mmap else None)
+
+        buffer_path = os.path.join(directory, _BUFFER_FILE)
+        if use_mmap and os.path.getsize(buffer_path) > 0:
+            with open(buffer_path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            with open(buffer_path, "rb") as f:
+                buffer = f.read()
+
+        store = cls(buffer, source=meta.get("source"), headings=meta.get("headings"), **columns)
+        store._digest = meta.get("digest")
+        return store
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, _META_FILE))
+
+    def close(self):
+        buffer = self._buffer
+        self._buffer = b""
+        self._view = memoryview(self._buffer)
+        self._digest = None
+        self.headings = []
+        for column in _COLUMNS:
+            array = getattr(self, column)
+            setattr(self, column, np.zeros(0, dtype=array.dtype))
+
+        if isinstance(buffer, mmap.mmap):
+            try:
+                buffer.close()
+            except BufferError:
+                # 仍有外部视图引用映射区，交给垃圾回收释放
+                pass
+
+
+class _ChunkWriter:
+    """把文档依次追加到输出流，同时累积元数据列和内容摘要。"""
+
+    def __init__(self, output: BinaryIO):
+        self.output = output
+        self.hasher = hashlib.sha1()
+        self.values = {column: array("q") for column in _COLUMNS}
+        self.headings: List[List[str]] = []
+        self.source: Optional[str] = None
+        self.count = 0
+        self.position = 0
+
+    def add(self, doc: Document):
+        data = doc.page_content.encode("utf-8")
+        self.output.write(data)
+        self.hasher.update(data)
+
+        metadata = doc.metadata
+        section = metadata.get("section", NO_SECTION)
+        if section != NO_SECTION:
+            while len(self.headings) <= section:
+                self.headings.append([])
+            self.headings[section] = list(metadata.get("heading_path", []))
+        if self.source is None:
+            self.source = metadata.get("source")
+
+        row = {
+            "offsets": self.position,
+            "lengths": len(data),
+            "chunk_index": metadata.get("chunk_index", self.count),
+            "page": metadata.get("page", NO_PAGE),
+            "start": metadata.get("start_index", NO_START),
+            "token_count": estimate_tokens(doc.page_content),
+            "section": section,
+            "byte_offset": metadata.get("byte_offset", NO_OFFSET),
+        }
+        for column, value in row.items():
+            self.values[column].append(value)
+        self.position += len(data)
+        self.count += 1
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {
+            column: np.frombuffer(self.values[column], dtype=np.int64).astype(_DTYPES[column])
+            for column in _COLUMNS
+        }
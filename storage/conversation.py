@@ -17,6 +17,10 @@ class ConversationManager:
         self.conversations_dir = os.path.join(base_dir, "conversations")
         self.assets_dir = os.path.join(base_dir, "assets")
         self.vector_stores_dir = os.path.join(base_dir, "vector_stores", "history")
+        self.documents_dir = os.path.join(base_dir, "documents")
+        self.jobs_dir = os.path.join(base_dir, "jobs")
+        self.uploads_dir = os.path.join(base_dir, "uploads")
+        self.staging_dir = os.path.join(base_dir, "staging")
         self.index_path = os.path.join(self.conversations_dir, "index.json")
         
         self._ensure_directories()
@@ -26,6 +30,7 @@ class ConversationManager:
         os.makedirs(self.conversations_dir, exist_ok=True)
         os.makedirs(self.assets_dir, exist_ok=True)
         os.makedirs(self.vector_stores_dir, exist_ok=True)
+        os.makedirs(self.documents_dir, exist_ok=True)
     
     def _load_or_create_index(self) -> Dict:
         if os.path.exists(self.index_path):
@@ -50,6 +55,14 @@ class ConversationManager:
     def _get_assets_path(self, conversation_id: str) -> str:
         return os.path.join(self.assets_dir, conversation_id)
     
+    def get_document_path(self, conversation_id: str) -> str:
+        return os.path.join(self.documents_dir, conversation_id)
+    
+    def delete_document_data(self, conversation_id: str):
+        document_path = self.get_document_path(conversation_id)
+        if os.path.exists(document_path):
+            shutil.rmtree(document_path, ignore_errors=True)
+    
     def _parse_frontmatter(self, content: str) -> tuple:
         if content.startswith("---\n"):
             parts = content.split("---\n", 2)
@@ -317,6 +330,8 @@ class ConversationManager:
             if os.path.exists(assets_path):
                 shutil.rmtree(assets_path)
             
+            self.delete_document_data(conversation_id)
+            
             self.index["conversations"] = [
                 c for c in self.index["conversations"] 
                 if c["id"] != conversation_id
@@ -381,7 +396,7 @@ class ConversationManager:
                 f.write(new_content)
             
             self._update_index_entry(conversation_id, {
-                "has_document": document_file is not None,
+                "has_document": bool(document_file),
                 "updated": metadata["updated"]
             })
             
@@ -1,17 +1,12 @@
 import os
 from typing import List, Dict, Optional
 from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaEmbeddings
 from langchain_core.documents import Document
 
+from config.context import get_retrieval_policy
 from storage.conversation import conversation_manager
-
-
-def get_embedding_model(base_url: str):
-    return OllamaEmbeddings(
-        model="nomic-embed-text",
-        base_url=base_url
-    )
+from storage.ranking import RetrievalPolicy, search_faiss, select_candidates
+from llm.embeddings import get_embedding_model, has_vector_search
 
 
 class HistoryRAG:
@@ -143,12 +138,14 @@ class HistoryRAG:
             except Exception as e:
                 print(f"构建全部索引失败: {str(e)}")
     
-    def search(self, query: str, k: int = 5) -> List[Dict]:
+    def search(self, query: str, k: int = 5, embedding: Optional[List[float]] = None) -> List[Dict]:
         if self.vector_store is None:
             return []
         
         try:
-            docs = self.vector_store.similarity_search(query, k=k)
+            if embedding is None:
+                embedding = self.vector_store.embeddings.embed_query(query)
+            docs = self.vector_store.similarity_search_by_vector(embedding, k=k)
             results = []
             for doc in docs:
                 results.append({
@@ -201,20 +198,30 @@ class HistoryRAG:
                 return False
         return False
 
-    def get_context(self, query: str, provider: str, llm=None, k: int = 3) -> Optional[str]:
-        if provider == "ollama" and self.vector_store:
-            return self._get_context_with_faiss(query, k)
+    def get_context(self, query: str, provider: str, llm=None, k: int = 3,
+                    embedding: Optional[List[float]] = None) -> Optional[str]:
+        if has_vector_search(provider) and self.vector_store:
+            return self._get_context_with_faiss(query, k, embedding)
         else:
             return self._get_context_with_llm(query, llm, k)
 
-    def _get_context_with_faiss(self, query: str, k: int = 3) -> Optional[str]:
-        results = self.search(query, k=k)
-        if not results:
+    def _get_context_with_faiss(self, query: str, k: int = 3,
+                                embedding: Optional[List[float]] = None) -> Optional[str]:
+        # 相关度不够的历史不注入，相互重复的问答只保留一条
+        policy = RetrievalPolicy.from_dict(get_retrieval_policy("history", k))
+        try:
+            if embedding is None:
+                embedding = self.vector_store.embeddings.embed_query(query)
+            docs, _ = select_candidates(search_faiss(self.vector_store, embedding, policy.fetch_k), policy)
+        except Exception as e:
+            print(f"搜索失败: {str(e)}")
+            return None
+        if not docs:
             return None
 
         context_parts = []
-        for r in results:
-            context_parts.append(f"[历史对话 {r['conversation_id']}]\n{r['content']}")
+        for doc in docs:
+            context_parts.append(f"[历史对话 {doc.metadata.get('conversation_id')}]\n{doc.page_content}")
 
         return "以下是历史对话中与当前问题相关的内容：\n\n" + "\n\n".join(context_parts)
 
@@ -0,0 +1,111 @@
+import re
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+_TOKEN_PATTERN = re.compile(
+    r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+|[a-z0-9]+(?:[._-][a-z0-9]+)*"
+)
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+
+_STOPWORDS = {
+    "the", "a", "an", "of", "to", "in", "and", "or", "is", "are", "was", "were", "be",
+    "for", "on", "with", "as", "by", "at", "it", "this", "that", "what", "how",
+    "的", "了", "是", "在", "和", "与", "及", "或", "吗", "呢", "吧", "啊", "请", "什么", "怎么"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词。
+
+    英文和数字按单词切分；中日韩文字没有空格分隔，
+    因此连续文字段同时生成单字和相邻二字组合，兼顾召回和精度。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _CJK_PATTERN.match(token):
+            for i, char in enumerate(token):
+                if char not in _STOPWORDS:
+                    tokens.append(char)
+                if i + 1 < len(token):
+                    tokens.append(token[i:i + 2])
+        elif token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.avg_doc_length = 0.0
+
+    @classmethod
+    def from_texts(cls, texts, **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        index.build(texts)
+        return index
+
+    def build(self, texts):
+        postings = defaultdict(lambda: ([], []))
+        doc_lengths = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            counts = defaultdict(int)
+            for token in tokens:
+                counts[token] += 1
+            for token, tf in counts.items():
+                ids, tfs = postings[token]
+                ids.append(doc_id)
+                tfs.append(tf)
+
+        n_docs = len(doc_lengths)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if n_docs else 0.0
+        self.postings = {
+            token: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for token, (ids, tfs) in postings.items()
+        }
+        self.idf = {
+            token: math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            for token, (ids, _) in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self), dtype=np.float32)
+        if not len(self):
+            return scores
+
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-6))
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            scores[ids] += self.idf[token] * tfs * (self.k1 + 1) / (tfs + norm[ids])
+        return scores
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        n_hits = int(np.count_nonzero(scores))
+        if n_hits == 0:
+            return []
+
+        k = min(k, n_hits)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
@@ -0,0 +1,120 @@
+from dataclasses import dataclass, field
+from typing import Iterable, List
+
+import numpy as np
+
+from storage.chunk_store import ChunkStore, NO_START
+
+
+@dataclass
+class Section:
+    start: int
+    end: int
+    text: str
+    hits: List[int] = field(default_factory=list)
+    tokens: int = 0
+    heading: str = ""
+
+
+class ParentChildIndex:
+    """两级文档索引。
+
+    子块（ChunkStore 中的块）用于精确匹配；相邻子块按页和章节聚合成不超过
+    parent_size 个 token 的父段落，每个子块所属父段落的范围在构建时预先算好。
+    检索命中的子块被映射到父段落，去重并合并相邻段落后按原文拼接返回。
+    """
+
+    def __init__(self, chunks: ChunkStore, parent_size: int = 1200):
+        self.chunks = chunks
+        self.parent_size = parent_size
+        self.parent_of = np.zeros(len(chunks), dtype=np.int32)
+        self.parent_start = np.zeros(0, dtype=np.int32)
+        self.parent_end = np.zeros(0, dtype=np.int32)
+        self._build()
+
+    def _build(self):
+        chunks = self.chunks
+        starts, ends = [], []
+        current_start = 0
+        current_size = 0
+
+        for i in range(len(chunks)):
+            size = int(chunks.token_count[i])
+            new_page = i > 0 and self._boundary(i)
+            if i > current_start and (new_page or current_size + size > self.parent_size):
+                starts.append(current_start)
+                ends.append(i)
+                current_start = i
+                current_size = 0
+            self.parent_of[i] = len(starts)
+            current_size += size
+
+        if len(chunks):
+            starts.append(current_start)
+            ends.append(len(chunks))
+
+        self.parent_start = np.asarray(starts, dtype=np.int32)
+        self.parent_end = np.asarray(ends, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.parent_start)
+
+    def _boundary(self, i: int) -> bool:
+        chunks = self.chunks
+        return chunks.page[i] != chunks.page[i - 1] or chunks.section[i] != chunks.section[i - 1]
+
+    def window(self, chunk_id: int):
+        parent = self.parent_of[chunk_id]
+        return int(self.parent_start[parent]), int(self.parent_end[parent])
+
+    def merged_text(self, start: int, end: int) -> str:
+        chunks = self.chunks
+        parts = []
+        prev_end = None
+        for i in range(start, end):
+            text = chunks.text(i)
+            chunk_start = int(chunks.start[i])
+            piece = text
+            if i > start:
+                if self._boundary(i):
+                    parts.append("\n\n")
+                elif prev_end is not None and chunk_start != NO_START and prev_end > chunk_start:
+                    piece = text[prev_end - chunk_start:]
+                else:
+                    parts.append("\n")
+            parts.append(piece)
+            prev_end = chunk_start + len(text) if chunk_start != NO_START else None
+        return "".join(parts)
+
+    def expand(self, chunk_ids: Iterable[int]) -> List[Section]:
+        """把命中的子块映射为父段落：按命中顺序去重，相邻段落合并。"""
+        parents = []
+        hits = {}
+        for chunk_id in chunk_ids:
+            if chunk_id < 0 or chunk_id >= len(self.parent_of):
+                continue
+            parent = int(self.parent_of[chunk_id])
+            if parent not in hits:
+                parents.append(parent)
+                hits[parent] = []
+            hits[parent].append(int(chunk_id))
+
+        groups = []
+        for parent in sorted(parents):
+            if groups and groups[-1][-1] + 1 == parent:
+                groups[-1].append(parent)
+            else:
+                groups.append([parent])
+
+        rank = {parent: i for i, parent in enumerate(parents)}
+        groups.sort(key=lambda group: min(rank[p] for p in group))
+
+        sections = []
+        for group in groups:
+            start = int(self.parent_start[group[0]])
+            end = int(self.parent_end[group[-1]])
+            group_hits = [chunk_id for p in group for chunk_id in hits[p]]
+            tokens = int(self.chunks.token_count[start:end].sum())
+            heading = " > ".join(self.chunks.heading_path(start))
+            sections.append(Section(start, end, self.merged_text(start, end), group_hits, tokens, heading))
+        return sections
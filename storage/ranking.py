@@ -0,0 +1,137 @@
+from dataclasses import dataclass, fields
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from storage.keyword_index import tokenize
+
+
+@dataclass
+class RetrievalPolicy:
+    """自适应检索参数。
+
+    先取 fetch_k 个候选，丢弃相似度低于 min_score 或比第一名低 max_drop（比例）以上的候选，
+    再用 MMR 从剩余候选中选出至多 k 个；mmr_lambda 越小越偏向多样性，1.0 表示只按相关度排序。
+    与已选结果相似度达到 max_similarity 的候选视为重复，直接跳过。
+    候选都被阈值淘汰时仍保留前 min_k 个。
+    """
+    k: int = 8
+    min_k: int = 1
+    fetch_k: int = 24
+    min_score: float = 0.0
+    max_drop: float = 1.0
+    mmr_lambda: float = 1.0
+    max_similarity: float = 0.95
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RetrievalPolicy":
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names})
+
+
+@dataclass
+class Candidate:
+    document: Document
+    score: float
+    vector: Optional[np.ndarray] = None
+
+
+def cut_by_score(candidates: List[Candidate], policy: RetrievalPolicy) -> List[Candidate]:
+    candidates = sorted(candidates, key=lambda c: c.score, reverse=True)
+    if not candidates:
+        return []
+    floor = max(policy.min_score, candidates[0].score * (1 - policy.max_drop))
+    kept = [c for c in candidates if c.score >= floor]
+    return kept if len(kept) >= policy.min_k else candidates[:policy.min_k]
+
+
+def _vector_similarity(candidates: List[Candidate]) -> np.ndarray:
+    vectors = np.asarray([c.vector for c in candidates], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.maximum(norms, 1e-12)
+    return vectors @ vectors.T
+
+
+def _token_similarity(candidates: List[Candidate]) -> np.ndarray:
+    token_sets = [set(tokenize(c.document.page_content)) for c in candidates]
+    n = len(token_sets)
+    similarity = np.eye(n, dtype=np.float32)
+    for i in range(n):
+        for j in range(i + 1, n):
+            union = len(token_sets[i] | token_sets[j])
+            similarity[i, j] = similarity[j, i] = len(token_sets[i] & token_sets[j]) / union if union else 0.0
+    return similarity
+
+
+def mmr(candidates: List[Candidate], k: int, mmr_lambda: float, max_similarity: float = 1.0) -> List[Candidate]:
+    """最大边际相关：每次选相关度与“和已选结果的最大相似度”加权差最大的候选。
+
+    候选带向量时用余弦相似度，否则用词集合的 Jaccard 相似度。
+    """
+    if len(candidates) <= 1:
+        return candidates[:k]
+
+    if all(c.vector is not None for c in candidates):
+        similarity = _vector_similarity(candidates)
+    else:
+        similarity = _token_similarity(candidates)
+
+    scores = np.asarray([c.score for c in candidates], dtype=np.float32)
+    selected = [0]
+    remaining = list(range(1, len(candidates)))
+    while remaining and len(selected) < k:
+        redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        remaining = [i for i, r in zip(remaining, redundancy) if r < max_similarity]
+        redundancy = redundancy[redundancy < max_similarity]
+        if not remaining:
+            break
+        values = mmr_lambda * scores[remaining] - (1 - mmr_lambda) * redundancy
+        selected.append(remaining.pop(int(np.argmax(values))))
+    return [candidates[i] for i in selected]
+
+
+def select_candidates(
+    candidates: List[Candidate],
+    policy: RetrievalPolicy
+) -> Tuple[List[Document], dict]:
+    kept = cut_by_score(candidates, policy)
+    chosen = mmr(kept, policy.k, policy.mmr_lambda, policy.max_similarity)
+    stats = {
+        "candidates": len(candidates),
+        "above_threshold": len(kept),
+        "selected": len(chosen),
+        "top_score": round(float(kept[0].score), 3) if kept else 0.0,
+    }
+    documents = []
+    for candidate in chosen:
+        candidate.document.metadata["score"] = float(candidate.score)
+        documents.append(candidate.document)
+    return documents, stats
+
+
+def search_faiss(
+    vector_store,
+    embedding: List[float],
+    fetch_k: int,
+    filter: Optional[Callable[[dict], bool]] = None
+) -> List[Candidate]:
+    """直接查询 FAISS 索引，返回带余弦相似度和原始向量的候选，供阈值过滤和 MMR 使用。"""
+    index = vector_store.index
+    if index.ntotal == 0:
+        return []
+    query = np.asarray(embedding, dtype=np.float32)
+    query_norm = max(float(np.linalg.norm(query)), 1e-12)
+    _, positions = index.search(query.reshape(1, -1), min(fetch_k, index.ntotal))
+
+    candidates = []
+    for position in positions[0]:
+        if position < 0:
+            continue
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[int(position)])
+        if not isinstance(doc, Document) or (filter and not filter(doc.metadata)):
+            continue
+        vector = index.reconstruct(int(position))
+        score = float(vector @ query) / (max(float(np.linalg.norm(vector)), 1e-12) * query_norm)
+        candidates.append(Candidate(Document(page_content=doc.page_content, metadata=dict(doc.metadata)), score, vector))
+    return candidates
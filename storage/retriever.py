@@ -1,11 +1,29 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Collection, List, Optional
+
+import numpy as np
 from langchain_core.documents import Document
 
+from config.context import get_profile_chunk_config
+from storage.keyword_index import BM25Index
+from storage.parent_index import ParentChildIndex
+from storage.ranking import Candidate, RetrievalPolicy, search_faiss, select_candidates
+
+# 问题点名章节时，该章节内候选的相似度加分
+SECTION_BOOST = 0.1
+
 
 class DocumentRetriever(ABC):
     @abstractmethod
-    def retrieve(self, query: str, k: int) -> List[Document]:
+    def retrieve(self, query: str, k: int, sections: Optional[Collection[int]] = None,
+                 embedding: Optional[List[float]] = None) -> List[Document]:
+        """sections 不为空时只返回属于这些章节的块；embedding 是预先算好的问题向量，向量检索时直接使用。"""
+        pass
+
+    @abstractmethod
+    def search(self, query: str, fetch_k: int, sections: Optional[Collection[int]] = None,
+               embedding: Optional[List[float]] = None) -> List[Candidate]:
+        """返回带相似度的候选（分数越高越相关），供自适应检索筛选。"""
         pass
 
     @abstractmethod
@@ -14,33 +32,138 @@ class DocumentRetriever(ABC):
 
 
 class FAISSRetriever(DocumentRetriever):
-    def __init__(self, vector_store, chunks: List[Document]):
+    def __init__(self, vector_store, chunks):
         self.vector_store = vector_store
         self.chunks = chunks
 
-    def retrieve(self, query: str, k: int) -> List[Document]:
-        return self.vector_store.similarity_search(query, k=k)
+    def _embed(self, query: str, embedding: Optional[List[float]]) -> List[float]:
+        return embedding if embedding is not None else self.vector_store.embeddings.embed_query(query)
+
+    def retrieve(self, query: str, k: int, sections: Optional[Collection[int]] = None,
+                 embedding: Optional[List[float]] = None) -> List[Document]:
+        embedding = self._embed(query, embedding)
+        if not sections:
+            return self.vector_store.similarity_search_by_vector(embedding, k=k)
+        sections = set(sections)
+        section_mask = np.isin(self.chunks.section, list(sections))
+        return self.vector_store.similarity_search_by_vector(
+            embedding,
+            k=k,
+            filter=lambda metadata: metadata.get("section") in sections,
+            fetch_k=min(len(self.chunks), max(k * 10, int(section_mask.sum()) * 2))
+        )
+
+    def search(self, query: str, fetch_k: int, sections: Optional[Collection[int]] = None,
+               embedding: Optional[List[float]] = None) -> List[Candidate]:
+        embedding = self._embed(query, embedding)
+        if not sections:
+            return search_faiss(self.vector_store, embedding, fetch_k)
+        sections = set(sections)
+        section_size = int(np.isin(self.chunks.section, list(sections)).sum())
+        candidates = search_faiss(
+            self.vector_store,
+            embedding,
+            min(len(self.chunks), max(fetch_k * 4, section_size * 2)),
+            filter=lambda metadata: metadata.get("section") in sections
+        )
+        return candidates[:fetch_k]
 
     def get_chunks_count(self) -> int:
         return len(self.chunks)
 
 
-class DirectChunkRetriever(DocumentRetriever):
-    def __init__(self, chunks: List[Document]):
+class BM25Retriever(DocumentRetriever):
+    def __init__(self, index: BM25Index, chunks):
+        self.index = index
         self.chunks = chunks
 
-    def retrieve(self, query: str, k: int) -> List[Document]:
-        return self.chunks[:k]
+    def retrieve(self, query: str, k: int, sections: Optional[Collection[int]] = None,
+                 embedding: Optional[List[float]] = None) -> List[Document]:
+        mask = np.isin(self.chunks.section, list(sections)) if sections else None
+        docs = []
+        for chunk_id, score in self.index.search(query, k, mask):
+            doc = self.chunks.document(chunk_id)
+            doc.metadata["score"] = score
+            docs.append(doc)
+        return docs
+
+    def search(self, query: str, fetch_k: int, sections: Optional[Collection[int]] = None,
+               embedding: Optional[List[float]] = None) -> List[Candidate]:
+        mask = np.isin(self.chunks.section, list(sections)) if sections else None
+        hits = self.index.search(query, fetch_k, mask)
+        if not hits:
+            return []
+        # BM25 分数没有上界，按第一名归一化，只有相对高低有意义
+        top = hits[0][1]
+        return [Candidate(self.chunks.document(chunk_id), score / top) for chunk_id, score in hits]
 
     def get_chunks_count(self) -> int:
         return len(self.chunks)
 
 
+def retrieve_adaptive(
+    retriever: DocumentRetriever,
+    query: str,
+    policy: RetrievalPolicy,
+    sections: Optional[Collection[int]] = None,
+    embedding: Optional[List[float]] = None
+) -> tuple:
+    """按相似度阈值、相对降幅和 MMR 决定返回多少块，返回 (文档列表, 统计)。
+
+    sections 不为空时这些章节内的候选额外加分，其余候选照常参与排序。
+    """
+    candidates = retriever.search(query, policy.fetch_k, embedding=embedding)
+    if sections:
+        boosted = retriever.search(query, policy.fetch_k, sections, embedding)
+        boosted_ids = {c.document.metadata.get("chunk_index") for c in boosted}
+        for candidate in boosted:
+            candidate.score += SECTION_BOOST
+        candidates = boosted + [c for c in candidates if c.document.metadata.get("chunk_index") not in boosted_ids]
+    return select_candidates(candidates, policy)
+
+
+def retrieve_with_sections(
+    retriever: DocumentRetriever,
+    query: str,
+    k: int,
+    sections: Optional[Collection[int]] = None,
+    embedding: Optional[List[float]] = None
+) -> List[Document]:
+    """章节优先检索：先取指定章节内的块，不足 k 个时用全文检索结果补足。"""
+    if not sections:
+        return retriever.retrieve(query, k=k, embedding=embedding)
+    docs = retriever.retrieve(query, k=k, sections=sections, embedding=embedding)
+    if len(docs) < k:
+        seen = {doc.metadata.get("chunk_index") for doc in docs}
+        for doc in retriever.retrieve(query, k=k, embedding=embedding):
+            if doc.metadata.get("chunk_index") not in seen:
+                docs.append(doc)
+            if len(docs) >= k:
+                break
+    return docs
+
+
+def build_keyword_index(chunks) -> BM25Index:
+    return BM25Index.from_texts(chunks.text(i) for i in range(len(chunks)))
+
+
+def get_parent_index(conversation) -> Optional[ParentChildIndex]:
+    if not conversation or not conversation.document_chunks:
+        return None
+    if conversation.parent_index is None:
+        profile = conversation.chunk_profile or "medium"
+        parent_size = get_profile_chunk_config(profile)["parent_size"]
+        conversation.parent_index = ParentChildIndex(conversation.document_chunks, parent_size)
+    return conversation.parent_index
+
+
 def create_retriever(conversation, provider: str) -> Optional[DocumentRetriever]:
     if not conversation or not conversation.document_chunks:
         return None
 
-    if provider == "ollama" and conversation.vector_store:
+    if conversation.vector_store:
         return FAISSRetriever(conversation.vector_store, conversation.document_chunks)
-    else:
-        return DirectChunkRetriever(conversation.document_chunks)
+
+    if conversation.keyword_index is None:
+        conversation.keyword_index = build_keyword_index(conversation.document_chunks)
+    return BM25Retriever(conversation.keyword_index, conversation.document_chunks)
@@ -25,7 +25,7 @@ def get_document_outline() -> str:
     """获取文档结构大纲。
 
     当用户询问文档结构、目录、章节组织时调用此工具。
-    返回文档各部分的采样预览。
+    返回文档目录（各级标题及所在块范围），文档没有标题时返回各部分的采样预览。
     """
     resource = ResourceRegistry.get("document")
     if not resource or not resource.is_available():
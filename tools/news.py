@@ -1,9 +1,12 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from langchain_core.tools import tool
 import httpx
 from datetime import datetime, timedelta
 
 
+NewsType = Literal["头条", "社会", "国内", "国际", "娱乐", "体育", "科技", "财经"]
+
+
 class NewsToolKit:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or ""
@@ -172,7 +175,7 @@ def get_headlines(page_size: int = 10) -> str:
 
 
 @tool
-def get_news_by_type(news_type: str, page_size: int = 10) -> str:
+def get_news_by_type(news_type: NewsType, page_size: int = 10) -> str:
     """按类型获取新闻
     
     Args:
@@ -1,48 +1,56 @@
 import asyncio
 
 
-async def generate_answer(query, model_name=None, mode="qa"):
+async def generate_answer(session):
     from agent import stream_graph
     from core import state
+    from core.cancel import is_cancelled
     from utils.conversation import auto_name_conversation
-    
+
+    query, model_name, mode = session.query, session.model_name, session.mode
     try:
-        conversation = state.get_current_conversation()
-        
+        conversation = state.conversations.get(session.conversation_id)
+        if conversation is None:
+            raise ValueError("对话不存在")
+
         if model_name is None:
             model_name = "qwen3.5:4b"
-        
+
         print(f"开始生成回答，模型: {model_name}，模式: {mode} (LangGraph工作流)")
-        
+
         conversation.add_message("user", query)
-        
+
         images = conversation.images
-        
+
         full_response = ""
-        
-        for chunk in stream_graph(query, model_name, images, mode):
-            if state.should_stop:
+
+        for chunk in stream_graph(query, model_name, images, mode, conversation.id):
+            if session.should_stop:
                 full_response += "\n\n操作已中断"
-                state.response_queue.put(("chunk", "\n\n操作已中断"))
+                session.put("chunk", "\n\n操作已中断")
                 break
-            
+
             full_response += chunk
-            state.response_queue.put(("chunk", chunk))
-        
-        if not state.should_stop:
+            session.put("chunk", chunk)
+
+        if not session.should_stop:
             conversation.add_message("assistant", full_response)
-            state.persist_message("user", query)
-            state.persist_message("assistant", full_response)
+            state.persist_message("user", query, conversation_id=conversation.id)
+            state.persist_message("assistant", full_response, conversation_id=conversation.id)
             auto_name_conversation(conversation)
-            state.response_queue.put(("done", ""))
+            session.put("done", "")
         else:
-            state.response_queue.put(("error", "操作已中断"))
+            session.put("error", "操作已中断")
 
     except Exception as e:
+        if is_cancelled():
+            # 取消时进行中的模型请求被直接断开，读取端抛出的连接错误属于正常中断
+            print(f"生成已中断: {type(e).__name__}")
+            session.put("chunk", "\n\n操作已中断")
+            session.put("error", "操作已中断")
+            return
         print(f"生成回答失败: {str(e)}")
         import traceback
         traceback.print_exc()
-        state.response_queue.put(("error", f"生成失败：{str(e)}"))
-    finally:
-        state.is_generating = False
-        state.should_stop = False
+        session.error = str(e)
+        session.put("error", f"生成失败：{str(e)}")